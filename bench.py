@@ -0,0 +1,97 @@
+import math
+import re
+import sys
+import timeit
+
+import comparison
+from catalog import build_catalog_index
+from dimensions import _parse_cached, evaluate, parse_dimension
+from quotes import clear_quote_cache
+
+# ============================
+#   МИКРОБЕНЧМАРКИ
+# ============================
+
+# Запуск: python bench.py [название ...]  (без аргументов — все)
+
+SIZE_INPUTS = ["3.2", "2,7", "3200", "1.2 + 3.4", "(2.5-0.3)*2", "320 см", "2м + 50см"]
+
+def _legacy_parse_size(text: str, unit: str) -> float:
+    # Прежний parse_size() на eval — для сравнения
+    try:
+        allowed_names = {"__builtins__": {}, "math": math}
+        expr = re.sub(r'[^\d\s+\-*/().]', '', text.strip())
+        num = eval(expr, allowed_names) if expr else float(text.strip())
+        return num / 1000 if unit == "mm" else num
+    except:
+        return 0.0
+
+def _report(name: str, func, number: int):
+    best = min(timeit.repeat(func, number=number, repeat=5))
+    print(f"{name:<40} {best / number * 1e6:8.2f} us/op")
+
+def bench_dimensions():
+    def legacy():
+        for text in SIZE_INPUTS:
+            _legacy_parse_size(text, "m")
+
+    def cold():
+        for text in SIZE_INPUTS:
+            evaluate(text, "m")
+
+    def warm():
+        for text in SIZE_INPUTS:
+            parse_dimension(text, "m")
+
+    _parse_cached.cache_clear()
+    _report(f"parse_size eval x{len(SIZE_INPUTS)}", legacy, 2000)
+    _report(f"dimensions.evaluate x{len(SIZE_INPUTS)}", cold, 2000)
+    _report(f"dimensions.parse_dimension (LRU) x{len(SIZE_INPUTS)}", warm, 20000)
+
+def _synthetic_catalog(n_products: int):
+    # n_products × 2 толщины × 5 длин SKU стеновых панелей
+    wall_products, codes = {}, {}
+    for p in range(n_products):
+        title = f"Панель {p}"
+        codes[f"p{p}"] = title
+        wall_products[title] = {
+            thick: {
+                "width_mm": 1220,
+                "weight_per_m2": 4.0 + thick / 2 + p % 7 / 10,
+                "panels": {
+                    length: {"area_m2": round(length * 1.22 / 1000, 3), "price_rub": 9000 + 37 * p + length}
+                    for length in (2440, 2600, 2800, 3000, 3200)
+                },
+            }
+            for thick in (5, 8)
+        }
+    return build_catalog_index(wall_products, codes, {}, {}, {})
+
+def bench_compare():
+    # Строка numpy — только если NumPy действительно установлен, иначе compare_walls()
+    # сам уходит в Python-вариант, и его время нельзя выдавать за NumPy
+    np = comparison._numpy()
+    if np is None:
+        print("NumPy is not installed: only the Python fallback is measured")
+    for n_products in (4, 100, 500, 1000):
+        catalog = _synthetic_catalog(n_products)
+        skus = len(catalog.walls)
+        if np is not None:
+            comparison.compare_walls(catalog, 3.2, 2.7, 1.5)  # массивы строятся один раз на версию каталога
+            _report(f"compare_walls numpy {np.__version__}, {skus} SKU", lambda: comparison.compare_walls(catalog, 3.2, 2.7, 1.5), 200)
+        if skus <= 1000:
+            comparison.np = None
+            try:
+                _report(f"compare_walls python, {skus} SKU", lambda: (clear_quote_cache(), comparison.compare_walls(catalog, 3.2, 2.7, 1.5)), 5)
+            finally:
+                comparison.np = np
+
+BENCHMARKS = {
+    "dimensions": bench_dimensions,
+    "compare": bench_compare,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
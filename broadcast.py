@@ -0,0 +1,279 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError, TimedOut
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   РАССЫЛКА
+# ============================
+
+# Рассылка всем пользователям из stats_store.users. Отправляют workers корутин,
+# общий темп держит TokenBucket (лимит Telegram ~30 сообщений/с на бота);
+# в один чат за рассылку уходит одно сообщение, так что лимит 1/с на чат
+# соблюдается сам собой. RetryAfter ставит на паузу весь bucket, а сообщение
+# отправляется повторно. Заблокировавшие бота (Forbidden, "chat not found")
+# удаляются из статистики (пачкой, при каждом отчёте о прогрессе).
+#
+# Id обходятся по возрастанию; в чекпоинт пишется cursor — id, до которого
+# включительно всё обработано. После рестарта рассылка продолжается с cursor,
+# повторно могут уйти только сообщения, которые были «в полёте» (не больше workers).
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class Broadcaster:
+    def __init__(self, bot, store, state_file, rate=25, workers=16, max_attempts=3, progress_every=3.0, on_progress=None):
+        self.bot = bot
+        self.store = store
+        self.state_file = state_file
+        self.rate = rate
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.progress_every = progress_every
+        self.on_progress = on_progress  # async (state, final) -> None
+        self.state = None
+        self.bucket = TokenBucket(rate)
+        self._task = None
+        self._pruned = []
+        self._ids = []
+        self._next = 0
+        self._done = bytearray()
+        self._done_upto = 0
+        self._started = 0.0
+        self._processed_at_start = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _save(self):
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.error(f"Failed to save broadcast checkpoint: {e}")
+
+    def _clear(self):
+        try:
+            os.remove(self.state_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.error(f"Failed to remove broadcast checkpoint: {e}")
+
+    async def start(self, text: str, admin_chat_id: int, status_message_id: int) -> bool:
+        if self.running:
+            return False
+        self.state = {
+            "text": text,
+            "admin_chat_id": admin_chat_id,
+            "status_message_id": status_message_id,
+            "cursor": None,
+            "total": len(self.store.users),
+            "counters": {"sent": 0, "pruned": 0, "failed": 0, "retry_after": 0},
+            "started_at": time.time(),
+            "cancelled": False,
+        }
+        self._save()
+        self._task = asyncio.create_task(self._run(), name="broadcast")
+        return True
+
+    def resume(self) -> bool:
+        # Вызывается при старте: если есть незавершённая рассылка — продолжить
+        if self.running or not os.path.exists(self.state_file):
+            return False
+        try:
+            with open(self.state_file) as f:
+                self.state = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Broken broadcast checkpoint, dropping it: {e}")
+            self._clear()
+            return False
+        logger.info(f"Resuming broadcast after id {self.state['cursor']}: {self.state['counters']}")
+        self._task = asyncio.create_task(self._run(), name="broadcast")
+        return True
+
+    def processed(self) -> int:
+        return sum(self.state["counters"].values()) - self.state["counters"]["retry_after"]
+
+    def progress(self) -> dict:
+        elapsed = time.monotonic() - self._started
+        done_now = self.processed() - self._processed_at_start
+        rate = done_now / elapsed if elapsed > 0 else 0.0
+        left = max(0, self.state["total"] - self.processed())
+        return {
+            **self.state["counters"],
+            "processed": self.processed(),
+            "total": self.state["total"],
+            "rate": rate,
+            "eta_sec": left / rate if rate > 0 else None,
+            "cancelled": self.state["cancelled"],
+        }
+
+    async def _deliver(self, chat_id: int):
+        counters = self.state["counters"]
+        attempts = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id, self.state["text"])
+                counters["sent"] += 1
+                return
+            except RetryAfter as e:
+                counters["retry_after"] += 1
+                self.bucket.pause(float(e.retry_after))
+                logger.warning(f"Broadcast flood control: pausing {e.retry_after}s")
+            except Forbidden:
+                self._prune(chat_id)
+                return
+            except BadRequest as e:
+                if "chat not found" in str(e).lower():
+                    self._prune(chat_id)
+                else:
+                    counters["failed"] += 1
+                    logger.warning(f"Broadcast to {chat_id} rejected: {e}")
+                return
+            except (TimedOut, NetworkError) as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    counters["failed"] += 1
+                    logger.warning(f"Broadcast to {chat_id} failed after {attempts} attempts: {e}")
+                    return
+                await asyncio.sleep(2 ** attempts)
+            except TelegramError as e:
+                counters["failed"] += 1
+                logger.warning(f"Broadcast to {chat_id} failed: {e}")
+                return
+
+    def _prune(self, chat_id: int):
+        self.state["counters"]["pruned"] += 1
+        self._pruned.append(chat_id)
+
+    def _flush_pruned(self):
+        # Из статистики удаляем пачкой: одна перестройка массива id вместо одной на каждого
+        if self._pruned:
+            pruned, self._pruned = self._pruned, []
+            self.store.remove_users(pruned)
+
+    def _mark(self, index: int):
+        # Сдвигаем cursor до первого ещё не обработанного id
+        self._done[index] = 1
+        while self._done_upto < len(self._ids) and self._done[self._done_upto]:
+            self._done_upto += 1
+        if self._done_upto:
+            self.state["cursor"] = self._ids[self._done_upto - 1]
+
+    async def _worker(self):
+        while self._next < len(self._ids) and not self.state["cancelled"]:
+            index = self._next
+            self._next += 1
+            await self._deliver(self._ids[index])
+            self._mark(index)
+
+    async def _report(self, final=False):
+        self._flush_pruned()
+        self._save()
+        if self.on_progress is not None:
+            try:
+                await self.on_progress(self.progress(), final)
+            except Exception as e:
+                logger.warning(f"Broadcast progress report failed: {e}")
+
+    async def _reporter(self):
+        while True:
+            await asyncio.sleep(self.progress_every)
+            await self._report()
+
+    async def _run(self):
+        cursor = self.state["cursor"]
+        self._ids = [chat_id for chat_id in self.store.users if cursor is None or chat_id > cursor]
+        self._next = 0
+        self._done = bytearray(len(self._ids))
+        self._done_upto = 0
+        self.state["total"] = self.processed() + len(self._ids)
+        self._processed_at_start = self.processed()
+        self._started = time.monotonic()
+        self.bucket = TokenBucket(self.rate)
+        reporter = asyncio.create_task(self._reporter())
+        try:
+            await asyncio.gather(*(self._worker() for _ in range(min(self.workers, len(self._ids)) or 1)))
+        except asyncio.CancelledError:
+            # Остановка процесса: чекпоинт остаётся, после рестарта продолжим
+            reporter.cancel()
+            self._flush_pruned()
+            self._save()
+            raise
+        reporter.cancel()
+        await self._report(final=True)
+        logger.info(f"Broadcast finished: {self.progress()}")
+        self._clear()
+
+    def cancel(self) -> bool:
+        # Остановка администратором: разосланное не откатываем, новые не отправляем
+        if not self.running:
+            return False
+        self.state["cancelled"] = True
+        return True
+
+    async def stop(self):
+        if self.running:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+def _duration(seconds) -> str:
+    if seconds is None:
+        return "—"
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds} с"
+    if seconds < 3600:
+        return f"{seconds // 60} мин {seconds % 60} с"
+    return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+
+def progress_text(p: dict, final: bool) -> str:
+    pct = p["processed"] / p["total"] * 100 if p["total"] else 100.0
+    if final:
+        title = "⏹ Рассылка остановлена" if p["cancelled"] else "✅ Рассылка завершена"
+    else:
+        title = "📢 Идёт рассылка"
+    lines = [
+        f"{title}: {p['processed']}/{p['total']} ({pct:.0f}%)",
+        f"Доставлено: {p['sent']}, заблокировали бота: {p['pruned']}, ошибки: {p['failed']}",
+    ]
+    if not final:
+        lines.append(f"Скорость: {p['rate']:.1f} сообщ./с, осталось ~{_duration(p['eta_sec'])}")
+    if p["retry_after"]:
+        lines.append(f"Пауз по лимиту Telegram: {p['retry_after']}")
+    return "\n".join(lines)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+from bisect import bisect_left
+from types import MappingProxyType
+from typing import NamedTuple
+
+# ============================
+#   ИНДЕКС КАТАЛОГА
+# ============================
+
+# Вложенные словари каталога из main.py один раз при старте компилируются в
+# неизменяемые записи (NamedTuple, MappingProxyType) с прямым доступом по ключу,
+# отсортированными длинами и заранее посчитанными ценой за м² и весом панели.
+# version — хэш содержимого каталога, по нему сбрасываются кэши; индексы
+# сравниваются и хэшируются по version, так что индекс можно класть в ключ LRU.
+
+class WallSku(NamedTuple):
+    code: str
+    title: str
+    thickness: int
+    length_mm: int
+    width_mm: int
+    area_m2: float
+    price_rub: int
+    weight_per_m2: float
+    price_per_m2: float
+    panel_weight_kg: float
+
+class ProfileSku(NamedTuple):
+    thickness: int
+    name: str
+    price_rub: int
+
+class Panel3dSku(NamedTuple):
+    var: str
+    code: str
+    width_mm: int
+    height_mm: int
+    area_m2: float
+    price_rub: int
+
+class CatalogIndex(NamedTuple):
+    version: str
+    titles: dict           # code -> название
+    walls: dict            # (code, thickness, length_mm) -> WallSku
+    thicknesses: dict      # code -> (толщины по возрастанию)
+    lengths: dict          # (code, thickness) -> (длины, мм, по возрастанию)
+    lengths_m: dict        # (code, thickness) -> (длины, м, по возрастанию)
+    wall_specs: dict       # (code, thickness) -> (width_mm, weight_per_m2)
+    profiles: dict         # (thickness, name) -> ProfileSku
+    profile_types: dict    # thickness -> (названия в порядке каталога)
+    slat_prices: dict      # type -> руб./м.п.
+    panels_3d: dict        # var -> Panel3dSku
+
+    def __hash__(self):
+        return hash(self.version)
+
+    def __eq__(self, other):
+        return isinstance(other, CatalogIndex) and self.version == other.version
+
+    def __ne__(self, other):
+        return not self == other
+
+    def wall(self, code: str, thickness: int, length_mm: int) -> WallSku:
+        return self.walls[(code, thickness, length_mm)]
+
+    def suggest_length(self, code: str, thickness: int, height_m: float) -> tuple:
+        # Самая короткая панель не ниже стены; если таких нет — самая длинная.
+        # Возвращает (длина_мм, нашлась_ли_подходящая)
+        lengths = self.lengths[(code, thickness)]
+        i = bisect_left(self.lengths_m[(code, thickness)], height_m)
+        if i < len(lengths):
+            return lengths[i], True
+        return lengths[-1], False
+
+def _version(*sources) -> str:
+    raw = json.dumps(sources, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+def build_catalog_index(wall_products, product_codes, profiles, slat_prices, panels_3d) -> CatalogIndex:
+    walls = {}
+    thicknesses = {}
+    lengths = {}
+    lengths_m = {}
+    wall_specs = {}
+    for code, title in product_codes.items():
+        by_thickness = wall_products[title]
+        thicknesses[code] = tuple(sorted(by_thickness))
+        for thickness, spec in by_thickness.items():
+            width_mm = spec["width_mm"]
+            weight_per_m2 = spec.get("weight_per_m2")
+            wall_specs[(code, thickness)] = (width_mm, weight_per_m2)
+            sorted_lengths = tuple(sorted(spec["panels"]))
+            lengths[(code, thickness)] = sorted_lengths
+            lengths_m[(code, thickness)] = tuple(l / 1000.0 for l in sorted_lengths)
+            for length_mm, panel in spec["panels"].items():
+                area_m2 = panel["area_m2"]
+                price_rub = panel["price_rub"]
+                walls[(code, thickness, length_mm)] = WallSku(
+                    code=code,
+                    title=title,
+                    thickness=thickness,
+                    length_mm=length_mm,
+                    width_mm=width_mm,
+                    area_m2=area_m2,
+                    price_rub=price_rub,
+                    weight_per_m2=weight_per_m2,
+                    price_per_m2=price_rub / area_m2,
+                    panel_weight_kg=area_m2 * weight_per_m2 if weight_per_m2 else None,
+                )
+    profile_index = {}
+    profile_types = {}
+    for thickness, types in profiles.items():
+        profile_types[thickness] = tuple(types)
+        for name, price in types.items():
+            profile_index[(thickness, name)] = ProfileSku(thickness, name, price)
+    panels_3d_index = {
+        var: Panel3dSku(var, p["code"], p["width_mm"], p["height_mm"], p["area_m2"], p["price_rub"])
+        for var, p in panels_3d.items()
+    }
+    return CatalogIndex(
+        version=_version(wall_products, product_codes, profiles, slat_prices, panels_3d),
+        titles=MappingProxyType(dict(product_codes)),
+        walls=MappingProxyType(walls),
+        thicknesses=MappingProxyType(thicknesses),
+        lengths=MappingProxyType(lengths),
+        lengths_m=MappingProxyType(lengths_m),
+        wall_specs=MappingProxyType(wall_specs),
+        profiles=MappingProxyType(profile_index),
+        profile_types=MappingProxyType(profile_types),
+        slat_prices=MappingProxyType(dict(slat_prices)),
+        panels_3d=MappingProxyType(panels_3d_index),
+    )
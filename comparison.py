@@ -0,0 +1,170 @@
+import math
+from functools import lru_cache
+from typing import NamedTuple
+
+from quotes import quote_wall
+
+# NumPy импортируется при первом сравнении (или в preload() после старта),
+# а не при импорте модуля: это ~70 мс холодного старта.
+# Без NumPy считаем тем же quote_wall() в цикле
+np = None
+_numpy_loaded = False
+
+def _numpy():
+    global np, _numpy_loaded
+    if not _numpy_loaded:
+        _numpy_loaded = True
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+    return np
+
+# ============================
+#   СРАВНЕНИЕ ВСЕХ ПАНЕЛЕЙ
+# ============================
+
+# Для заданной стены считает панели, отходы, вес и стоимость сразу по всем SKU
+# стеновых панелей каталога и возвращает три рейтинга: дешевле, меньше отходов,
+# легче. Математика та же, что в quotes.quote_wall() в режиме стыковки
+# (ряды × панели в ряду, 10% запаса), но одной пачкой операций NumPy над
+# массивами, которые строятся один раз на версию каталога.
+
+class ComparedWall(NamedTuple):
+    code: str
+    title: str
+    thickness: int
+    length_mm: int
+    panels: int
+    waste_pct: float
+    weight_kg: float  # None, если вес панели неизвестен
+    cost: int
+
+class WallComparison(NamedTuple):
+    groups: tuple    # ((ширина_м, высота_м, к_вычету_м2), ...) — стены одной высоты
+    total: int       # сколько SKU сравнивали
+    by_cost: tuple
+    by_waste: tuple
+    by_weight: tuple
+
+class _WallArrays(NamedTuple):
+    skus: tuple
+    area: object
+    price: object
+    width_m: object
+    length_m: object
+    weight_per_m2: object  # nan, если вес неизвестен
+
+@lru_cache(maxsize=4)
+def wall_arrays(catalog) -> _WallArrays:
+    skus = tuple(catalog.walls.values())
+    return _WallArrays(
+        skus=skus,
+        area=np.array([s.area_m2 for s in skus], dtype=np.float64),
+        price=np.array([s.price_rub for s in skus], dtype=np.float64),
+        width_m=np.array([s.width_mm / 1000 for s in skus], dtype=np.float64),
+        length_m=np.array([s.length_mm / 1000 for s in skus], dtype=np.float64),
+        weight_per_m2=np.array([s.weight_per_m2 or np.nan for s in skus], dtype=np.float64),
+    )
+
+def _top(primary, secondary, top: int):
+    # Индексы top лучших по primary (при равенстве — по secondary), без полной сортировки
+    candidates = np.flatnonzero(~np.isnan(primary))
+    if len(candidates) > top:
+        kth = np.partition(primary[candidates], top - 1)[top - 1]
+        candidates = candidates[primary[candidates] <= kth]
+    order = np.lexsort((secondary[candidates], primary[candidates]))
+    return candidates[order[:top]]
+
+def _compare_numpy(catalog, groups, top):
+    a = wall_arrays(catalog)
+    panels = np.zeros(len(a.skus))
+    net_area = 0.0
+    for width_m, height_m, deduct_area_m2 in groups:
+        net = width_m * height_m - deduct_area_m2
+        num_rows = np.ceil(height_m / a.length_m)
+        num_cols = np.ceil(width_m / a.width_m)
+        panels += np.maximum(num_rows * num_cols, np.ceil(net * 1.1 / a.area))
+        net_area += net
+    total_area = panels * a.area
+    waste = total_area - net_area
+    waste_pct = np.divide(waste, total_area, out=np.zeros_like(total_area), where=total_area > 0) * 100
+    cost = panels * a.price
+    weight = total_area * a.weight_per_m2
+
+    def rows(indexes):
+        return tuple(
+            ComparedWall(
+                a.skus[i].code, a.skus[i].title, a.skus[i].thickness, a.skus[i].length_mm,
+                int(panels[i]), float(waste_pct[i]),
+                None if math.isnan(weight[i]) else float(weight[i]), int(cost[i]),
+            )
+            for i in indexes.tolist()
+        )
+
+    return len(a.skus), rows(_top(cost, waste_pct, top)), rows(_top(waste_pct, cost, top)), rows(_top(weight, cost, top))
+
+def _compare_python(catalog, groups, top):
+    results = []
+    for sku in catalog.walls.values():
+        quotes = [
+            quote_wall(catalog, sku.code, sku.thickness, sku.length_mm, w, h, d, False, sku.length_mm / 1000)
+            for w, h, d in groups
+        ]
+        if len(quotes) == 1:
+            q = quotes[0]
+            panels, waste_pct, weight, cost = q.panels, q.waste_pct, q.total_weight, q.cost
+        else:
+            panels = sum(q.panels for q in quotes)
+            total_area = panels * sku.area_m2
+            waste = total_area - sum(q.net_area for q in quotes)
+            waste_pct = (waste / total_area) * 100 if total_area > 0 else 0
+            weight = total_area * sku.weight_per_m2 if sku.weight_per_m2 else None
+            cost = panels * sku.price_rub
+        results.append(ComparedWall(sku.code, sku.title, sku.thickness, sku.length_mm, panels, waste_pct, weight, cost))
+    with_weight = [r for r in results if r.weight_kg is not None]
+    return (
+        len(results),
+        tuple(sorted(results, key=lambda r: (r.cost, r.waste_pct))[:top]),
+        tuple(sorted(results, key=lambda r: (r.waste_pct, r.cost))[:top]),
+        tuple(sorted(with_weight, key=lambda r: (r.weight_kg, r.cost))[:top]),
+    )
+
+def compare_room(catalog, groups, top: int = 5) -> WallComparison:
+    # groups: стены одной высоты — [(суммарная ширина_м, высота_м, к_вычету_м2), ...]
+    groups = tuple((float(w), float(h), float(d)) for w, h, d in groups)
+    compare = _compare_numpy if _numpy() is not None else _compare_python
+    total, by_cost, by_waste, by_weight = compare(catalog, groups, top)
+    return WallComparison(groups, total, by_cost, by_waste, by_weight)
+
+def preload(catalog):
+    # Прогрев после старта: импорт NumPy и массивы текущего каталога
+    if _numpy() is not None:
+        wall_arrays(catalog)
+
+def compare_walls(catalog, width_m: float, height_m: float, deduct_area_m2: float = 0.0, top: int = 5) -> WallComparison:
+    return compare_room(catalog, [(width_m, height_m, deduct_area_m2)], top)
+
+def _line(n: int, r: ComparedWall, extra: str) -> str:
+    return f"{n}. {r.title}, {r.thickness} мм, {r.length_mm} мм — {r.panels} шт., {extra}"
+
+def render_comparison(c: WallComparison) -> str:
+    if len(c.groups) == 1:
+        walls = [f"Стена: {w:.2f} м × {h:.2f} м, к вычету {d:.2f} м²" for w, h, d in c.groups]
+    else:
+        walls = [f"Стены высотой {h:.2f} м: общая длина {w:.2f} м, к вычету {d:.2f} м²" for w, h, d in c.groups]
+    lines = [
+        "📊 Сравнение стеновых панелей",
+        *walls,
+        f"Вариантов: {c.total} (расчёт со стыковкой панелей по высоте, запас 10%)",
+        "",
+        "💰 Дешевле всего:",
+    ]
+    lines += [_line(n, r, f"{r.cost:,} ₽, отходы {r.waste_pct:.1f}%") for n, r in enumerate(c.by_cost, 1)]
+    lines += ["", "♻️ Меньше всего отходов:"]
+    lines += [_line(n, r, f"отходы {r.waste_pct:.1f}%, {r.cost:,} ₽") for n, r in enumerate(c.by_waste, 1)]
+    if c.by_weight:
+        lines += ["", "🪶 Легче всего:"]
+        lines += [_line(n, r, f"{r.weight_kg:.1f} кг, {r.cost:,} ₽") for n, r in enumerate(c.by_weight, 1)]
+    return "\n".join(lines)
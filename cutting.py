@@ -0,0 +1,274 @@
+import math
+import time
+from collections import Counter
+from typing import NamedTuple
+
+# ============================
+#   ОПТИМИЗАЦИЯ РАСКРОЯ
+# ============================
+
+# Стены закрываются вертикальными полосами шириной в панель. Полоса выше самой
+# длинной панели собирается из нескольких кусков: целые панели одной длины +
+# добор сверху или равные куски (см. column_options).
+# Все куски всех стен раскладываются по панелям доступных длин (одномерный
+# раскрой с разными длинами заготовок): один и тот же кусок панели может пойти
+# на доборы разных рядов и стен. Ищем набор закупки минимальной стоимости
+# (или минимальных отходов) ветвями и границами по шаблонам раскроя; если
+# time_budget вышел — возвращаем лучший найденный план (optimal=False).
+# Если к 2 × time_budget нет даже начального плана (или на стену уходит
+# больше MAX_WALL_PIECES кусков), раскрой не считается: plan_walls возвращает
+# None, и остаётся обычный расчёт с запасом 10%.
+#
+# Проёмы (окна/двери) не вычитаются: полосы считаются на всю высоту стены.
+
+MAX_PATTERNS = 5000
+MIN_PIECE_MM = 300  # добор короче этого на стене не ставим
+MAX_SEARCH_PIECES = 400
+MAX_WALL_PIECES = 1000
+
+class Cut(NamedTuple):
+    stock_mm: int      # длина панели, из которой режем
+    pieces: tuple      # куски, мм
+    offcut_mm: int     # остаток
+    count: int         # сколько панелей режется так
+
+class CutPlan(NamedTuple):
+    purchase: tuple    # ((длина_мм, штук), ...) по возрастанию длины
+    cuts: tuple        # Cut, по убыванию числа панелей
+    panels: int
+    cost: int
+    waste_mm: int
+    waste_pct: float
+    optimal: bool      # перебор завершён, а не остановлен по времени
+    elapsed_ms: float
+
+def column_options(height_mm: int, lengths) -> list:
+    # Варианты набора полосы высотой height_mm из кусков не длиннее самой длинной
+    # панели: целые панели одной длины + добор сверху (не короче MIN_PIECE_MM),
+    # либо равные куски
+    longest = lengths[-1]
+    if height_mm <= longest:
+        return [(height_mm,)]
+    options = set()
+    for length in lengths:
+        full, rest = divmod(height_mm, length)
+        if 0 < rest < MIN_PIECE_MM:
+            continue
+        options.add((length,) * full + ((rest,) if rest else ()))
+    rows = math.ceil(height_mm / longest)
+    options.add((math.ceil(height_mm / rows),) * rows)
+    return sorted(options)
+
+def _wall_columns(walls, panel_width_mm: int) -> list:
+    # walls: [(ширина_м, высота_м), ...] -> [(полос, высота_мм), ...]
+    return [
+        (math.ceil(round(width_m * 1000) / panel_width_mm), math.ceil(round(height_m * 1000, 3)))
+        for width_m, height_m in walls
+    ]
+
+def _patterns(sizes, demand, stocks, kerf_mm, deadline):
+    # Максимальные шаблоны раскроя: (индекс заготовки, счётчики по размерам)
+    result = []
+    for j, (length, _) in enumerate(stocks):
+        counts = [0] * len(sizes)
+
+        def fill(i, free):
+            if len(result) >= MAX_PATTERNS or time.perf_counter() > deadline:
+                return
+            if i == len(sizes):
+                if any(counts) and all(free < sizes[k] + kerf_mm or counts[k] >= demand[k] for k in range(len(sizes))):
+                    result.append((j, tuple(counts)))
+                return
+            most = min(demand[i], (free + kerf_mm) // (sizes[i] + kerf_mm))
+            for n in range(most, -1, -1):
+                counts[i] = n
+                fill(i + 1, free - n * (sizes[i] + kerf_mm))
+            counts[i] = 0
+
+        fill(0, length)
+    return result
+
+def _first_fit(pieces, stocks, weights, kerf_mm, deadline=math.inf):
+    # Начальный план: куски по убыванию, каждый — в первую панель с местом,
+    # иначе новая панель самой выгодной длины, в которую он влезает.
+    # None, если не уложились до deadline
+    bins = []  # [индекс заготовки, свободно, [куски]]
+    for piece in sorted(pieces, reverse=True):
+        if time.perf_counter() > deadline:
+            return None
+        for b in bins:
+            if b[1] >= piece + (kerf_mm if b[2] else 0):
+                b[1] -= piece + (kerf_mm if b[2] else 0)
+                b[2].append(piece)
+                break
+        else:
+            j = min((j for j, (length, _) in enumerate(stocks) if length >= piece), key=lambda j: (weights[j], stocks[j][0]))
+            bins.append([j, stocks[j][0] - piece, [piece]])
+    return [(j, tuple(p)) for j, _, p in bins]
+
+def optimize_cuts(pieces, stocks, objective: str = "cost", kerf_mm: int = 0, time_budget: float = 0.05, deadline: float = math.inf):
+    # pieces: длины кусков, мм; stocks: [(длина_мм, цена_руб), ...]
+    # deadline (time.perf_counter()) — жёсткий предел: после него плана нет, None
+    started = time.perf_counter()
+    stocks = sorted(stocks)
+    if not pieces:
+        return CutPlan((), (), 0, 0, 0, 0.0, True, 0.0)
+    if max(pieces) > stocks[-1][0]:
+        raise ValueError(f"Piece {max(pieces)} mm is longer than any panel")
+    weights = [price if objective == "cost" else length for length, price in stocks]
+    sizes = sorted(set(pieces), reverse=True)
+    index = {s: i for i, s in enumerate(sizes)}
+    demand = [0] * len(sizes)
+    for piece in pieces:
+        demand[index[piece]] += 1
+
+    incumbent = _first_fit(pieces, stocks, weights, kerf_mm, deadline)
+    if incumbent is None:
+        return None
+    best = {"weight": sum(weights[j] for j, _ in incumbent), "plan": None}
+    optimal = True
+
+    if len(pieces) <= MAX_SEARCH_PIECES:
+        deadline = min(started + time_budget, deadline)
+        patterns = _patterns(sizes, demand, stocks, kerf_mm, deadline)
+        # Для каждого размера — шаблоны, где он есть, выгодные первыми
+        by_size = [
+            sorted(
+                (p for p in patterns if p[1][i]),
+                key=lambda p: weights[p[0]] / sum(c * s for c, s in zip(p[1], sizes)),
+            )
+            for i in range(len(sizes))
+        ]
+        unit_weight = min(w / length for w, (length, _) in zip(weights, stocks))
+        seen = {}
+
+        def search(left, weight, plan):
+            nonlocal optimal
+            if not optimal:
+                return
+            if time.perf_counter() > deadline:
+                optimal = False
+                return
+            rest = sum(c * s for c, s in zip(left, sizes))
+            if rest == 0:
+                if weight < best["weight"]:
+                    best["weight"], best["plan"] = weight, list(plan)
+                return
+            if weight + rest * unit_weight >= best["weight"]:
+                return
+            if seen.get(left, math.inf) <= weight:
+                return
+            seen[left] = weight
+            i = next(k for k, c in enumerate(left) if c)
+            tried = set()
+            for j, counts in by_size[i]:
+                used = tuple(min(c, l) for c, l in zip(counts, left))
+                if (j, used) in tried:
+                    continue
+                tried.add((j, used))
+                plan.append((j, used))
+                search(tuple(l - u for l, u in zip(left, used)), weight + weights[j], plan)
+                plan.pop()
+
+        search(tuple(demand), 0, [])
+
+    if best["plan"] is None:
+        bins = incumbent
+    else:
+        bins = [(j, tuple(s for s, c in zip(sizes, counts) for _ in range(c))) for j, counts in best["plan"]]
+
+    grouped = Counter((stocks[j][0], tuple(sorted(p, reverse=True))) for j, p in bins)
+    cuts = []
+    for (stock_mm, cut), count in grouped.most_common():
+        used = sum(cut) + kerf_mm * (len(cut) - 1)
+        cuts.append(Cut(stock_mm, cut, stock_mm - used, count))
+    purchase = Counter()
+    for cut in cuts:
+        purchase[cut.stock_mm] += cut.count
+    price = dict(stocks)
+    bought_mm = sum(length * n for length, n in purchase.items())
+    waste_mm = bought_mm - sum(pieces)
+    return CutPlan(
+        purchase=tuple(sorted(purchase.items())),
+        cuts=tuple(cuts),
+        panels=sum(purchase.values()),
+        cost=sum(price[length] * n for length, n in purchase.items()),
+        waste_mm=waste_mm,
+        waste_pct=waste_mm / bought_mm * 100,
+        optimal=optimal,
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
+def _score(plan: CutPlan, objective: str) -> tuple:
+    return (plan.cost, plan.waste_mm) if objective == "cost" else (plan.waste_mm, plan.cost)
+
+def plan_walls(catalog, code: str, thickness: int, walls, objective: str = "cost", kerf_mm: int = 0, time_budget: float = 0.05):
+    # Раскрой панелей одного типа и толщины (все длины из каталога) на набор стен.
+    # Для каждой стены выбирается разбивка полос по высоте: сначала лучшая для
+    # стены отдельно, затем пробуем общую для всех стен и берём лучший общий план.
+    # После time_budget новые варианты не пробуем; если и к 2 × time_budget нет
+    # ни одного плана — None (раскрой не считаем)
+    started = time.perf_counter()
+    soft_deadline = started + time_budget
+    deadline = started + 2 * time_budget
+    lengths = catalog.lengths[(code, thickness)]
+    width_mm, _ = catalog.wall_specs[(code, thickness)]
+    stocks = [(length, catalog.wall(code, thickness, length).price_rub) for length in lengths]
+    columns = _wall_columns(walls, width_mm)
+    if any(count * math.ceil(height_mm / lengths[-1]) > MAX_WALL_PIECES for count, height_mm in columns):
+        return None
+    options = [column_options(height_mm, lengths) for _, height_mm in columns]
+    budget = time_budget / (len(walls) + max(map(len, options), default=0) + 1)
+    complete = True
+
+    def solve(choice):
+        pieces = [piece for (count, _), column in zip(columns, choice) for piece in column * count]
+        return optimize_cuts(pieces, stocks, objective, kerf_mm, budget, deadline)
+
+    per_wall = []
+    for (count, _), wall_options in zip(columns, options):
+        best_option, best_score = wall_options[0], None
+        for option in wall_options if len(wall_options) > 1 else ():
+            plan = None
+            if time.perf_counter() < soft_deadline:
+                plan = optimize_cuts(list(option) * count, stocks, objective, kerf_mm, budget, deadline)
+            if plan is None:
+                complete = False
+                break
+            if best_score is None or _score(plan, objective) < best_score:
+                best_option, best_score = option, _score(plan, objective)
+        per_wall.append(best_option)
+    candidates = [tuple(per_wall)]
+    for k in range(max(map(len, options), default=0)):
+        choice = tuple(o[k] if k < len(o) else o[0] for o in options)
+        if choice not in candidates:
+            candidates.append(choice)
+    plans = []
+    for choice in candidates:
+        plan = solve(choice) if not plans or time.perf_counter() < soft_deadline else None
+        if plan is None:
+            complete = False
+            break
+        plans.append(plan)
+    if not plans:
+        return None
+    best = min(plans, key=lambda p: _score(p, objective))
+    return best._replace(
+        optimal=complete and all(p.optimal for p in plans),
+        elapsed_ms=(time.perf_counter() - started) * 1000,
+    )
+
+def render_cut_plan(plan: CutPlan) -> str:
+    if plan is None:
+        return "✂️ Раскрой не рассчитан (слишком большая стена), стоимость — с запасом 10%."
+    lines = ["✂️ Оптимальный раскрой (без учёта проёмов):"]
+    lines += [f"- {n} шт. × {length} мм" for length, n in plan.purchase]
+    lines.append(f"Итого: {plan.panels} панелей, {plan.cost:,} ₽, отходы {plan.waste_mm / 1000:.2f} м.п. ({plan.waste_pct:.1f}%)")
+    lines.append("Схема раскроя:")
+    for cut in plan.cuts:
+        pieces = " + ".join(str(p) for p in cut.pieces)
+        offcut = f", остаток {cut.offcut_mm}" if cut.offcut_mm else ""
+        lines.append(f"- {cut.count} × {cut.stock_mm} мм → {pieces}{offcut}")
+    if not plan.optimal:
+        lines.append("(перебор остановлен по времени, план может быть не самым выгодным)")
+    return "\n".join(lines)
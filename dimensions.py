@@ -0,0 +1,169 @@
+import math
+import re
+from functools import lru_cache
+
+# ============================
+#   РАЗБОР РАЗМЕРОВ
+# ============================
+
+# Размеры из сообщений пользователя: числа с точкой или запятой, + - * / и скобки,
+# единицы (мм, см, м и слова: "3.2 метра", "320 сантиметров") и пары вида
+# "3,2x2,7". Подряд идущие числа с единицами складываются: "3 м 20 см" = 3.2 м.
+# Вместо eval — свой разбор
+# с ограничениями на длину, число токенов и глубину скобок, поэтому ввод
+# вроде "9**9**9" просто не разбирается. Результаты кэшируются (LRU).
+#
+# Числа без суффикса считаются в единицах пользователя (unit), числа с суффиксом
+# переводятся в них же; итог возвращается в метрах, как раньше parse_size().
+
+MAX_LENGTH = 64
+MAX_TOKENS = 48
+MAX_DEPTH = 8
+
+# Сколько единиц в метре. Делим, а не умножаем на 0.001, чтобы 3200 мм давали ровно 3.2
+PER_METER = {"m": 1, "cm": 100, "mm": 1000}
+_UNITS = (
+    r"миллиметр(?:ов|а|ы)?|сантиметр(?:ов|а|ы)?|метр(?:ов|а|ы)?|мм|см|м"
+    r"|millimet(?:er|re)s?|centimet(?:er|re)s?|met(?:er|re)s?|mm|cm|m"
+)
+
+_TOKEN_RE = re.compile(rf"\s*(?:(\d+(?:[.,]\d*)?|[.,]\d+)\s*({_UNITS})?(?![а-яa-z])|([-+*/()]))", re.IGNORECASE)
+_PAIR_RE = re.compile(r"\s*[xх×]\s*(?=[\d.,(])", re.IGNORECASE)
+
+class DimensionError(ValueError):
+    pass
+
+def _unit(suffix: str) -> str:
+    suffix = suffix.lower()
+    if suffix.startswith(("мм", "милл", "mm", "mill")):
+        return "mm"
+    if suffix.startswith(("см", "сант", "cm", "cent")):
+        return "cm"
+    return "m"
+
+def _tokenize(text: str, per_meter: int) -> list:
+    tokens = []
+    pos = 0
+    prev_suffixed = False
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_RE.match(text, pos)
+        if not match or match.end() == pos:
+            raise DimensionError(f"unexpected input at {pos}")
+        number, suffix, op = match.groups()
+        if number is not None:
+            # Целые остаются int, как было с eval: "4000" -> 4000, а не 4000.0
+            value = int(number) if number.isdigit() else float(number.replace(",", "."))
+            if suffix:
+                value = value * per_meter / PER_METER[_unit(suffix)]
+                if prev_suffixed:
+                    tokens.append("+")  # "3 м 20 см"
+            tokens.append(value)
+            prev_suffixed = bool(suffix)
+        else:
+            tokens.append(op)
+            prev_suffixed = False
+        if len(tokens) > MAX_TOKENS:
+            raise DimensionError("expression too long")
+        pos = match.end()
+    return tokens
+
+class _Parser:
+    __slots__ = ("tokens", "pos", "depth")
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def _peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def _next(self):
+        token = self._peek()
+        self.pos += 1
+        return token
+
+    def parse(self) -> float:
+        value = self._expr()
+        if self.pos != len(self.tokens):
+            raise DimensionError("trailing input")
+        return value
+
+    def _expr(self) -> float:
+        value = self._term()
+        while self._peek() in ("+", "-"):
+            if self._next() == "+":
+                value += self._term()
+            else:
+                value -= self._term()
+        return value
+
+    def _term(self) -> float:
+        value = self._factor()
+        while self._peek() in ("*", "/"):
+            if self._next() == "*":
+                value *= self._factor()
+            else:
+                divisor = self._factor()
+                if divisor == 0:
+                    raise DimensionError("division by zero")
+                value /= divisor
+        return value
+
+    def _factor(self) -> float:
+        token = self._next()
+        if isinstance(token, (int, float)):
+            return token
+        if token in ("+", "-"):
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise DimensionError("nesting too deep")
+            value = self._factor()
+            self.depth -= 1
+            return value if token == "+" else -value
+        if token == "(":
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise DimensionError("nesting too deep")
+            value = self._expr()
+            if self._next() != ")":
+                raise DimensionError("missing )")
+            self.depth -= 1
+            return value
+        raise DimensionError("number expected")
+
+def evaluate(text: str, unit: str = "m") -> float:
+    # Значение выражения в метрах; DimensionError, если ввод не разобрать
+    if len(text) > MAX_LENGTH:
+        raise DimensionError("input too long")
+    per_meter = PER_METER.get(unit, 1)
+    value = _Parser(_tokenize(text, per_meter)).parse()
+    if per_meter != 1:
+        value /= per_meter
+    if not math.isfinite(float(value)):
+        raise DimensionError("not a finite number")
+    return value
+
+@lru_cache(maxsize=2048)
+def _parse_cached(text: str, unit: str) -> float:
+    try:
+        return evaluate(text, unit)
+    except DimensionError:
+        return 0.0
+
+def parse_dimension(text: str, unit: str = "m") -> float:
+    # Как parse_size(): метры или 0.0, если ввод неверный
+    return _parse_cached(text.strip().lower(), unit)
+
+@lru_cache(maxsize=2048)
+def _parse_pair_cached(text: str, unit: str) -> tuple:
+    parts = _PAIR_RE.split(text)
+    try:
+        return tuple(evaluate(part, unit) for part in parts)
+    except DimensionError:
+        return ()
+
+def parse_dimensions(text: str, unit: str = "m") -> tuple:
+    # "3,2x2,7" -> (3.2, 2.7); пустой кортеж, если что-то не разобралось
+    return _parse_pair_cached(text.strip().lower(), unit)
@@ -0,0 +1,114 @@
+import asyncio
+import contextlib
+import contextvars
+import logging
+
+from telegram.request import RequestData
+from telegram.request._requestparameter import RequestParameter
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ОТВЕТ В ТЕЛЕ WEBHOOK
+# ============================
+
+# Telegram разрешает вернуть в ответе на webhook один вызов Bot API
+# ({"method": ..., параметры}) — это экономит отдельный исходящий HTTPS-запрос.
+# Пока апдейт обрабатывается внутри capture(), подходящий вызов (только текст,
+# без файлов) не отправляется, а откладывается, и бот сразу получает True.
+# Если за ним последует ещё один вызов, отложенный сначала отправляется
+# обычным запросом — порядок сообщений сохраняется. Вызов, оставшийся
+# отложенным к концу обработки, уходит телом ответа webhook.
+#
+# Ограничения: результат отложенного вызова — True, а не Message, и ошибку
+# его выполнения Telegram не сообщает — в лог пишется только сам факт, что
+# вызов ушёл в ответе. Где нужен результат (message_id), вызов оборачивается
+# в disabled(). sendChatAction не откладывается: "печатает…" нужно показать
+# сразу, а не после обработки.
+# Откладываются только вызовы из задачи, обрабатывающей апдейт: фоновые
+# задачи, созданные обработчиком, наследуют контекст, но отправляют сами.
+
+INLINE_METHODS = frozenset({
+    "sendMessage",
+    "editMessageText",
+    "editMessageReplyMarkup",
+    "answerCallbackQuery",
+    "deleteMessage",
+})
+
+_current = contextvars.ContextVar("inline_reply", default=None)
+
+class _Slot:
+    __slots__ = ("task", "held", "enabled")
+
+    def __init__(self, task):
+        self.task = task
+        self.held = None  # (endpoint, data, kwargs)
+        self.enabled = True
+
+class InlineReplies:
+    def __init__(self):
+        self.counters = {"updates": 0, "calls": 0, "inlined": 0}
+
+    def _active(self):
+        slot = _current.get()
+        if slot is None or slot.task is not asyncio.current_task():
+            return None
+        return slot
+
+    @contextlib.contextmanager
+    def capture(self):
+        slot = _Slot(asyncio.current_task())
+        token = _current.set(slot)
+        self.counters["updates"] += 1
+        try:
+            yield slot
+        finally:
+            _current.reset(token)
+            slot.task = None
+
+    @contextlib.contextmanager
+    def disabled(self):
+        slot = self._active()
+        if slot is None:
+            yield
+            return
+        enabled, slot.enabled = slot.enabled, False
+        try:
+            yield
+        finally:
+            slot.enabled = enabled
+
+    def release(self):
+        # Отложенный вызов, который надо отправить перед следующим
+        slot = self._active()
+        if slot is None or slot.held is None:
+            return None
+        held, slot.held = slot.held, None
+        return held
+
+    def hold(self, endpoint: str, data: dict, kwargs: dict) -> bool:
+        slot = self._active()
+        if slot is None:
+            return False
+        self.counters["calls"] += 1
+        if not slot.enabled or endpoint not in INLINE_METHODS:
+            return False
+        slot.held = (endpoint, data, kwargs)
+        return True
+
+    def response(self, slot):
+        # Тело ответа webhook: {"method": ..., параметры} или None
+        if slot.held is None:
+            return None
+        endpoint, data, _ = slot.held
+        slot.held = None
+        self.counters["inlined"] += 1
+        logger.info(f"Inlined {endpoint} into the webhook response (chat {data.get('chat_id')})")
+        params = RequestData([RequestParameter.from_input(key, value) for key, value in data.items()]).parameters
+        return {"method": endpoint, **params}
+
+    def stats(self) -> dict:
+        calls = self.counters["calls"]
+        saved = self.counters["inlined"] / calls * 100 if calls else 0.0
+        return {**self.counters, "saved_round_trips_pct": round(saved, 1)}
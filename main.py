@@ -1,17 +1,25 @@
+from startup import StartupTimeline  # первым импортом: от него отсчитывается время старта
 import asyncio
 import base64
+import contextlib
+import functools
+import hashlib
+import hmac
 from io import BytesIO
 import json
 import os
 import random
 from datetime import datetime, timedelta, timezone
-import re
 import math
 import logging
 import threading  # Для thread-safety
+import time
 
-import requests
-from flask import Flask, request, jsonify
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse
+from starlette.routing import Route
 from telegram import (
     Update,
     InlineKeyboardButton,
@@ -23,24 +31,38 @@ from telegram.ext import (
     CallbackQueryHandler,
     CommandHandler,
     ContextTypes,
+    ExtBot,
     MessageHandler,
+    TypeHandler,
     filters,
 )
 from telegram.error import TelegramError
+from telegram.request import HTTPXRequest
+
+from broadcast import Broadcaster, progress_text
+from catalog import build_catalog_index
+import comparison
+from comparison import compare_room, compare_walls, render_comparison
+from cutting import plan_walls, render_cut_plan
+from dimensions import parse_dimension
+from inline_reply import InlineReplies
+from media_cache import MediaCache
+from metrics import Metrics
+from outbound import Outbox
+from notifications import AdminNotifier
+from persistence import SqlitePersistence
+from profiler import KINDS as PROFILE_KINDS, Profiler
+from quotes import clear_quote_cache, quote_cache_stats, quote_item, render_quote
+from room import MAX_WALL_HEIGHT_M, MAX_WALL_WIDTH_M, looks_like_room, parse_room
+from sessions import SessionEvictor
+from stats_store import StatsStore
+from tracing import render_slowest, span, tracer
+from update_pipeline import ChatScheduler, UpdateDeduplicator, UpdateQueue
 
 # Настройка логирования
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
 logger = logging.getLogger(__name__)
-
-# Persistent event loop for webhook processing
-_loop = None
-
-def get_event_loop():
-    global _loop
-    if _loop is None or _loop.is_closed():
-        _loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(_loop)
-    return _loop
+startup_timeline = StartupTimeline()
 
 # ============================
 #   НАСТРОЙКИ (через .env)
@@ -56,6 +78,62 @@ ADMIN_CHAT_IDS = [203473623, 490825527]  # ИЗ ответа пользоват
 WELCOME_PHOTO_URL = "https://ecosteni.ru/wp-content/uploads/2025/11/qncccaze.jpg"
 PRESENTATION_URL = "https://ecosteni.ru/wp-content/uploads/2025/11/ecosteny_prezentacziya.pdf"
 TG_GROUP = "@ecosteni"
+# Медиа, которые бот шлёт по URL: кэшируются как file_id (см. media_cache.py)
+MEDIA = {WELCOME_PHOTO_URL: "photo", PRESENTATION_URL: "document"}
+
+# Быстрый ответ webhook: апдейт кладётся в очередь, 200 отдаётся сразу, обрабатывают воркеры
+WEBHOOK_FAST_ACK = os.getenv("WEBHOOK_FAST_ACK", "0") == "1"
+# Последний текстовый вызов апдейта отдавать телом ответа webhook (см. inline_reply.py);
+# работает только без WEBHOOK_FAST_ACK — там ответ уходит до обработки
+WEBHOOK_INLINE_REPLY = os.getenv("WEBHOOK_INLINE_REPLY", "0") == "1"
+# Секрет webhook (заголовок X-Telegram-Bot-Api-Secret-Token) и типы апдейтов, которые нужны боту
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+WEBHOOK_ALLOWED_UPDATES = [u for u in os.getenv("WEBHOOK_ALLOWED_UPDATES", "message,edited_message,callback_query").split(",") if u]
+# Токен для /metrics (Authorization: Bearer ...); пусто — /metrics не публикуется
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+# Регистрация webhook при старте: число попыток и первая пауза между ними, сек (дальше вдвое дольше)
+WEBHOOK_SETUP_ATTEMPTS = int(os.getenv("WEBHOOK_SETUP_ATTEMPTS", "5"))
+WEBHOOK_SETUP_RETRY_SEC = float(os.getenv("WEBHOOK_SETUP_RETRY_SEC", "2"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "8"))
+# Окно, в котором повторное нажатие той же кнопки считается дублем
+TAP_DEBOUNCE_SEC = float(os.getenv("TAP_DEBOUNCE_SEC", "1.5"))
+# Окно дедупликации update_id (бит на апдейт) и файл, где оно переживает рестарт
+DEDUP_WINDOW = int(os.getenv("DEDUP_WINDOW", "65536"))
+DEDUP_STATE_FILE = os.getenv("DEDUP_STATE_FILE", "/tmp/eco_dedup.bin")
+# Сессии (chat_data/user_data): SQLite-файл и интервал пакетной записи, сек
+SESSIONS_DB = os.getenv("SESSIONS_DB", "/tmp/eco_sessions.sqlite3")
+SESSIONS_FLUSH_SEC = float(os.getenv("SESSIONS_FLUSH_SEC", "60"))
+# Выгрузка неактивных сессий из памяти: простой, общий бюджет и период проверки
+SESSION_TTL_SEC = float(os.getenv("SESSION_TTL_SEC", "86400"))
+SESSION_MEMORY_MB = float(os.getenv("SESSION_MEMORY_MB", "64"))
+SESSION_SWEEP_SEC = float(os.getenv("SESSION_SWEEP_SEC", "300"))
+# Рассылка всем пользователям: чекпоинт, общий темп (сообщ./с) и число одновременных отправок
+BROADCAST_STATE_FILE = os.getenv("BROADCAST_STATE_FILE", "/tmp/eco_broadcast.json")
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "16"))
+# Трассировка апдейтов: файл JSONL, доля сэмплирования, порог "медленного" апдейта (пишется всегда),
+# сколько самых медленных держать в памяти для /traces
+TRACE_FILE = os.getenv("TRACE_FILE", "/tmp/eco_traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_KEEP_SLOWEST = int(os.getenv("TRACE_KEEP_SLOWEST", "50"))
+TRACE_FILE_MAX_MB = float(os.getenv("TRACE_FILE_MAX_MB", "20"))
+# Сколько времени даём перебору раскроя на один расчёт, сек
+CUT_PLAN_BUDGET_SEC = float(os.getenv("CUT_PLAN_BUDGET_SEC", "0.2"))
+# Помещение, которому по расчёту с запасом нужно больше панелей, раскрой не считает
+CUT_PLAN_MAX_PANELS = int(os.getenv("CUT_PLAN_MAX_PANELS", "500"))
+# Очередь уведомлений администраторам (заявки партнёров) и задержки повторов, сек
+ADMIN_QUEUE_FILE = os.getenv("ADMIN_QUEUE_FILE", "/tmp/eco_admin_queue.json")
+ADMIN_RETRY_BASE_SEC = float(os.getenv("ADMIN_RETRY_BASE_SEC", "5"))
+ADMIN_RETRY_MAX_SEC = float(os.getenv("ADMIN_RETRY_MAX_SEC", "900"))
+# Кэш file_id и служебный чат для прогрева, когда кэша ещё нет (пусто — без
+# прогрева: file_id запоминаются при первой отправке пользователю)
+MEDIA_CACHE_FILE = os.getenv("MEDIA_CACHE_FILE", "/tmp/eco_media.json")
+MEDIA_WARMUP_CHAT_ID = os.getenv("MEDIA_WARMUP_CHAT_ID", "")
+# Профилирование из меню администратора: длительности на кнопках (сек) и период сэмплов CPU, мс
+PROFILE_DURATIONS = [int(s) for s in os.getenv("PROFILE_DURATIONS", "10,30").split(",") if s.strip()]
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
 
 GREETING_PHRASES = [
     "Привет, {name}! Я ассистент компании ECO Стены. Помогу с подбором материалов и расчётом панелей. 😊",
@@ -65,48 +143,16 @@ GREETING_PHRASES = [
     "Добро пожаловать, {name}! Рассказывайте, какой у вас объект — подберём оптимальное решение из наших материалов.",
 ]
 
-# Файл для хранения статистики (на Render - ephemeral, но для простоты)
+# Файлы статистики (на Render - ephemeral, но для простоты): снимок + журнал событий
 STATS_FILE = "/tmp/eco_stats.json"
+STATS_LOG_FILE = "/tmp/eco_stats.log"
+STATS_USERS_FILE = "/tmp/eco_users.bin"
+STATS_USERS_TODAY_FILE = "/tmp/eco_users_today.bin"
 
-def load_stats():
-    default_stats = {
-        "users": set(),
-        "calc_count": 0,
-        "today": datetime.now(timezone.utc).date().isoformat(),
-        "users_today": set(),
-        "calc_today": 0
-    }
-    if os.path.exists(STATS_FILE):
-        try:
-            with open(STATS_FILE, 'r') as f:
-                loaded = json.load(f)
-                # Convert lists back to sets
-                loaded['users'] = set(loaded.get('users', []))
-                loaded['users_today'] = set(loaded.get('users_today', []))
-                return loaded
-        except (json.JSONDecodeError, KeyError, TypeError) as e:
-            logger.warning(f"Corrupted stats file, starting fresh: {e}")
-            # Optionally remove corrupted file with try-except
-            try:
-                os.remove(STATS_FILE)
-            except OSError as oe:
-                logger.warning(f"Could not remove stats file: {oe}")
-    return default_stats
-
-def save_stats(stats):
-    # Convert sets to lists for JSON
-    serializable = {
-        "users": list(stats['users']),
-        "calc_count": stats['calc_count'],
-        "today": stats['today'],
-        "users_today": list(stats['users_today']),
-        "calc_today": stats['calc_today']
-    }
-    try:
-        with open(STATS_FILE, 'w') as f:
-            json.dump(serializable, f)
-    except Exception as e:
-        logger.error(f"Failed to save stats: {e}")
+tracer.configure(TRACE_FILE or None, TRACE_SAMPLE_RATE, TRACE_SLOW_MS, TRACE_KEEP_SLOWEST, int(TRACE_FILE_MAX_MB * 1024 * 1024))
+
+stats_store = StatsStore(STATS_FILE, STATS_LOG_FILE, STATS_USERS_FILE, STATS_USERS_TODAY_FILE)
+stats_store.load()
 
 # ============================
 #   КАТАЛОГ МАТЕРИАЛОВ
@@ -239,6 +285,8 @@ PANELS_3D = {
     "var2": {"code": "3d_1200x3000", "width_mm": 1200, "height_mm": 3000, "area_m2": 3.6, "price_rub": 8000},
 }
 
+CATALOG = build_catalog_index(WALL_PRODUCTS, PRODUCT_CODES, PROFILES, SLAT_PRICES, PANELS_3D)
+
 SYSTEM_PROMPT = """
 Ты — онлайн-консультант компании ECO Стены.
 
@@ -273,17 +321,229 @@ CHAT_SYSTEM_PROMPT = """
 """
 
 # ============================
-#   FLASK + TELEGRAM
+#   TELEGRAM
 # ============================
 
-app = Flask(__name__)
+class EcoBot(ExtBot):
+    __slots__ = ()
+
+    async def _do_post(self, endpoint, data, **kwargs):
+        # Вызов может быть придержан (outbox) или отложен в тело ответа webhook
+        # (inline_replies). Тогда вызывающий сразу получает True вместо
+        # Message/bool, а ошибка отложенного вызова не вернётся в обработчик.
+        # Где результат нужен (message_id, edit_text у ответа), вызов
+        # оборачивается в outbox.disabled() и inline_replies.disabled().
+        return await outbox.post(endpoint, data, kwargs, self._post_now)
+
+    async def _post_now(self, endpoint, data, kwargs):
+        # Готовые клавиатуры уходят уже сериализованной JSON-строкой
+        markup = data.get("reply_markup")
+        if isinstance(markup, PrebuiltKeyboard):
+            data["reply_markup"] = markup.json
+        held = inline_replies.release()
+        if held is not None:
+            await self._timed_post(*held)
+        if inline_replies.hold(endpoint, data, kwargs):
+            return True
+        return await self._timed_post(endpoint, data, kwargs)
+
+    async def _timed_post(self, endpoint, data, kwargs):
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with span("bot_api", method=endpoint):
+                result = await super()._do_post(endpoint, data, **kwargs)
+            status = "ok"
+            return result
+        finally:
+            metrics.inc("bot_api_calls_total", endpoint, status)
+            metrics.observe("bot_api_latency_seconds", time.perf_counter() - started, endpoint)
+
+inline_replies = InlineReplies()
+outbox = Outbox()
+
+# ============================
+#   МЕТРИКИ
+# ============================
+
+metrics = Metrics(prefix="eco_")
+metrics.counter("updates_total", "Updates processed, by update type", ("type",))
+metrics.histogram("update_duration_seconds", "Update processing time by handler and route (callback action / message phase)", ("handler", "route"))
+metrics.gauge("updates_in_flight", "Updates being processed right now")
+metrics.inc("updates_in_flight", value=0)
+metrics.counter("bot_api_calls_total", "Bot API requests by method and result", ("method", "status"))
+metrics.histogram("bot_api_latency_seconds", "Bot API request latency by method", ("method",))
+metrics.counter("errors_total", "Errors by place: handler (exception in a handler), webhook (HTTP 500)", ("kind",))
+metrics.inc("errors_total", "handler", value=0)
+metrics.inc("errors_total", "webhook", value=0)
+
+def update_type(update) -> str:
+    return next((kind for kind in Update.ALL_TYPES if getattr(update, kind, None) is not None), "other")
+
+# Команду и callback_data присылает пользователь: в метку route попадают только
+# известные значения, иначе произвольный ввод занял бы все ряды метрики (MAX_SERIES)
+CALLBACK_ACTIONS = frozenset({
+    "main", "admin", "broadcast", "profile", "back", "calc_cat", "calc_mode", "calc_type", "product",
+    "thickness", "length", "choose_length", "units", "slats_unit", "slats_type", "profile_thick",
+    "profile_type", "3d_size", "custom_name", "add_another", "finish_calc", "partner_role", "okno", "dver",
+})
+
+def registered_commands(application: Application) -> set:
+    return {
+        command
+        for handlers in application.handlers.values()
+        for handler in handlers if isinstance(handler, CommandHandler)
+        for command in handler.commands
+    }
+
+def update_route(application: Application, update) -> tuple:
+    # (handler, route): действие кнопки (первая часть callback_data) или фаза диалога
+    if not isinstance(update, Update):
+        return "other", "other"
+    if update.callback_query is not None:
+        action = (update.callback_query.data or "").split("|")[0]
+        return "callback", action if action in CALLBACK_ACTIONS else "unknown"
+    message = update.message or update.edited_message
+    if message is None:
+        return "other", update_type(update)
+    if message.text and message.text.startswith("/"):
+        command = message.text.split()[0][1:].split("@")[0].lower()
+        return "command", command if command in registered_commands(application) else "unknown"
+    if message.photo:
+        return "photo", "photo"
+    chat_data = application.chat_data.get(message.chat_id) or {}
+    return "message", chat_data.get("phase") or "none"
+
+async def on_error(update, context: ContextTypes.DEFAULT_TYPE):
+    metrics.inc("errors_total", "handler")
+    logger.error(f"Error while handling update: {context.error}", exc_info=context.error)
+
+class EcoApplication(Application):
+    async def process_update(self, update):
+        # Границы апдейта для Outbox: автоответ на нажатие, склейка сообщений, счётчик вызовов
+        started = time.perf_counter()
+        handler, route = update_route(self, update)
+        metrics.inc("updates_total", update_type(update))
+        metrics.inc("updates_in_flight")
+        try:
+            with span("dispatch", root=True, handler=handler, route=route, update_id=getattr(update, "update_id", None)):
+                async with outbox.scope(update, tg_bot._post_now):
+                    await super().process_update(update)
+        finally:
+            metrics.dec("updates_in_flight")
+            metrics.observe("update_duration_seconds", time.perf_counter() - started, handler, route)
+        startup_timeline.update_processed(started)
+
+async def on_startup(application: Application):
+    # Фоновые задачи: вызывается и в polling (post_init), и из lifespan ASGI.
+    update_dedup.load()
+    # Тяжёлая подготовка (клавиатуры, NumPy) — в фоне, параллельно с первыми апдейтами
+    startup_timeline.run_in_background("warm_up", warm_up())
+    session_evictor.track_existing()
+    session_evictor.start(SESSION_SWEEP_SEC)
+    broadcaster.resume()
+    admin_notifier.load()
+    admin_notifier.start()
+    media_cache.load()
+    media_cache.warm(MEDIA, MEDIA_WARMUP_CHAT_ID)
+    startup_timeline.ready()
+
+async def warm_up():
+    prebuild_keyboards()
+    await asyncio.to_thread(comparison.preload, CATALOG)
+
+async def on_stop(application: Application):
+    await startup_timeline.stop()
+    await broadcaster.stop()
+    await admin_notifier.stop()
+    await media_cache.stop()
+    await profiler.stop()
+    await session_evictor.stop()
+
+async def on_shutdown(application: Application):
+    # Последним: и в polling (post_shutdown), и из lifespan ASGI
+    update_dedup.save()
+    stats_store.close()
+
+session_persistence = SqlitePersistence(SESSIONS_DB, update_interval=SESSIONS_FLUSH_SEC, load_ttl=SESSION_TTL_SEC)
+# Пул соединений как у Application.builder() по умолчанию
+tg_bot = EcoBot(TG_BOT_TOKEN, request=HTTPXRequest(connection_pool_size=256), get_updates_request=HTTPXRequest())
+tg_application = (
+    Application.builder()
+    .application_class(EcoApplication)
+    .bot(tg_bot)
+    .persistence(session_persistence)
+    .post_init(on_startup)
+    .post_stop(on_stop)
+    .post_shutdown(on_shutdown)
+    .build()
+)
+
+# PTB отдаёт chat_data/user_data только на чтение, выгружаем из внутренних словарей
+session_evictor = SessionEvictor(
+    {"chat": tg_application._chat_data, "user": tg_application._user_data},
+    ttl=SESSION_TTL_SEC,
+    budget_bytes=int(SESSION_MEMORY_MB * 1024 * 1024),
+    on_evict=session_persistence.stage,
+    before_sweep=tg_application.update_persistence,
+)
+
+async def report_broadcast_progress(progress: dict, final: bool):
+    # Живой статус рассылки в сообщении, из которого администратор её запустил
+    await tg_bot.edit_message_text(
+        progress_text(progress, final),
+        chat_id=broadcaster.state["admin_chat_id"],
+        message_id=broadcaster.state["status_message_id"],
+        reply_markup=None if final else build_broadcast_keyboard(),
+    )
+
+broadcaster = Broadcaster(tg_bot, stats_store, BROADCAST_STATE_FILE, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS, on_progress=report_broadcast_progress)
+admin_notifier = AdminNotifier(tg_bot, ADMIN_QUEUE_FILE, base_delay=ADMIN_RETRY_BASE_SEC, max_delay=ADMIN_RETRY_MAX_SEC)
+media_cache = MediaCache(tg_bot, MEDIA_CACHE_FILE)
+profiler = Profiler(tg_bot, interval=PROFILE_INTERVAL_MS / 1000)
+
+async def answer_duplicate_tap(update: Update):
+    # Дубль нажатия не обрабатываем, но снимаем "часики" с кнопки
+    try:
+        await update.callback_query.answer()
+    except TelegramError as e:
+        logger.warning(f"Failed to answer duplicate callback: {e}")
 
-tg_application = Application.builder().token(TG_BOT_TOKEN).build()
+update_dedup = UpdateDeduplicator(size=DEDUP_WINDOW, state_file=DEDUP_STATE_FILE or None)
+chat_scheduler = ChatScheduler(tg_application.process_update, debounce=TAP_DEBOUNCE_SEC, on_duplicate=answer_duplicate_tap)
+update_queue = UpdateQueue(chat_scheduler.run, maxsize=UPDATE_QUEUE_SIZE, workers=UPDATE_WORKERS)
+metrics.gauge_fn("update_queue_depth", "Updates waiting in the fast-ack queue", update_queue.depth)
 
 # ============================
 #   КЛАВИАТУРА
 # ============================
 
+# Все клавиатуры неизменяемы, поэтому каждая строится один раз: статические — без
+# аргументов, каталожные — по своим аргументам. JSON для запроса тоже считается
+# один раз (см. EcoBot). Кэш привязан к версии каталога и сбрасывается в reload_catalog().
+
+class PrebuiltKeyboard(InlineKeyboardMarkup):
+    __slots__ = ("json",)
+
+    def __init__(self, inline_keyboard):
+        super().__init__(inline_keyboard)
+        with self._unfrozen():
+            self.json = json.dumps(super().to_dict(), ensure_ascii=False)
+
+_keyboard_cache = {}
+
+def cached_keyboard(builder):
+    @functools.wraps(builder)
+    def wrapper(*args):
+        key = (CATALOG.version, builder.__name__, args)
+        markup = _keyboard_cache.get(key)
+        if markup is None:
+            markup = PrebuiltKeyboard(builder(*args).inline_keyboard)
+            _keyboard_cache[key] = markup
+        return markup
+    return wrapper
+
+@cached_keyboard
 def build_main_menu_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("🧱 Рассчитать материалы", callback_data="main|calc")],
@@ -300,6 +560,7 @@ def build_main_menu_keyboard() -> InlineKeyboardMarkup:
 def build_back_button(text="Назад"):
     return [[InlineKeyboardButton(text, callback_data="back|main")]]
 
+@cached_keyboard
 def build_calc_category_keyboard() -> InlineKeyboardMarkup:
     rows = [
         [InlineKeyboardButton("🧱 Стеновые панели WPC", callback_data="calc_cat|walls")],
@@ -307,31 +568,34 @@ def build_calc_category_keyboard() -> InlineKeyboardMarkup:
         [InlineKeyboardButton("📏 Реечные панели", callback_data="calc_cat|slats")],
         [InlineKeyboardButton("🎨 3D-панели", callback_data="calc_cat|3d")],
         [InlineKeyboardButton("🪨 Гибкий камень", callback_data="calc_cat|flex")],
+        [InlineKeyboardButton("📊 Сравнить все стеновые панели", callback_data="calc_cat|compare")],
     ]
     rows += build_back_button("В главное меню")
     return InlineKeyboardMarkup(rows)
 
+@cached_keyboard
 def build_wall_product_keyboard() -> InlineKeyboardMarkup:
     buttons = []
-    for code, title in PRODUCT_CODES.items():
+    for code, title in CATALOG.titles.items():
         buttons.append([InlineKeyboardButton(text=title, callback_data=f"product|{code}")])
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_thickness_keyboard(code: str) -> InlineKeyboardMarkup:
-    title = PRODUCT_CODES[code]
-    thicknesses = WALL_PRODUCTS[title].keys()
+    thicknesses = CATALOG.thicknesses[code]
     buttons = [[InlineKeyboardButton(f"{thick} мм", callback_data=f"thickness|{code}|{thick}")] for thick in thicknesses]
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_length_keyboard(code: str, thick: int) -> InlineKeyboardMarkup:
-    title = PRODUCT_CODES[code]
-    lengths = WALL_PRODUCTS[title][thick]['panels'].keys()
+    lengths = CATALOG.lengths[(code, thick)]
     buttons = [[InlineKeyboardButton(f"{length} мм", callback_data=f"length|{code}|{thick}|{length}")] for length in lengths]
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_profile_thickness_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("5 мм", callback_data="profile_thick|5")],
@@ -340,12 +604,14 @@ def build_profile_thickness_keyboard() -> InlineKeyboardMarkup:
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_profile_type_keyboard(thick: int) -> InlineKeyboardMarkup:
-    types = PROFILES[thick].keys()
+    types = CATALOG.profile_types[thick]
     buttons = [[InlineKeyboardButton(name, callback_data=f"profile_type|{thick}|{name.replace(' ', '_')}")] for name in types]
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_slats_type_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("WPC рейки", callback_data="slats_type|wpc")],
@@ -354,6 +620,7 @@ def build_slats_type_keyboard() -> InlineKeyboardMarkup:
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_3d_size_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("600x1200 мм", callback_data="3d_size|var1")],
@@ -362,6 +629,7 @@ def build_3d_size_keyboard() -> InlineKeyboardMarkup:
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_add_another_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("Да, добавить ещё материал", callback_data="add_another|yes")],
@@ -369,6 +637,7 @@ def build_add_another_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_custom_name_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("Да, знаю название/артикул", callback_data="custom_name|yes")],
@@ -376,6 +645,7 @@ def build_custom_name_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_units_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("Метры (м)", callback_data="units|m")],
@@ -383,6 +653,7 @@ def build_units_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_slats_units_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("Метры (м)", callback_data="slats_unit|m")],
@@ -390,6 +661,7 @@ def build_slats_units_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_yes_no_keyboard(yes_data, no_data) -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("Да", callback_data=yes_data)],
@@ -397,6 +669,38 @@ def build_yes_no_keyboard(yes_data, no_data) -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
+def build_calc_type_keyboard(count_kind: str) -> InlineKeyboardMarkup:
+    count_text = "По количеству реечных панелей" if count_kind == "slats" else "По количеству панелей"
+    buttons = [
+        [InlineKeyboardButton("По размерам помещения", callback_data="calc_type|room")],
+        [InlineKeyboardButton(count_text, callback_data=f"calc_type|{count_kind}")],
+    ]
+    return InlineKeyboardMarkup(buttons)
+
+@cached_keyboard
+def build_calc_mode_keyboard() -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton("По высоте панели (обрезать стену)", callback_data="calc_mode|panel")],
+        [InlineKeyboardButton("По высоте помещения (стыковать панели)", callback_data="calc_mode|room")],
+    ]
+    return InlineKeyboardMarkup(buttons)
+
+def length_choice_text(length_mm: int, fits=True) -> str:
+    text = f"{length_mm} мм ({length_mm / 1000.0:.1f} м)"
+    if not fits:
+        text += " (максимальная доступная)"
+    return text
+
+@cached_keyboard
+def build_choose_length_keyboard(current_length: int, suggested_length: int, fits: bool) -> InlineKeyboardMarkup:
+    buttons = [
+        [InlineKeyboardButton(f"Оставить {length_choice_text(current_length)}", callback_data="choose_length|original")],
+        [InlineKeyboardButton(f"Выбрать {length_choice_text(suggested_length, fits)}", callback_data="choose_length|suggested")],
+    ]
+    return InlineKeyboardMarkup(buttons)
+
+@cached_keyboard
 def build_contacts_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("Группа в Telegram", url="https://t.me/ecosteni")],
@@ -407,15 +711,29 @@ def build_contacts_keyboard() -> InlineKeyboardMarkup:
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
 def build_admin_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("📊 Сатистика", callback_data="admin|stats")],
         [InlineKeyboardButton("📢 Рассылка", callback_data="admin|broadcast")],
         [InlineKeyboardButton("💰 Расчет стоимости и веса", callback_data="admin|cost_calc")],
+        [InlineKeyboardButton("🔬 Профилирование", callback_data="admin|profile")],
     ]
     buttons += build_back_button("Назад")
     return InlineKeyboardMarkup(buttons)
 
+@cached_keyboard
+def build_broadcast_keyboard() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([[InlineKeyboardButton("⏹ Остановить рассылку", callback_data="broadcast|stop")]])
+
+@cached_keyboard
+def build_profile_keyboard() -> InlineKeyboardMarkup:
+    buttons = [[InlineKeyboardButton(f"⏱ CPU {s} с", callback_data=f"profile|cpu|{s}") for s in PROFILE_DURATIONS]]
+    buttons.append([InlineKeyboardButton(f"🧠 Память {s} с", callback_data=f"profile|memory|{s}") for s in PROFILE_DURATIONS])
+    buttons += build_back_button("Назад")
+    return InlineKeyboardMarkup(buttons)
+
+@cached_keyboard
 def build_partner_role_keyboard() -> InlineKeyboardMarkup:
     buttons = [
         [InlineKeyboardButton("🛒 Розничный магазин", callback_data="partner_role|retail")],
@@ -425,12 +743,41 @@ def build_partner_role_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(buttons)
 
+def prebuild_keyboards():
+    # Строим заранее всё, что зависит только от каталога
+    for builder in (build_main_menu_keyboard, build_calc_category_keyboard, build_wall_product_keyboard,
+                    build_profile_thickness_keyboard, build_slats_type_keyboard, build_3d_size_keyboard,
+                    build_add_another_keyboard, build_custom_name_keyboard, build_units_keyboard,
+                    build_slats_units_keyboard, build_contacts_keyboard, build_admin_keyboard,
+                    build_partner_role_keyboard, build_calc_mode_keyboard, build_broadcast_keyboard,
+                    build_profile_keyboard):
+        builder()
+    for count_kind in ("panels", "slats"):
+        build_calc_type_keyboard(count_kind)
+    for yes_data, no_data in (("okno|yes", "okno|no"), ("dver|yes", "dver|no")):
+        build_yes_no_keyboard(yes_data, no_data)
+    for code, thicknesses in CATALOG.thicknesses.items():
+        build_thickness_keyboard(code)
+        for thick in thicknesses:
+            build_length_keyboard(code, thick)
+    for thick in CATALOG.profile_types:
+        build_profile_type_keyboard(thick)
+    logger.info(f"Keyboards prebuilt: {len(_keyboard_cache)}")
+
+def reload_catalog():
+    # Пересобрать индекс каталога после изменения WALL_PRODUCTS и т.п.; клавиатуры старой версии сбрасываются
+    global CATALOG
+    CATALOG = build_catalog_index(WALL_PRODUCTS, PRODUCT_CODES, PROFILES, SLAT_PRICES, PANELS_3D)
+    _keyboard_cache.clear()
+    clear_quote_cache()
+    prebuild_keyboards()
+
 async def send_greeting(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     name = user.first_name or user.username or "друг"
     greeting = random.choice(GREETING_PHRASES).format(name=name)
     try:
-        await context.bot.send_photo(chat_id=update.effective_chat.id, photo=WELCOME_PHOTO_URL, caption=greeting)
+        await media_cache.send("photo", update.effective_chat.id, WELCOME_PHOTO_URL, caption=greeting)
     except Exception as e:
         logger.error(f"Error sending photo: {e}")
         await context.bot.send_message(chat_id=update.effective_chat.id, text=greeting)
@@ -438,169 +785,32 @@ async def send_greeting(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # For stats: on start, add user
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    stats = load_stats()
-    today = datetime.now(timezone.utc).date().isoformat()
-    if stats['today'] != today:
-        stats['users_today'] = set()
-        stats['calc_today'] = 0
-        stats['today'] = today
-    stats['users'].add(update.effective_chat.id)
-    stats['users_today'].add(update.effective_chat.id)
-    save_stats(stats)
+    stats_store.add_user(update.effective_chat.id)
     await send_greeting(update, context)
 
+async def traces_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # /traces [N] — N самых медленных апдейтов с их самыми долгими шагами (только администраторам)
+    if update.effective_user.id not in ADMIN_CHAT_IDS:
+        return
+    n = int(context.args[0]) if context.args and context.args[0].isdigit() else 5
+    text = render_slowest(tracer.slowest(max(1, min(n, 20))))
+    await update.message.reply_text(text[:4096])
+
 # ============================
 #   РАССЧЁТ
 # ============================
 
 def parse_size(text: str, unit: str) -> float:
-    try:
-        # Улучшенный парсинг: поддержка простых выражений вроде "1.2 + 3.4"
-        # Безопасный eval только для математических операций
-        allowed_names = {"__builtins__": {}, "math": math}
-        expr = re.sub(r'[^\d\s+\-*/().]', '', text.strip())  # Очистка от нецифр кроме операторов
-        if expr:
-            num = eval(expr, allowed_names)
-        else:
-            num = float(text.strip())
-        return num / 1000 if unit == "mm" else num
-    except:
-        return 0.0
+    # Выражения вида "1.2 + 3,4", "320 см", "(2.5-0.3)*2" — см. dimensions.py
+    return parse_dimension(text, unit)
 
 def calculate_item(item, wall_width_m, wall_height_m, deduct_area_m2, unit, calc_mode=None, panel_h_m=None) -> tuple[str, int]:
-    category = item['category']
-    cost = 0
-    if category == 'walls':
-        title = PRODUCT_CODES[item['product_code']]
-        thickness = item.get('thickness', 0)
-        length_mm = item['length']
-        panel = WALL_PRODUCTS[title][thickness]['panels'][length_mm]
-        area_m2 = panel['area_m2']
-        price = panel['price_rub']
-        panel_width_mm = WALL_PRODUCTS[title][thickness]['width_mm']
-        weight_per_m2 = WALL_PRODUCTS[title][thickness].get('weight_per_m2')
-        panel_w_m = panel_width_mm / 1000
-        panel_h_m = length_mm / 1000 if panel_h_m is None else panel_h_m
-        if 'known_panels' in item:
-            panels = item['known_panels']
-            total_area = panels * area_m2
-            net_area = total_area
-            waste_area = 0
-            waste_pct = 0
-            cost = panels * price
-            total_weight = total_area * weight_per_m2 if weight_per_m2 else None
-            custom_name = item.get('custom_name', 'Стандартный')
-            result_text = f"""Выбранный материал: {title}  
-Толщина: {thickness} мм  
-Высота: {length_mm} мм  
-Название/артикул клиента: <b>«{custom_name}»</b>  
-
-🔸 Количество панелей: {panels}  
-🔸 Площадь одной панели ({length_mm} мм × {panel_width_mm} мм): {area_m2} м²  
-🔸 Общая площадь: {panels} панелей × {area_m2} м² = {total_area:.1f} м²  
-
-💰 Ориентировочная стоимость: {panels} панелей × {price:,} ₽ = {cost:,} ₽  """
-            if total_weight is not None:
-                result_text += f"\n\nОбщий вес: {total_weight:.2f} кг  "
-            result_text += f"""\n\n____________________________________________________________  
-Итог:  
-- Необходимое количество панелей: {panels}  
-- Общая стоимость: {cost:,} ₽  """
-        else:
-            if calc_mode == 'panel':
-                eff_h = min(wall_height_m, panel_h_m)
-                mode_text = "(обрезка по высоте панели)"
-            else:
-                eff_h = wall_height_m
-                mode_text = "(стыковка панелей)"
-            gross_area = wall_width_m * eff_h
-            net_area = gross_area - deduct_area_m2
-            num_rows = 1 if calc_mode == 'panel' else math.ceil(wall_height_m / panel_h_m)
-            num_cols = math.ceil(wall_width_m / panel_w_m)
-            total_panels_approx = num_rows * num_cols
-            required_area = net_area * 1.1  # 10% reserve
-            panels = max(total_panels_approx, math.ceil(required_area / area_m2))
-            total_area = panels * area_m2
-            waste_area = total_area - net_area
-            waste_pct = (waste_area / total_area) * 100 if total_area > 0 else 0
-            cost = panels * price
-            total_weight = total_area * weight_per_m2 if weight_per_m2 else None
-            custom_name = item.get('custom_name', 'Стандартный')
-            width_mm = wall_width_m * 1000
-            width_m = wall_width_m
-            result_text = f"""Выбранный материал: {title}  
-Толщина: {thickness} мм  
-Высота: {length_mm} мм {mode_text}  
-Название/артикул клиента: <b>«{custom_name}»</b>  
-
-🔹 Ширина зоны отделки: {width_mm:.1f} мм (или {width_m:.2f} м)  
-🔹 Площадь зоны отделки: {width_m:.2f} м × {eff_h:.1f} м = {gross_area:.2f} м²  
-🔹 Площадь к вычету (окна/двери): {deduct_area_m2:.2f} м²  
-🔹 Общая площадь для покрытия: {gross_area:.2f} м² - {deduct_area_m2:.2f} м² = {net_area:.2f} м²  
-
-🔸 Площадь одной панели ({length_mm} мм × {panel_width_mm} мм): {area_m2} м²  
-🔸 Необходимое количество панелей: {net_area:.2f} м² ÷ {area_m2} м² ≈ {net_area / area_m2:.2f} (округляем до {panels} панелей, с учётом рядов: {num_rows} рядов × {num_cols} панелей в ряду)  
-🔸 Общая площадь закупаемых панелей: {panels} панелей × {area_m2} м² = {total_area:.1f} м²  
-
-🔹 Отходы:  
-- Площадь отходов: {total_area:.1f} м² - {net_area:.2f} м² = {waste_area:.2f} м²  
-- Процент отходов: ({waste_area:.2f} м² ÷ {total_area:.1f} м²) × 100 ≈ {waste_pct:.2f}%  
-
-💰 Ориентировочная стоимость: {panels} панелей × {price:,} ₽ = {cost:,} ₽  """
-            if total_weight is not None:
-                result_text += f"\n\nОбщий вес: {total_weight:.2f} кг  "
-            result_text += f"""\n\n____________________________________________________________  
-Итог:  
-- Необходимое количество панелей: {panels}  
-- Общая стоимость: {cost:,} ₽  
-- Отходы: {waste_area:.2f} м² ({waste_pct:.2f}%)"""
-    elif category == 'profiles':
-        thickness = item['thickness']
-        type_name = item['type']
-        quantity = item['quantity']
-        price = PROFILES[thickness][type_name]
-        cost = quantity * price
-        result_text = f"""
-Профиль: {type_name}, {thickness} мм
-Количество: {quantity} шт.
-💰 Стоимость: {cost} ₽
-"""
-    elif category == 'slats':
-        type_name = 'WPC' if item['type'] == 'wpc' else 'Деревянные'
-        price_mp = SLAT_PRICES[item['type']]
-        length_m = wall_width_m  # Длина стены в м
-        required = length_m * 1.1
-        cost = math.ceil(required) * price_mp  # Округление вверх
-        waste = required - length_m
-        result_text = f"""
-Реечные панели: {type_name}
-Длина стены: {length_m} м.п.
-Необходимая длина: {required:.2f} м.п.
-Отходы: {waste:.2f} м.п. (10%)
-💰 Стоимость: {cost} ₽
-"""
-    elif category == '3d':
-        var = PANELS_3D[item['var']]
-        area_m2 = var['area_m2']
-        price = var['price_rub']
-        gross_area = wall_width_m * wall_height_m
-        net_area = gross_area - deduct_area_m2
-        panels = math.ceil(net_area / area_m2)
-        total_area = panels * area_m2
-        waste_area = total_area - net_area
-        waste_pct = (waste_area / total_area) * 100 if total_area > 0 else 0
-        cost = panels * price
-        result_text = f"""
-3D панели: {var['code']}
-Площадь панели: {area_m2} м²
-Количество: {panels} шт.
-Общая площадь: {total_area} м²
-Отходы: {waste_area:.2f} м² ({waste_pct:.2f}%)
-💰 Стоимость: {cost} ₽
-"""
-    else:
-        result_text = ""
-    return result_text, cost
+    # Расчёт и текст кэшируются отдельно, см. quotes.py
+    with span("calculate_item", category=item.get('category')):
+        quote = quote_item(CATALOG, item, wall_width_m, wall_height_m, deduct_area_m2, calc_mode, panel_h_m)
+        if quote is None:
+            return "", 0
+        return render_quote(quote, item.get('custom_name', 'Стандартный')), quote.cost
 
 # ============================
 #   CALLBACK HANDLER
@@ -624,7 +834,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         elif sub == 'catalogs':
             await query.edit_message_text("Каталог в разработке.")
         elif sub == 'presentation':
-            await context.bot.send_document(chat_id=query.message.chat_id, document=PRESENTATION_URL, caption="Презентация ECO Стены")
+            await media_cache.send("document", query.message.chat_id, PRESENTATION_URL, caption="Презентация ECO Стены")
         elif sub == 'contacts':
             text = "Телефон: +7 (978) 022-32-22\nПочта: info@ecosteni.ru\nГрафик: Пн-Пт 9:00–18:00\n\nГруппа в Telegram: https://t.me/ecosteni\nСвязаться с администратором: @DService82\nСайт: https://ecosteni.ru/"
             await query.edit_message_text(text, reply_markup=build_contacts_keyboard())
@@ -638,17 +848,44 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             else:
                 await query.edit_message_text("Доступ запрещён.")
     elif action == 'admin':
+        if update.effective_user.id not in ADMIN_CHAT_IDS:
+            await query.edit_message_text("Доступ запрещён.")
+            return
         sub = parts[1]
         if sub == 'stats':
-            stats = load_stats()
-            text = f"Пользователей сегодня: {len(stats['users_today'])}\nРасчётов сегодня: {stats['calc_today']}\nВсего пользователей: {len(stats['users'])}\nВсего расчётов: {stats['calc_count']}"
+            stats = stats_store.summary()
+            text = f"Пользователей сегодня: {stats['users_today']}\nРасчётов сегодня: {stats['calc_today']}\nВсего пользователей: {stats['users']}\nВсего расчётов: {stats['calc_count']}"
             await query.edit_message_text(text)
         elif sub == 'broadcast':
+            if broadcaster.running:
+                await query.edit_message_text(progress_text(broadcaster.progress(), False), reply_markup=build_broadcast_keyboard())
+                return
             context.chat_data['phase'] = 'broadcast'
-            await query.edit_message_text("Введите текст для рассылки в группу:")
+            await query.edit_message_text("Введите текст для рассылки (в группу и всем пользователям бота):")
         elif sub == 'cost_calc':
             context.chat_data['is_admin_cost'] = True
             await query.edit_message_text("Выберите тип WPC для расчета:", reply_markup=build_wall_product_keyboard())
+        elif sub == 'profile':
+            text = "Профилирование работающего бота. CPU — стеки для flamegraph, память — топ выделений tracemalloc."
+            if profiler.running:
+                text += "\n\n⏳ Сейчас уже идёт профилирование, результат придёт документом."
+            await query.edit_message_text(text, reply_markup=build_profile_keyboard())
+    elif action == 'profile':
+        if update.effective_user.id not in ADMIN_CHAT_IDS:
+            return
+        if len(parts) < 3 or parts[1] not in PROFILE_KINDS or not parts[2].isdigit():
+            await query.answer("Ошибка выбора.")
+            return
+        seconds = min(int(parts[2]), 300)
+        if profiler.start(parts[1], seconds, query.message.chat_id):
+            what = "CPU" if parts[1] == "cpu" else "память"
+            await query.edit_message_text(f"🔬 Профилирование ({what}) {seconds} с, файл придёт отдельным сообщением.")
+        else:
+            await query.edit_message_text("⏳ Профилирование уже идёт, дождитесь результата.", reply_markup=build_profile_keyboard())
+    elif action == 'broadcast':
+        if parts[1] == 'stop' and update.effective_user.id in ADMIN_CHAT_IDS:
+            if broadcaster.cancel():
+                await query.edit_message_text("⏹ Останавливаю рассылку…")
     elif action == 'calc_cat':
         cat = parts[1]
         context.chat_data['current_cat'] = cat
@@ -662,10 +899,12 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("Выберите размер 3D панели:", reply_markup=build_3d_size_keyboard())
         elif cat == 'flex':
             await query.edit_message_text("Гибкий камень в разработке.")
+        elif cat == 'compare':
+            context.chat_data['current_item'] = {'category': 'compare'}
+            await proceed_to_wall_input(query, context)
     elif action == 'product':
         code = parts[1]
         context.chat_data['product_code'] = code
-        title = PRODUCT_CODES[code]
         await query.edit_message_text("Выберите толщину:", reply_markup=build_thickness_keyboard(code))
     elif action == 'thickness':
         code = parts[1]
@@ -676,15 +915,15 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         code = parts[1]
         thick = int(parts[2])
         length = int(parts[3])
-        title = PRODUCT_CODES[code]
-        available_lengths = list(WALL_PRODUCTS[title][thick]['panels'].keys())
+        sku = CATALOG.wall(code, thick, length)
+        title = sku.title
         cat = 'walls'
-        item = {'category': cat, 'product_code': code, 'thickness': thick, 'length': length, 'available_lengths': available_lengths}
+        item = {'category': cat, 'product_code': code, 'thickness': thick, 'length': length}
         context.chat_data['current_item'] = item
         if context.chat_data.pop('is_admin_cost', False):
-            area_m2 = WALL_PRODUCTS[title][thick]['panels'][length]['area_m2']
-            weight_per_m2 = WALL_PRODUCTS[title][thick]['weight_per_m2']
-            price_rub = WALL_PRODUCTS[title][thick]['panels'][length]['price_rub']
+            area_m2 = sku.area_m2
+            weight_per_m2 = sku.weight_per_m2
+            price_rub = sku.price_rub
             context.chat_data['admin_cost_params'] = {
                 'title': title,
                 'thick': thick,
@@ -704,10 +943,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.chat_data['phase'] = 'custom_name'
             await query.edit_message_text("Введите название/артикул:")
         else:
-            await query.edit_message_text("Как рассчитать?", reply_markup=InlineKeyboardMarkup([
-                [InlineKeyboardButton("По размерам помещения", callback_data="calc_type|room")],
-                [InlineKeyboardButton("По количеству панелей", callback_data="calc_type|panels")],
-            ]))
+            await query.edit_message_text("Как рассчитать?", reply_markup=build_calc_type_keyboard("panels"))
     elif action == 'profile_thick':
         thick = int(parts[1])
         context.chat_data['thickness'] = thick
@@ -722,10 +958,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         slat_type = parts[1]
         item = {'category': 'slats', 'type': slat_type}
         context.chat_data['current_item'] = item
-        await query.edit_message_text("Как рассчитать?", reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("По размерам помещения", callback_data="calc_type|room")],
-            [InlineKeyboardButton("По количеству реечных панелей", callback_data="calc_type|slats")],
-        ]))
+        await query.edit_message_text("Как рассчитать?", reply_markup=build_calc_type_keyboard("slats"))
     elif action == '3d_size':
         var = parts[1]
         item = {'category': '3d', 'var': var}
@@ -736,7 +969,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         unit = parts[1]
         context.user_data['unit'] = unit
         context.chat_data['phase'] = 'wall_width'
-        await query.edit_message_text(f"Введите ширину стены ({unit}):")
+        await query.edit_message_text(wall_width_prompt(unit))
     elif action == 'slats_unit':
         unit = parts[1]
         context.user_data['unit'] = unit
@@ -768,10 +1001,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             context.chat_data['phase'] = 'okno'
         else:
             mode_text = f"Высота панели: {panel_h_m:.1f} м\nВысота помещения: {height:.1f} м\n\nКак рассчитать?"
-            kb = InlineKeyboardMarkup([
-                [InlineKeyboardButton("По высоте панели (обрезать стену)", callback_data="calc_mode|panel")],
-                [InlineKeyboardButton("По высоте помещения (стыковать панели)", callback_data="calc_mode|room")],
-            ])
+            kb = build_calc_mode_keyboard()
             await query.edit_message_text(mode_text, reply_markup=kb)
             context.chat_data['phase'] = 'calc_mode'
     elif action == 'calc_mode':
@@ -791,10 +1021,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 total_cost = sum(cost for _, cost in completed)
                 full_text += f"\n\n🎉 Общая стоимость всех материалов: {total_cost:,} ₽"
                 await query.edit_message_text(full_text)
-                stats = load_stats()
-                stats['calc_count'] += 1
-                stats['calc_today'] += 1
-                save_stats(stats)
+                stats_store.add_calc()
             else:
                 await query.edit_message_text("Расчёт не завершён. Добавьте хотя бы один материал.")
             # Reset
@@ -833,9 +1060,20 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 unit = context.user_data.get('unit', 'm')
                 calc_mode = context.chat_data.get('calc_mode')
                 panel_h_m = item.get('length', 0) / 1000 if item['category'] == 'walls' else None
-                result_text, cost = calculate_item(item, width, height, deduct, unit, calc_mode, panel_h_m)
-                context.chat_data['completed_calcs'].append((result_text, cost))
+                if item['category'] == 'compare':
+                    # Сравнение не добавляется в итоговую смету
+                    result_text = render_comparison(compare_walls(CATALOG, width, height, deduct))
+                else:
+                    result_text, cost = calculate_item(item, width, height, deduct, unit, calc_mode, panel_h_m)
+                    context.chat_data['completed_calcs'].append((result_text, cost))
                 await query.edit_message_text(result_text, parse_mode=ParseMode.HTML)
+                if item['category'] == 'walls' and calc_mode == 'room' and 'known_panels' not in item:
+                    # Стыковка по высоте: подбираем длины и раскрой вместо плоских 10% запаса
+                    plan = await asyncio.to_thread(plan_walls, CATALOG, item['product_code'], item['thickness'], [(width, height)], time_budget=CUT_PLAN_BUDGET_SEC)
+                    plan_text = render_cut_plan(plan)
+                    if plan is not None and plan.cost < cost:
+                        plan_text += f"\nЭкономия против расчёта с запасом 10%: {cost - plan.cost:,} ₽"
+                    await context.bot.send_message(query.message.chat_id, plan_text)
                 await context.bot.send_message(query.message.chat_id, "Добавить ещё материал?", reply_markup=build_add_another_keyboard())
                 context.chat_data['phase'] = None
             else:
@@ -855,11 +1093,59 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 context.chat_data['phase'] = 'slats_length'
                 await query.edit_message_text(f"Введите длину одной рейки ({unit}):")
 
+def wall_width_prompt(unit: str) -> str:
+    example = "3200x2700, 4100x2700; окна: 1400x1500 x2; дверь 900x2100" if unit == 'mm' else "3.2x2.7, 4.1x2.7; окна: 1.4x1.5 x2; дверь 0.9x2.1"
+    return f"Введите ширину стены ({unit}):\n\nИли всё помещение одним сообщением, например:\nстены: {example}"
+
+async def quote_room(update: Update, context: ContextTypes.DEFAULT_TYPE, room):
+    # Все стены и проёмы пришли одним сообщением: считаем сразу, без вопросов про окна/двери
+    item = context.chat_data['current_item']
+    unit = context.user_data.get('unit', 'm')
+    context.chat_data['wall_width_m'] = room.total_width
+    context.chat_data['wall_height_m'] = room.max_height
+    context.chat_data['deduct_area'] = room.deduct_area
+    context.chat_data['phase'] = None
+    plan_text = None
+    if item['category'] == 'compare':
+        await update.message.reply_text(
+            room.describe() + "\n\n" + render_comparison(compare_room(CATALOG, room.height_groups())) + "\n\nДобавить ещё материал?",
+            reply_markup=build_add_another_keyboard(),
+        )
+        return
+    if item['category'] == 'slats':
+        results = [calculate_item(item, room.total_width, room.max_height, 0, unit)]
+    elif item['category'] == 'walls' and 'known_panels' not in item:
+        panel_h_m = item['length'] / 1000
+        # Все стены не выше панели (с допуском 5 см) — одна панель по высоте, иначе стыкуем
+        calc_mode = 'panel' if room.max_height <= panel_h_m + 0.05 else 'room'
+        context.chat_data['calc_mode'] = calc_mode
+        groups = room.height_groups()
+        results = [calculate_item(item, width, height, deduct, unit, calc_mode, panel_h_m) for width, height, deduct in groups]
+        if calc_mode == 'room':
+            panels = sum(quote_item(CATALOG, item, width, height, deduct, calc_mode, panel_h_m).panels for width, height, deduct in groups)
+            plan = None
+            if panels <= CUT_PLAN_MAX_PANELS:
+                plan = await asyncio.to_thread(plan_walls, CATALOG, item['product_code'], item['thickness'], room.walls, time_budget=CUT_PLAN_BUDGET_SEC)
+            plan_text = render_cut_plan(plan)
+    else:
+        results = [calculate_item(item, width, height, deduct, unit) for width, height, deduct in room.height_groups()]
+    cost = sum(c for _, c in results)
+    result_text = room.describe() + "\n\n" + "\n\n".join(t.strip("\n") for t, _ in results)
+    if len(results) > 1:
+        result_text += f"\n\n💰 Итого по помещению: {cost:,} ₽"
+    context.chat_data['completed_calcs'].append((result_text, cost))
+    tail = (plan_text + "\n\n" if plan_text else "") + "Добавить ещё материал?"
+    if len(result_text) + len(tail) + 2 <= 4096:
+        await update.message.reply_text(result_text + "\n\n" + tail, parse_mode=ParseMode.HTML, reply_markup=build_add_another_keyboard())
+    else:
+        await update.message.reply_text(result_text, parse_mode=ParseMode.HTML)
+        await update.message.reply_text(tail, reply_markup=build_add_another_keyboard())
+
 async def proceed_to_wall_input(query, context):
     unit = context.user_data.get('unit')
     if unit:
         context.chat_data['phase'] = 'wall_width'
-        await query.edit_message_text(f"Введите ширину стены ({unit}):")
+        await query.edit_message_text(wall_width_prompt(unit))
     else:
         context.chat_data['phase'] = 'units'
         await query.edit_message_text("В каких единицах удобнее работать?", reply_markup=build_units_keyboard())
@@ -897,8 +1183,8 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         username = update.effective_user.username
         username_str = f"@{username}" if username else "Без никнейма"
         msg = f"Новая заявка партнёра от {username_str}:\n👤 Имя: {partner_data['name']}\n🏙️ Город: {partner_data['city']}\n📱 Тел: {partner_data['phone']}\n🔹 Роль: {partner_data['role']}\n💬 Сообщение: {partner_data['message']}"
-        for admin_id in ADMIN_CHAT_IDS:
-            await context.bot.send_message(admin_id, msg)
+        # Заявка сохраняется в очередь до ответа пользователю, отправка администраторам — в фоне
+        admin_notifier.submit(ADMIN_CHAT_IDS, msg)
         await update.message.reply_text("Спасибо! Менеджер свяжется с вами в ближайшее время.\n\n😊 Добро пожаловать в команду ECO Стены!", reply_markup=build_main_menu_keyboard())
         # Reset
         context.chat_data['phase'] = None
@@ -906,10 +1192,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         item = context.chat_data['current_item']
         item['custom_name'] = text
         context.chat_data['current_item'] = item
-        await update.message.reply_text("Как рассчитать?", reply_markup=InlineKeyboardMarkup([
-            [InlineKeyboardButton("По размерам помещения", callback_data="calc_type|room")],
-            [InlineKeyboardButton("По количеству панелей", callback_data="calc_type|panels")],
-        ]))
+        await update.message.reply_text("Как рассчитать?", reply_markup=build_calc_type_keyboard("panels"))
     elif phase == 'profile_qty':
         try:
             qty = int(text)
@@ -925,8 +1208,15 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except:
             await update.message.reply_text("Непонял количество. Попробуйте заново.")
     elif phase == 'wall_width':
+        room = parse_room(text, context.user_data.get('unit', 'm'))
+        if room is not None:
+            await quote_room(update, context, room)
+            return
         width = parse_size(text, context.user_data.get('unit', 'm'))
-        if width <= 0:
+        if width <= 0 and looks_like_room(text):
+            await update.message.reply_text("Не удалось разобрать размеры помещения.\n\n" + wall_width_prompt(context.user_data.get('unit', 'm')))
+            return
+        if width <= 0 or width > MAX_WALL_WIDTH_M:
             await update.message.reply_text("Неверное значение. Введите ширину заново:")
             return
         context.chat_data['wall_width_m'] = width
@@ -934,7 +1224,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"Введите высоту стены ({context.user_data.get('unit', 'm')}):")
     elif phase == 'wall_height':
         height = parse_size(text, context.user_data.get('unit', 'm'))
-        if height <= 0:
+        if height <= 0 or height > MAX_WALL_HEIGHT_M:
             await update.message.reply_text("Неверное значение. Введите высоту заново:")
             return
         context.chat_data['wall_height_m'] = height
@@ -946,33 +1236,17 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             panel_h_m = current_length / 1000.0
             tolerance = 0.05  # 5 см
             if abs(height - panel_h_m) > tolerance:
-                available_lengths = sorted(item['available_lengths'])
-                candidates = [l for l in available_lengths if l / 1000.0 >= height]
-                if candidates:
-                    suggested_length = min(candidates, key=lambda l: l / 1000.0)
-                else:
-                    suggested_length = max(available_lengths)
+                suggested_length, fits = CATALOG.suggest_length(item['product_code'], item['thickness'], height)
                 if suggested_length != current_length:
                     context.chat_data['suggested_length'] = suggested_length
-                    current_text = f"{current_length} мм ({current_length/1000.0:.1f} м)"
-                    suggest_m = suggested_length / 1000.0
-                    suggest_text = f"{suggested_length} мм ({suggest_m:.1f} м)"
-                    if not candidates:
-                        suggest_text += " (максимальная доступная)"
-                    text = f"Высота выбранной панели: {panel_h_m:.1f} м\nВысота помещения: {height:.1f} м\n\n💡 Рекомендую панель высотой {suggest_text} для лучшего совпадения и минимизации отходов."
-                    kb = InlineKeyboardMarkup([
-                        [InlineKeyboardButton(f"Оставить {current_text}", callback_data="choose_length|original")],
-                        [InlineKeyboardButton(f"Выбрать {suggest_text}", callback_data="choose_length|suggested")],
-                    ])
+                    text = f"Высота выбранной панели: {panel_h_m:.1f} м\nВысота помещения: {height:.1f} м\n\n💡 Рекомендую панель высотой {length_choice_text(suggested_length, fits)} для лучшего совпадения и минимизации отходов."
+                    kb = build_choose_length_keyboard(current_length, suggested_length, fits)
                     await update.message.reply_text(text, reply_markup=kb)
                     context.chat_data['phase'] = 'choose_length'
                     return
                 # Если suggested == current, то сразу к режиму
                 text = f"Высота панели: {panel_h_m:.1f} м\nВысота помещения: {height:.1f} м\n\nКак рассчитать площадь?"
-                kb = InlineKeyboardMarkup([
-                    [InlineKeyboardButton("По высоте панели (обрезать стену)", callback_data="calc_mode|panel")],
-                    [InlineKeyboardButton("По высоте помещения (стыковать панели)", callback_data="calc_mode|room")],
-                ])
+                kb = build_calc_mode_keyboard()
                 await update.message.reply_text(text, reply_markup=kb)
                 context.chat_data['phase'] = 'calc_mode'
                 return
@@ -1014,10 +1288,16 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(f"{added_text}. Ещё {more_text}? (Да/Нет)", reply_markup=build_yes_no_keyboard(yes_data, no_data))
         context.chat_data['phase'] = None  # Reset temp
     elif phase == 'broadcast':
+        context.chat_data['phase'] = None
+        if update.effective_user.id not in ADMIN_CHAT_IDS:
+            await update.message.reply_text("Доступ запрещён.")
+            return
         # Send to group
         await context.bot.send_message(TG_GROUP, text)
-        await update.message.reply_text("Рассылка отправлена!")
-        context.chat_data['phase'] = None
+        with outbox.disabled(), inline_replies.disabled():  # нужен message_id для статуса
+            status = await update.message.reply_text("Сообщение отправлено в группу. 📢 Запускаю рассылку пользователям…")
+        if not await broadcaster.start(text, update.effective_chat.id, status.message_id):
+            await status.edit_text("Сообщение отправлено в группу. Рассылка пользователям уже идёт, дождитесь окончания.")
     elif phase == 'panels_count':
         try:
             panels = int(text)
@@ -1030,10 +1310,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(result_text, parse_mode=ParseMode.HTML)
             await context.bot.send_message(update.message.chat_id, "Добавить ещё материал?", reply_markup=build_add_another_keyboard())
             context.chat_data['phase'] = None
-            stats = load_stats()
-            stats['calc_count'] += 1
-            stats['calc_today'] += 1
-            save_stats(stats)
+            stats_store.add_calc()
         except:
             await update.message.reply_text("Неверное количество. Введите заново:")
     elif phase == 'slats_length':
@@ -1052,7 +1329,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             item = context.chat_data['current_item']
             length_m = context.chat_data['slats_length_m']
             total_m = quantity * length_m
-            price_mp = SLAT_PRICES[item['type']]
+            price_mp = CATALOG.slat_prices[item['type']]
             cost = total_m * price_mp
             type_name = 'WPC' if item['type'] == 'wpc' else 'Деревянные'
             result_text = f"""
@@ -1066,10 +1343,7 @@ async def message_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(result_text)
             await context.bot.send_message(update.message.chat_id, "Добавить ещё материал?", reply_markup=build_add_another_keyboard())
             context.chat_data['phase'] = None
-            stats = load_stats()
-            stats['calc_count'] += 1
-            stats['calc_today'] += 1
-            save_stats(stats)
+            stats_store.add_calc()
         except:
             await update.message.reply_text("Неверное количество. Введите заново:")
     elif phase == 'admin_cost_yuan':
@@ -1233,66 +1507,195 @@ async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
     # for admin_id in ADMIN_CHAT_IDS:
     #     await context.bot.send_photo(admin_id, photo.file_id, caption=f"Фото от {update.effective_user.first_name}")
 
+async def touch_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Отмечаем активность для LRU выгрузки сессий
+    if update.effective_chat:
+        session_evictor.touch("chat", update.effective_chat.id)
+    if update.effective_user:
+        session_evictor.touch("user", update.effective_user.id)
+
 # ============================
 #   REGISTRATION
 # ============================
 
-# Initialize application once at startup (sync)
-asyncio.run(tg_application.initialize())
-
+tg_application.add_handler(TypeHandler(Update, touch_session), group=-1)
 tg_application.add_handler(CommandHandler("start", start))
+tg_application.add_handler(CommandHandler("traces", traces_command))
 tg_application.add_handler(CallbackQueryHandler(callback_handler))
 tg_application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, message_handler))
 tg_application.add_handler(MessageHandler(filters.PHOTO, handle_photo))
+tg_application.add_error_handler(on_error)
 
 # ============================
 #   WEBHOOK SETUP WITH DEBUG
 # ============================
 
-async def setup_webhook(application: Application, webhook_url: str):
-    # Ждём стабилизации loop (фикс для RuntimeError)
-    await asyncio.sleep(0.1)
-    
-    # Сначала удаляем старый webhook, чтобы очистить last_error
+def webhook_target_url(webhook_url: str) -> str:
+    # Telegram не показывает секрет в get_webhook_info, поэтому его отпечаток
+    # добавляется в URL: смена секрета меняет URL и webhook перерегистрируется
+    url = f"{webhook_url}/{TG_BOT_TOKEN}"
+    if WEBHOOK_SECRET:
+        url += "?s=" + hashlib.sha256(WEBHOOK_SECRET.encode()).hexdigest()[:12]
+    return url
+
+def webhook_changes(info, url: str) -> list:
+    # Чем текущая регистрация отличается от нужной (пусто — ничего делать не надо)
+    if info is None:
+        return ["unknown"]
+    changes = []
+    if info.url != url:
+        changes.append("url")
+    if sorted(info.allowed_updates or ()) != sorted(WEBHOOK_ALLOWED_UPDATES):
+        changes.append("allowed_updates")
+    return changes
+
+async def setup_webhook(application: Application, webhook_url: str) -> dict:
+    # Регистрируем webhook, только если в Telegram записано не то, что нужно.
+    # Апдейты, накопившиеся за время деплоя, не сбрасываем — они придут после старта
+    timings = {}
+    url = webhook_target_url(webhook_url)
+    started = time.perf_counter()
     try:
-        await application.bot.delete_webhook(drop_pending_updates=True)
-        logger.info("Old webhook deleted, pending updates dropped.")
-    except (TelegramError, RuntimeError) as e:
-        logger.warning(f"Failed to delete old webhook: {e} (may not exist)")
+        info = await application.bot.get_webhook_info()
+    except TelegramError as e:
+        logger.warning(f"Failed to get webhook info: {e}")
+        info = None
+    timings["get_webhook_info"] = (time.perf_counter() - started) * 1000
+
+    changes = webhook_changes(info, url)
+    if changes:
+        step = time.perf_counter()
+        await application.bot.set_webhook(url=url, allowed_updates=WEBHOOK_ALLOWED_UPDATES, secret_token=WEBHOOK_SECRET or None)
+        timings["set_webhook"] = (time.perf_counter() - step) * 1000
+        logger.info(f"Webhook set to {url} (changed: {', '.join(changes)})")
+    else:
+        logger.info("Webhook already registered, skipping set_webhook")
+    if info is not None:
+        logger.info(f"Webhook info: pending_updates={info.pending_update_count}, last_error={info.last_error_date} {info.last_error_message or ''}")
+    timings["total"] = (time.perf_counter() - started) * 1000
+    logger.info("Webhook setup: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in timings.items()))
+    return timings
+
+# Состояние регистрации webhook для health check: pending -> ok | retrying -> failed
+webhook_status = {"state": "pending", "attempts": 0, "error": None}
+
+async def register_webhook(application: Application, webhook_url: str):
+    # setup_webhook() с повторами; если все попытки неудачны, health check отвечает 503,
+    # чтобы деплой с неверным WEBHOOK_URL не выглядел здоровым
+    delay = WEBHOOK_SETUP_RETRY_SEC
+    for attempt in range(1, WEBHOOK_SETUP_ATTEMPTS + 1):
+        webhook_status["attempts"] = attempt
+        try:
+            await setup_webhook(application, webhook_url)
+        except TelegramError as e:
+            webhook_status["error"] = str(e)
+            if attempt == WEBHOOK_SETUP_ATTEMPTS:
+                webhook_status["state"] = "failed"
+                raise
+            webhook_status["state"] = "retrying"
+            logger.warning(f"Webhook setup attempt {attempt} failed: {e}; retrying in {delay:g}s")
+            await asyncio.sleep(delay)
+            delay *= 2
+        else:
+            webhook_status.update(state="ok", error=None)
+            return
 
-    webhook_path = f"{webhook_url}/{TG_BOT_TOKEN}"
-    await application.bot.set_webhook(url=webhook_path)
-    logger.info(f"New webhook set to: {webhook_path}")
+# ============================
+#   ASGI WEBHOOK SERVER
+# ============================
 
-    # Check webhook info
-    info = await application.bot.get_webhook_info()
-    logger.info(f"Webhook info: url={info.url}, pending_updates={info.pending_update_count}, last_error={info.last_error_date}")
+# Один event loop на всё: uvicorn обслуживает HTTP, tg_application живёт в том же loop,
+# поэтому апдейты разных чатов обрабатываются конкурентно, а не по одному.
 
-@app.route("/", methods=["GET"])
-def health():
-    return "OK", 200
+async def health(request: Request):
+    if webhook_status["state"] == "failed":
+        return PlainTextResponse(f"Webhook registration failed: {webhook_status['error']}", status_code=503)
+    return PlainTextResponse("OK", status_code=200)
 
-@app.route(f"/{TG_BOT_TOKEN}", methods=["GET", "POST"])
-def webhook():
+async def webhook(request: Request):
     if request.method == "GET":
         # Игнорируем GET (health check или probe) — просто OK
-        return jsonify({"ok": True, "method": "GET"}), 200
-    
-    if request.method == "POST":
+        body = {"ok": True, "method": "GET", "scheduler": chat_scheduler.stats(), "dedup": update_dedup.stats(), "sessions": session_evictor.stats(), "quotes": quote_cache_stats(), "admin_queue": admin_notifier.stats(), "media": media_cache.stats(), "inline_reply": inline_replies.stats(), "outbound": outbox.stats(), "startup": {**startup_timeline.report(), "webhook": webhook_status}, "tracing": tracer.stats(), "profiler": profiler.stats()}
+        if WEBHOOK_FAST_ACK:
+            body["queue"] = update_queue.stats()
+        return JSONResponse(body, status_code=200)
+
+    if WEBHOOK_SECRET and not hmac.compare_digest(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), WEBHOOK_SECRET):
+        logger.warning("Webhook request with wrong secret token rejected")
+        return JSONResponse({"ok": False}, status_code=403)
+
+    update_id = None
+    with span("webhook", root=True):
         try:
-            update_json = request.get_json()
+            with span("json_decode"):
+                update_json = await request.json()
             logger.info(f"Received update: {json.dumps(update_json, indent=2)[:200]}...")
-            if update_json:
-                update = Update.de_json(update_json, tg_application.bot)
-                loop = get_event_loop()
-                loop.run_until_complete(tg_application.process_update(update))
-                return jsonify({"ok": True})
+            if isinstance(update_json, dict) and isinstance(update_json.get("update_id"), int):
+                update_id = update_json["update_id"]
+                if not update_dedup.check_and_mark(update_id):
+                    logger.info(f"Duplicate update {update_id} dropped")
+                    return JSONResponse({"ok": True})
+                with span("de_json"):
+                    update = Update.de_json(update_json, tg_application.bot)
+                if WEBHOOK_FAST_ACK:
+                    if not update_queue.submit(update):
+                        update_dedup.forget(update_id)
+                        logger.warning(f"Update queue full, rejecting update {update.update_id}")
+                        return JSONResponse({"ok": False, "error": "queue full"}, status_code=503, headers={"Retry-After": "1"})
+                    return JSONResponse({"ok": True})
+                if WEBHOOK_INLINE_REPLY:
+                    with inline_replies.capture() as slot:
+                        await chat_scheduler.run(update)
+                    return JSONResponse(inline_replies.response(slot) or {"ok": True})
+                await chat_scheduler.run(update)
+                return JSONResponse({"ok": True})
             else:
-                logger.warning("Empty update received")
-                return jsonify({"ok": False}), 400
+                logger.warning("Empty or invalid update received")
+                return JSONResponse({"ok": False}, status_code=400)
         except Exception as e:
+            if update_id is not None:
+                # Повтор от Telegram после 500 должен обработаться заново
+                update_dedup.forget(update_id)
+            metrics.inc("errors_total", "webhook")
             logger.error(f"Error processing update: {e}")
-            return jsonify({"ok": False, "error": str(e)}), 500
+            return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
+
+async def metrics_endpoint(request: Request):
+    # Только с токеном: Authorization: Bearer <METRICS_TOKEN> (bearer_token в Prometheus)
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return PlainTextResponse("Unauthorized", status_code=401, headers={"WWW-Authenticate": "Bearer"})
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@contextlib.asynccontextmanager
+async def lifespan(_app: Starlette):
+    # initialize/start/stop/shutdown выполняются в loop сервера
+    async with tg_application:
+        startup_timeline.phase("initialize")
+        await tg_application.start()
+        await on_startup(tg_application)
+        if WEBHOOK_FAST_ACK:
+            await update_queue.start()
+        webhook_url = os.getenv("WEBHOOK_URL")
+        if webhook_url:
+            # Уже зарегистрированный webhook начнёт слать апдейты, как только сервер
+            # готов; проверка/перерегистрация идёт параллельно с их обработкой
+            startup_timeline.run_in_background("webhook", register_webhook(tg_application, webhook_url))
+        yield
+        if WEBHOOK_FAST_ACK:
+            await update_queue.stop()
+        await on_stop(tg_application)
+        await tg_application.stop()
+    await on_shutdown(tg_application)
+
+app = Starlette(
+    routes=[
+        Route("/", health, methods=["GET"]),
+        *([Route("/metrics", metrics_endpoint, methods=["GET"])] if METRICS_TOKEN else []),
+        Route(f"/{TG_BOT_TOKEN}", webhook, methods=["GET", "POST"]),
+    ],
+    lifespan=lifespan,
+)
+startup_timeline.phase("import")
 
 # ============================
 #   MAIN
@@ -1302,14 +1705,11 @@ def main():
     port = int(os.getenv("PORT", 8443))
     webhook_url = os.getenv("WEBHOOK_URL")
     if webhook_url:
-        # Setup webhook in async context
-        loop = get_event_loop()
-        loop.run_until_complete(setup_webhook(tg_application, webhook_url))
-        logger.info("Starting Flask server with webhook mode")
-        app.run(host="0.0.0.0", port=port, debug=False)
+        logger.info("Starting ASGI server with webhook mode")
+        uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
     else:
         logger.info("No WEBHOOK_URL, starting polling")
-        asyncio.run(tg_application.run_polling())
+        tg_application.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+import os
+
+from telegram.error import BadRequest, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   КЭШ FILE_ID
+# ============================
+
+# Фото и документы по URL Telegram каждый раз скачивает заново, это медленно
+# и иногда падает по таймауту. После первой отправки запоминаем file_id,
+# дальше шлём его. Карта url -> file_id хранится в файле; file_id действителен
+# только для того бота, который его получил, поэтому в файле есть id бота.
+# Если file_id перестал приниматься (BadRequest), забываем его и шлём по URL.
+#
+# warm() при старте отправляет файлы служебным сообщением (без звука) и сразу
+# его удаляет — первый пользователь получит уже file_id. Только если файла
+# кэша нет (первый запуск, другой бот): обычный рестарт в чат ничего не шлёт,
+# а новые файлы кэшируются при первой отправке.
+
+_KINDS = {
+    "photo": ("send_photo", "photo"),
+    "document": ("send_document", "document"),
+}
+
+class MediaCache:
+    def __init__(self, bot, state_file):
+        self.bot = bot
+        self.state_file = state_file
+        self.file_ids = {}
+        self.loaded = False  # кэш этого бота прочитан из файла
+        self.counters = {"hits": 0, "misses": 0, "stale": 0}
+        self._task = None
+
+    def load(self):
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load media cache: {e}")
+            return
+        if state.get("bot_id") == self.bot.id:
+            self.file_ids = state.get("file_ids", {})
+            self.loaded = True
+
+    def _save(self):
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump({"bot_id": self.bot.id, "file_ids": self.file_ids}, f)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.error(f"Failed to save media cache: {e}")
+
+    async def _send(self, kind: str, chat_id, media: str, **kwargs):
+        method, field = _KINDS[kind]
+        return await getattr(self.bot, method)(chat_id=chat_id, **{field: media}, **kwargs)
+
+    def _remember(self, url: str, kind: str, message):
+        if kind == "photo":
+            attachment = message.photo[-1] if message.photo else None
+        else:
+            attachment = message.document
+        if attachment is not None and self.file_ids.get(url) != attachment.file_id:
+            self.file_ids[url] = attachment.file_id
+            self._save()
+
+    async def send(self, kind: str, chat_id, url: str, **kwargs):
+        file_id = self.file_ids.get(url)
+        if file_id:
+            try:
+                message = await self._send(kind, chat_id, file_id, **kwargs)
+                self.counters["hits"] += 1
+                return message
+            except BadRequest as e:
+                logger.warning(f"Cached file_id for {url} rejected, resending by URL: {e}")
+                self.counters["stale"] += 1
+                self.file_ids.pop(url, None)
+                self._save()
+        self.counters["misses"] += 1
+        message = await self._send(kind, chat_id, url, **kwargs)
+        self._remember(url, kind, message)
+        return message
+
+    async def _warm_one(self, kind: str, url: str, chat_id):
+        try:
+            message = await self._send(kind, chat_id, url, disable_notification=True)
+            self._remember(url, kind, message)
+            await message.delete()
+        except TelegramError as e:
+            logger.warning(f"Media warm-up failed for {url}: {e}")
+
+    async def _warm(self, media: dict, chat_id):
+        missing = [(kind, url) for url, kind in media.items() if url not in self.file_ids]
+        await asyncio.gather(*(self._warm_one(kind, url, chat_id) for kind, url in missing))
+        if missing:
+            logger.info(f"Media warm-up: {len(self.file_ids)}/{len(media)} cached")
+
+    def warm(self, media: dict, chat_id):
+        # media: {url: "photo" | "document"}; выполняется в фоне, старт не задерживает
+        if chat_id and not self.loaded and self._task is None:
+            self._task = asyncio.create_task(self._warm(media, chat_id), name="media-warmup")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return {"cached": len(self.file_ids), **self.counters}
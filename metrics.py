@@ -0,0 +1,126 @@
+import math
+from bisect import bisect_left
+
+# ============================
+#   МЕТРИКИ (PROMETHEUS)
+# ============================
+
+# Счётчики и гистограммы в текстовом формате Prometheus (/metrics), без
+# сторонних библиотек. Всё пишется из event loop (один поток), поэтому
+# блокировки не нужны: запись — это bisect + два сложения.
+# Число рядов (комбинаций меток) на метрику ограничено MAX_SERIES: лишние
+# попадают в ряд с меткой "other", чтобы случайные данные не раздували память.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_SERIES = 200
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последний — +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + "}"
+
+def _number(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+class _Family:
+    __slots__ = ("name", "kind", "help", "labels", "series", "buckets")
+
+    def __init__(self, name, kind, help_text, labels, buckets=None):
+        self.name = name
+        self.kind = kind
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.series = {}
+        self.buckets = buckets
+
+    def get(self, values: tuple):
+        series = self.series.get(values)
+        if series is None:
+            if len(self.series) >= MAX_SERIES:
+                values = ("other",) * len(self.labels)
+                series = self.series.get(values)
+                if series is not None:
+                    return series, values
+            series = Histogram(self.buckets) if self.kind == "histogram" else 0
+            self.series[values] = series
+        return series, values
+
+class Metrics:
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._families = {}
+        self._gauge_fns = []  # (имя, help, функция) — значение считается при выдаче
+
+    def _family(self, name, kind, help_text, labels, buckets=None):
+        family = self._families.get(name)
+        if family is None:
+            family = self._families[name] = _Family(self.prefix + name, kind, help_text, labels, buckets)
+        return family
+
+    def counter(self, name: str, help_text: str, labels=()):
+        self._family(name, "counter", help_text, labels)
+
+    def gauge(self, name: str, help_text: str, labels=()):
+        self._family(name, "gauge", help_text, labels)
+
+    def histogram(self, name: str, help_text: str, labels=(), buckets=LATENCY_BUCKETS):
+        self._family(name, "histogram", help_text, labels, buckets)
+
+    def gauge_fn(self, name: str, help_text: str, fn):
+        self._gauge_fns.append((self.prefix + name, help_text, fn))
+
+    def inc(self, name: str, *labels, value=1):
+        family = self._families[name]
+        current, key = family.get(labels)
+        family.series[key] = current + value
+
+    def dec(self, name: str, *labels, value=1):
+        self.inc(name, *labels, value=-value)
+
+    def observe(self, name: str, seconds: float, *labels):
+        histogram, _ = self._families[name].get(labels)
+        histogram.observe(seconds)
+
+    def render(self) -> str:
+        lines = []
+        for family in self._families.values():
+            lines.append(f"# HELP {family.name} {family.help}")
+            lines.append(f"# TYPE {family.name} {family.kind}")
+            for values, series in family.series.items():
+                labels = _labels(family.labels, values)
+                if family.kind != "histogram":
+                    lines.append(f"{family.name}{labels} {_number(series)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(family.buckets + (math.inf,), series.counts):
+                    cumulative += count
+                    bucket_labels = _labels(family.labels + ("le",), values + (_number(float(bound)),))
+                    lines.append(f"{family.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{family.name}_sum{labels} {_number(series.sum)}")
+                lines.append(f"{family.name}_count{labels} {series.count}")
+        for name, help_text, fn in self._gauge_fns:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {_number(fn())}")
+        return "\n".join(lines) + "\n"
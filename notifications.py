@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+
+from telegram.error import RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   УВЕДОМЛЕНИЯ АДМИНИСТРАТОРАМ
+# ============================
+
+# Заявки партнёров рассылаются всем администраторам параллельно, в фоне —
+# пользователь получает ответ, не дожидаясь Telegram. Каждое сообщение
+# (администратор + текст) сначала записывается в очередь на диске, и только
+# потом отправляется; удаляется из очереди после успешной отправки.
+# Неудачная отправка повторяется с экспоненциальной задержкой (до max_delay),
+# без ограничения числа попыток: заявка не теряется ни при ошибках Telegram,
+# ни при рестарте (после рестарта очередь дочитывается из файла).
+# Если процесс остановился во время отправки, сообщение может прийти дважды.
+
+class AdminNotifier:
+    def __init__(self, bot, state_file, base_delay=5.0, max_delay=900.0):
+        self.bot = bot
+        self.state_file = state_file
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.pending = {}      # id -> {"chat_id", "text", "attempts", "due"}
+        self.counters = {"sent": 0, "retried": 0}
+        self._ids = itertools.count(1)
+        self._inflight = {}    # id -> Task
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def load(self):
+        try:
+            with open(self.state_file) as f:
+                self.pending = {int(k): v for k, v in json.load(f).items()}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to load admin notification queue: {e}")
+            return
+        self._ids = itertools.count(max(self.pending, default=0) + 1)
+        if self.pending:
+            logger.info(f"Admin notification queue: {len(self.pending)} pending")
+
+    def _save(self):
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(self.pending, f, ensure_ascii=False)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.error(f"Failed to save admin notification queue: {e}")
+
+    def submit(self, chat_ids, text: str):
+        # Записать в очередь и сразу начать отправку всем получателям параллельно
+        jobs = []
+        for chat_id in chat_ids:
+            job_id = next(self._ids)
+            self.pending[job_id] = {"chat_id": chat_id, "text": text, "attempts": 0, "due": 0.0}
+            jobs.append(job_id)
+        self._save()
+        for job_id in jobs:
+            self._spawn(job_id)
+
+    def _spawn(self, job_id: int):
+        if job_id not in self._inflight:
+            self._inflight[job_id] = asyncio.create_task(self._deliver(job_id), name=f"notify-{job_id}")
+
+    async def _deliver(self, job_id: int):
+        job = self.pending[job_id]
+        try:
+            await self.bot.send_message(job["chat_id"], job["text"])
+        except RetryAfter as e:
+            self._reschedule(job_id, float(e.retry_after), e)
+        except TelegramError as e:
+            self._reschedule(job_id, min(self.max_delay, self.base_delay * 2 ** job["attempts"]), e)
+        else:
+            del self.pending[job_id]
+            self.counters["sent"] += 1
+            self._save()
+        finally:
+            self._inflight.pop(job_id, None)
+
+    def _reschedule(self, job_id: int, delay: float, error):
+        job = self.pending[job_id]
+        job["attempts"] += 1
+        job["due"] = time.time() + delay
+        self.counters["retried"] += 1
+        logger.warning(f"Admin notification to {job['chat_id']} failed (attempt {job['attempts']}), retry in {delay:.0f}s: {error}")
+        self._save()
+        self._wake.set()
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            waiting = [job_id for job_id in self.pending if job_id not in self._inflight]
+            for job_id in waiting:
+                if self.pending[job_id]["due"] <= now:
+                    self._spawn(job_id)
+            later = [self.pending[job_id]["due"] for job_id in waiting if self.pending[job_id]["due"] > now]
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=min(later) - now if later else None)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        # Повторы по расписанию + дочитывание очереди, оставшейся с прошлого запуска
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="admin-notifier")
+
+    async def stop(self):
+        tasks = list(self._inflight.values())
+        if self._task is not None:
+            tasks.append(self._task)
+            self._task = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._inflight.clear()
+        self._save()
+
+    def stats(self) -> dict:
+        return {"pending": len(self.pending), "inflight": len(self._inflight), **self.counters}
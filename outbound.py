@@ -0,0 +1,179 @@
+import asyncio
+import contextlib
+import html
+import logging
+
+from telegram import InlineKeyboardMarkup
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ИСХОДЯЩИЕ ВЫЗОВЫ АПДЕЙТА
+# ============================
+
+# Все вызовы Bot API, сделанные при обработке одного апдейта, проходят через
+# Outbox (EcoBot._do_post), границы апдейта задаёт EcoApplication.process_update.
+#
+# 1. Нажатие кнопки подтверждается автоматически: answer() уходит отдельной
+#    задачей параллельно с первым другим вызовом обработчика (или по его
+#    завершении, если вызовов не было). Если обработчик отвечает на нажатие
+#    сам (с текстом) до других вызовов — а в боте так и есть, — автоответ не
+#    отправляется и гонки нет; ответ после других вызовов пропускается.
+# 2. Текст без клавиатуры (sendMessage/editMessageText) придерживается до
+#    следующего вызова. Если следующий — sendMessage в тот же чат с
+#    клавиатурой, оба текста уходят одним сообщением ("результат" +
+#    "Добавить ещё материал?" с кнопками). Иначе придержанное отправляется
+#    первым, порядок не меняется; в конце апдейта отправляется всё, что осталось.
+#    Придержанный вызов возвращает обработчику True; где нужен Message,
+#    вызов оборачивается в disabled().
+# 3. Счётчик вызовов API на апдейт (включая автоответ).
+
+HOLD_METHODS = frozenset({"sendMessage", "editMessageText"})
+_MERGE_PARSE_MODES = (None, ParseMode.HTML)
+
+class _Scope:
+    __slots__ = ("held", "enabled", "calls", "query", "answered")
+
+    def __init__(self):
+        self.held = None     # (endpoint, data, kwargs)
+        self.enabled = True
+        self.calls = 0
+        self.query = None    # callback query, ещё не подтверждённый
+        self.answered = False
+
+def _joined_text(first: dict, second: dict):
+    # Текст двух сообщений одним (с учётом parse_mode) или None, если склеить нельзя
+    modes = {first.get("parse_mode"), second.get("parse_mode")}
+    if not modes <= set(_MERGE_PARSE_MODES) or "entities" in first or "entities" in second:
+        return None, None
+    parse_mode = ParseMode.HTML if ParseMode.HTML in modes else None
+    texts = [
+        html.escape(part["text"], quote=False) if parse_mode and part.get("parse_mode") is None else part["text"]
+        for part in (first, second)
+    ]
+    text = texts[0].rstrip("\n") + "\n\n" + texts[1]
+    if len(text) > MessageLimit.MAX_TEXT_LENGTH:
+        return None, None
+    return text, parse_mode
+
+class Outbox:
+    def __init__(self):
+        self._scopes = {}  # Task -> _Scope
+        self._acks = set()
+        self.counters = {"updates": 0, "calls": 0, "max_calls": 0, "merged": 0, "auto_acks": 0, "skipped_answers": 0}
+        self.histogram = {}  # вызовов за апдейт -> число апдейтов
+
+    def _active(self):
+        return self._scopes.get(asyncio.current_task())
+
+    @contextlib.asynccontextmanager
+    async def scope(self, update, send):
+        task = asyncio.current_task()
+        scope = _Scope()
+        self._scopes[task] = scope
+        scope.query = getattr(update, "callback_query", None)
+        try:
+            yield scope
+        finally:
+            self._auto_answer(scope)
+            try:
+                if scope.held is not None:
+                    held, scope.held = scope.held, None
+                    await self._send(scope, send, *held)
+            except TelegramError as e:
+                logger.error(f"Failed to send held message: {e}")
+            finally:
+                del self._scopes[task]
+                self._account(scope)
+
+    def _account(self, scope):
+        self.counters["updates"] += 1
+        self.counters["calls"] += scope.calls
+        self.counters["max_calls"] = max(self.counters["max_calls"], scope.calls)
+        self.histogram[scope.calls] = self.histogram.get(scope.calls, 0) + 1
+
+    def _auto_answer(self, scope):
+        # Подтвердить нажатие отдельной задачей, если обработчик ещё не ответил сам
+        if scope.query is None or scope.answered:
+            return
+        scope.answered = True
+        scope.calls += 1
+        self.counters["auto_acks"] += 1
+        ack = asyncio.create_task(self._answer(scope.query), name=f"ack-{scope.query.id}")
+        self._acks.add(ack)
+        ack.add_done_callback(self._acks.discard)
+
+    async def _answer(self, query):
+        try:
+            await query.answer()
+        except TelegramError as e:
+            logger.warning(f"Failed to acknowledge callback query: {e}")
+
+    @contextlib.contextmanager
+    def disabled(self):
+        scope = self._active()
+        if scope is None:
+            yield
+            return
+        enabled, scope.enabled = scope.enabled, False
+        try:
+            yield
+        finally:
+            scope.enabled = enabled
+
+    async def _send(self, scope, send, endpoint, data, kwargs):
+        scope.calls += 1
+        return await send(endpoint, data, kwargs)
+
+    def _merge(self, held, endpoint, data) -> bool:
+        held_endpoint, held_data, _ = held
+        markup = data.get("reply_markup")
+        if endpoint != "sendMessage" or markup is None or "text" not in data:
+            return False
+        if str(held_data.get("chat_id")) != str(data.get("chat_id")):
+            return False
+        if held_endpoint == "editMessageText" and not isinstance(markup, InlineKeyboardMarkup):
+            return False
+        text, parse_mode = _joined_text(held_data, data)
+        if text is None:
+            return False
+        held_data["text"] = text
+        held_data.pop("parse_mode", None)
+        if parse_mode:
+            held_data["parse_mode"] = parse_mode
+        held_data["reply_markup"] = markup
+        return True
+
+    async def post(self, endpoint: str, data: dict, kwargs: dict, send):
+        # send(endpoint, data, kwargs) — настоящая отправка
+        scope = self._active()
+        if scope is None:
+            return await send(endpoint, data, kwargs)
+        if endpoint == "answerCallbackQuery" and scope.query is not None:
+            if scope.answered:
+                self.counters["skipped_answers"] += 1
+                logger.warning(f"Callback query already acknowledged, answer dropped: {data.get('text')!r}")
+                return True
+            scope.answered = True
+        else:
+            self._auto_answer(scope)
+        if scope.held is not None:
+            held, scope.held = scope.held, None
+            if self._merge(held, endpoint, data):
+                self.counters["merged"] += 1
+                return await self._send(scope, send, *held)
+            await self._send(scope, send, *held)
+        if scope.enabled and endpoint in HOLD_METHODS and "reply_markup" not in data and "text" in data:
+            scope.held = (endpoint, data, kwargs)
+            return True
+        return await self._send(scope, send, endpoint, data, kwargs)
+
+    def stats(self) -> dict:
+        updates = self.counters["updates"]
+        return {
+            **self.counters,
+            "calls_per_update": round(self.counters["calls"] / updates, 2) if updates else 0.0,
+            "histogram": dict(sorted(self.histogram.items())),
+        }
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import pickle
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from userset import UserIdSet
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ХРАНЕНИЕ СЕССИЙ
+# ============================
+
+# chat_data / user_data переживают рестарт и деплой. Application сам помечает
+# изменённые чаты и раз в update_interval секунд (и при остановке) передаёт их
+# сюда; мы копим их в буфере и пишем одной транзакцией в SQLite (WAL) в
+# отдельном потоке, так что на каждый апдейт записи на диск нет.
+#
+# Соединение одно, и всё обращение к базе (загрузка, запись, подгрузка
+# выгруженных сессий, закрытие) идёт через исполнитель с одним потоком:
+# запросы не пересекаются и не блокируют event loop.
+#
+# Сериализация: pickle (highest protocol), больше 512 байт — ещё и zlib.
+# Первый байт записи — флаг сжатия.
+#
+# Сессии, выгруженные из памяти (см. sessions.py), и сессии старше load_ttl
+# при старте не держатся в памяти: их id лежат в UserIdSet, а данные
+# подтягиваются из базы в refresh_*_data, когда пользователь возвращается.
+
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+def dumps(data) -> bytes:
+    raw = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(raw) > 512:
+        return _ZLIB + zlib.compress(raw, 6)
+    return _RAW + raw
+
+def loads(blob: bytes):
+    if blob[:1] == _ZLIB:
+        return pickle.loads(zlib.decompress(blob[1:]))
+    return pickle.loads(blob[1:])
+
+class SqlitePersistence(BasePersistence):
+    def __init__(self, path, update_interval=60, load_ttl=None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=True, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.path = path
+        self.load_ttl = load_ttl
+        self._evicted = {"chat": UserIdSet(), "user": UserIdSet()}
+        self._conn = None
+        self._executor = None
+        self._pending = {}  # (kind, id) -> bytes или None (удалить)
+        self._flush_task = None
+        self.counters = {"batches": 0, "rows_written": 0, "rows_deleted": 0, "restored": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "kind TEXT NOT NULL, id INTEGER NOT NULL, data BLOB NOT NULL, updated REAL NOT NULL, "
+                "PRIMARY KEY (kind, id))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    async def _db(self, func, *args):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sessions-db")
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _load_kind(self, kind: str) -> dict:
+        result = {}
+        since = time.time() - self.load_ttl if self.load_ttl else 0
+        try:
+            rows = self._connect().execute("SELECT id, data, updated FROM sessions WHERE kind = ?", (kind,)).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to load {kind} sessions: {e}")
+            return result
+        for key, blob, updated in rows:
+            if updated < since:
+                self._evicted[kind].add(key)
+                continue
+            try:
+                result[key] = loads(blob)
+            except Exception as e:
+                logger.warning(f"Skipping broken {kind} session {key}: {e}")
+        logger.info(f"Loaded {len(result)} {kind} sessions from {self.path}, {len(self._evicted[kind])} left on disk")
+        return result
+
+    def _write(self, batch: dict):
+        conn = self._connect()
+        now = time.time()
+        upserts = [(kind, key, blob, now) for (kind, key), blob in batch.items() if blob is not None]
+        deletes = [(kind, key) for (kind, key), blob in batch.items() if blob is None]
+        with conn:
+            if upserts:
+                conn.executemany(
+                    "INSERT INTO sessions (kind, id, data, updated) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(kind, id) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+                    upserts,
+                )
+            if deletes:
+                conn.executemany("DELETE FROM sessions WHERE kind = ? AND id = ?", deletes)
+        self.counters["batches"] += 1
+        self.counters["rows_written"] += len(upserts)
+        self.counters["rows_deleted"] += len(deletes)
+
+    async def _flush_pending(self):
+        # Даём Application дослать весь текущий пакет, затем пишем его одной транзакцией
+        await asyncio.sleep(0)
+        try:
+            while self._pending:
+                batch, self._pending = self._pending, {}
+                try:
+                    await self._db(self._write, batch)
+                except sqlite3.Error as e:
+                    logger.error(f"Failed to persist {len(batch)} sessions: {e}")
+                    # Вернём в буфер, чтобы записать в следующий раз (новые данные важнее)
+                    for key, blob in batch.items():
+                        self._pending.setdefault(key, blob)
+                    break
+        finally:
+            self._flush_task = None
+
+    def _schedule(self, kind: str, key: int, blob):
+        self._pending[(kind, key)] = blob
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_pending())
+
+    def stage(self, kind: str, key: int, data: dict):
+        # Сессия выгружается из памяти: сохранить и запомнить, что она на диске
+        self._schedule(kind, key, dumps(data))
+        self._evicted[kind].add(key)
+
+    def _fetch(self, kind: str, key: int):
+        row = self._connect().execute("SELECT data FROM sessions WHERE kind = ? AND id = ?", (kind, key)).fetchone()
+        return row[0] if row else None
+
+    async def _restore(self, kind: str, key: int, data: dict):
+        if key not in self._evicted[kind]:
+            return
+        self._evicted[kind].discard(key)
+        blob = self._pending.get((kind, key))
+        if blob is None:
+            try:
+                blob = await self._db(self._fetch, kind, key)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to restore {kind} session {key}: {e}")
+                return
+        if blob is None:
+            return
+        try:
+            restored = loads(blob)
+        except Exception as e:
+            logger.warning(f"Skipping broken {kind} session {key}: {e}")
+            return
+        # Пришедшее в этом апдейте важнее сохранённого
+        for k, v in restored.items():
+            data.setdefault(k, v)
+        self.counters["restored"] += 1
+
+    async def get_chat_data(self) -> dict:
+        return await self._db(self._load_kind, "chat")
+
+    async def get_user_data(self) -> dict:
+        return await self._db(self._load_kind, "user")
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}
+
+    async def update_conversation(self, name, key, new_state) -> None:
+        pass
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._schedule("chat", chat_id, dumps(data))
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._schedule("user", user_id, dumps(data))
+
+    async def update_bot_data(self, data) -> None:
+        pass
+
+    async def update_callback_data(self, data) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._evicted["chat"].discard(chat_id)
+        self._schedule("chat", chat_id, None)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._evicted["user"].discard(user_id)
+        self._schedule("user", user_id, None)
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        await self._restore("chat", chat_id, chat_data)
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        await self._restore("user", user_id, user_data)
+
+    async def refresh_bot_data(self, bot_data) -> None:
+        pass
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await self._flush_task
+        if self._pending:
+            batch, self._pending = self._pending, {}
+            try:
+                await self._db(self._write, batch)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to flush {len(batch)} sessions: {e}")
+        if self._executor is not None:
+            await self._db(self._close)
+            self._executor.shutdown()
+            self._executor = None
+        logger.info(f"Sessions flushed: {self.counters}")
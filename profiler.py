@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from io import BytesIO
+
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ПРОФИЛИРОВАНИЕ ПО ЗАПРОСУ
+# ============================
+
+# Запускается администратором из меню, без рестарта и доступа к серверу.
+# Результат приходит документом (файл собирается в памяти, в BytesIO).
+#
+# CPU: отдельный поток раз в interval снимает стеки всех потоков процесса
+# (sys._current_frames) и считает одинаковые стеки. Это сэмплирование: код
+# бота не инструментируется, нагрузка — доли процента при 100 Гц. Файл —
+# collapsed stacks ("поток;функция;функция N"), его понимают flamegraph.pl,
+# speedscope и inferno. Простой event loop виден как стек в select().
+#
+# Память: tracemalloc включается на заданное время (если не был включён) —
+# в снимок попадают блоки, выделенные за это время и ещё живые, с местом
+# выделения. Пока tracemalloc включён, аллокации заметно дороже, поэтому он
+# сразу выключается. Одновременно идёт не больше одного профилирования.
+
+KINDS = ("cpu", "memory")
+
+def _path_prefixes():
+    # Длинные префиксы первыми: site-packages раньше /usr/lib/python3
+    paths = {os.path.join(os.path.abspath(p), "") for p in sys.path if p}
+    return sorted(paths, key=len, reverse=True)
+
+class Profiler:
+    def __init__(self, bot, interval=0.01, memory_frames=1, top=40):
+        self.bot = bot
+        self.interval = interval
+        self.memory_frames = memory_frames
+        self.top = top
+        self.kind = None
+        self.counters = {"cpu": 0, "memory": 0, "samples": 0, "failed": 0}
+        self._task = None
+        self._stop = threading.Event()  # останавливает поток сэмплирования
+        self._prefixes = _path_prefixes()
+        self._labels = {}  # code -> "функция (файл:строка)"
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self, kind: str, seconds: float, chat_id) -> bool:
+        if self.running:
+            return False
+        self.kind = kind
+        self._stop = threading.Event()
+        self._task = asyncio.create_task(self._run(kind, seconds, chat_id), name=f"profile-{kind}")
+        return True
+
+    async def stop(self):
+        # Отмена задачи не останавливает поток to_thread: ему нужен сигнал,
+        # иначе остановка процесса ждала бы конца сэмплирования (до 300 с)
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _run(self, kind: str, seconds: float, chat_id):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        try:
+            if kind == "cpu":
+                data, caption, samples = await asyncio.to_thread(self._sample_cpu, seconds, self._stop)
+                self.counters["samples"] += samples
+                filename = f"cpu-{stamp}.collapsed"
+            else:
+                data, caption = await self._snapshot_memory(seconds)
+                filename = f"memory-{stamp}.txt"
+            self.counters[kind] += 1
+            await self.bot.send_document(chat_id, document=BytesIO(data), filename=filename, caption=caption)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.counters["failed"] += 1
+            logger.error(f"Profiling ({kind}) failed: {e}")
+            try:
+                await self.bot.send_message(chat_id, f"Профилирование не удалось: {e}")
+            except TelegramError:
+                pass
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for prefix in self._prefixes:
+                if filename.startswith(prefix):
+                    filename = filename[len(prefix):]
+                    break
+            # ";" — разделитель кадров в формате collapsed
+            label = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _sample_cpu(self, seconds: float, stop: threading.Event):
+        # Работает в отдельном потоке; event loop в это время обслуживает апдейты
+        own = threading.get_ident()
+        stacks = Counter()
+        samples = 0
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(stack))] += 1
+            samples += 1
+            if stop.wait(self.interval):
+                break
+        lines = [f"{stack} {count}" for stack, count in stacks.most_common()]
+        caption = f"🔬 CPU-профиль за {seconds:g} с: {samples} сэмплов, {len(stacks)} разных стеков (collapsed stacks для flamegraph/speedscope)"
+        return ("\n".join(lines) + "\n").encode(), caption, samples
+
+    async def _snapshot_memory(self, seconds: float):
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start(self.memory_frames)
+        try:
+            await asyncio.sleep(seconds)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_here:
+                tracemalloc.stop()
+        text = await asyncio.to_thread(self._render_memory, snapshot, seconds, current, peak)
+        caption = f"🧠 Память: выделено за {seconds:g} с и ещё живо — {current / 1024:.0f} КиБ (пик {peak / 1024:.0f} КиБ)"
+        return text.encode(), caption
+
+    def _render_memory(self, snapshot, seconds: float, current: int, peak: int) -> str:
+        snapshot = snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+        by_line = snapshot.statistics("lineno")
+        by_file = snapshot.statistics("filename")
+        lines = [
+            f"tracemalloc: {seconds:g} s window, traced now {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB",
+            "",
+            f"Top {self.top} allocation sites (size, blocks, avg):",
+        ]
+        for stat in by_line[:self.top]:
+            frame = stat.traceback[0]
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d} {stat.size // max(stat.count, 1):6d} B  {frame.filename}:{frame.lineno}")
+        lines += ["", f"Top {self.top} files:"]
+        for stat in by_file[:self.top]:
+            lines.append(f"{stat.size / 1024:10.1f} KiB {stat.count:8d}  {stat.traceback[0].filename}")
+        return "\n".join(lines) + "\n"
+
+    def stats(self) -> dict:
+        return {**self.counters, "running": self.kind if self.running else None}
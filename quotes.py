@@ -0,0 +1,283 @@
+import math
+from functools import lru_cache
+from typing import NamedTuple
+
+# ============================
+#   РАСЧЁТ СТОИМОСТИ
+# ============================
+
+# Чистый расчёт без текста: на вход — каталог и нормализованные параметры позиции,
+# на выход — компактная запись (NamedTuple). Результаты кэшируются в LRU; ключ
+# включает каталог, а он сравнивается по version, поэтому после reload_catalog()
+# старые записи просто вытесняются. Текст собирается отдельно в render_quote(),
+# тоже с кэшем.
+
+QUOTE_CACHE_SIZE = 4096
+RENDER_CACHE_SIZE = 4096
+
+class WallPanelsQuote(NamedTuple):
+    # Панели по известному количеству
+    title: str
+    thickness: int
+    length_mm: int
+    panel_width_mm: int
+    area_m2: float
+    price_rub: int
+    panels: int
+    total_area: float
+    total_weight: float
+    cost: int
+
+class WallQuote(NamedTuple):
+    # Панели по размерам стены
+    title: str
+    thickness: int
+    length_mm: int
+    panel_width_mm: int
+    area_m2: float
+    price_rub: int
+    panel_mode: bool
+    width_m: float
+    eff_h: float
+    gross_area: float
+    deduct_area_m2: float
+    net_area: float
+    num_rows: int
+    num_cols: int
+    panels: int
+    total_area: float
+    waste_area: float
+    waste_pct: float
+    total_weight: float
+    cost: int
+
+class ProfileQuote(NamedTuple):
+    thickness: int
+    name: str
+    quantity: int
+    price_rub: int
+    cost: int
+
+class SlatQuote(NamedTuple):
+    title: str
+    length_m: float
+    required: float
+    waste: float
+    cost: int
+
+class Panel3dQuote(NamedTuple):
+    code: str
+    area_m2: float
+    panels: int
+    total_area: float
+    waste_area: float
+    waste_pct: float
+    cost: int
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def quote_wall_panels(catalog, code: str, thickness: int, length_mm: int, panels: int) -> WallPanelsQuote:
+    sku = catalog.wall(code, thickness, length_mm)
+    total_area = panels * sku.area_m2
+    return WallPanelsQuote(
+        title=sku.title,
+        thickness=thickness,
+        length_mm=length_mm,
+        panel_width_mm=sku.width_mm,
+        area_m2=sku.area_m2,
+        price_rub=sku.price_rub,
+        panels=panels,
+        total_area=total_area,
+        total_weight=total_area * sku.weight_per_m2 if sku.weight_per_m2 else None,
+        cost=panels * sku.price_rub,
+    )
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def quote_wall(catalog, code: str, thickness: int, length_mm: int, wall_width_m: float, wall_height_m: float,
+               deduct_area_m2: float, panel_mode: bool, panel_h_m: float) -> WallQuote:
+    sku = catalog.wall(code, thickness, length_mm)
+    area_m2 = sku.area_m2
+    panel_w_m = sku.width_mm / 1000
+    eff_h = min(wall_height_m, panel_h_m) if panel_mode else wall_height_m
+    gross_area = wall_width_m * eff_h
+    net_area = gross_area - deduct_area_m2
+    num_rows = 1 if panel_mode else math.ceil(wall_height_m / panel_h_m)
+    num_cols = math.ceil(wall_width_m / panel_w_m)
+    required_area = net_area * 1.1  # 10% запаса
+    panels = max(num_rows * num_cols, math.ceil(required_area / area_m2))
+    total_area = panels * area_m2
+    waste_area = total_area - net_area
+    return WallQuote(
+        title=sku.title,
+        thickness=thickness,
+        length_mm=length_mm,
+        panel_width_mm=sku.width_mm,
+        area_m2=area_m2,
+        price_rub=sku.price_rub,
+        panel_mode=panel_mode,
+        width_m=wall_width_m,
+        eff_h=eff_h,
+        gross_area=gross_area,
+        deduct_area_m2=deduct_area_m2,
+        net_area=net_area,
+        num_rows=num_rows,
+        num_cols=num_cols,
+        panels=panels,
+        total_area=total_area,
+        waste_area=waste_area,
+        waste_pct=(waste_area / total_area) * 100 if total_area > 0 else 0,
+        total_weight=total_area * sku.weight_per_m2 if sku.weight_per_m2 else None,
+        cost=panels * sku.price_rub,
+    )
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def quote_profile(catalog, thickness: int, name: str, quantity: int) -> ProfileQuote:
+    price = catalog.profiles[(thickness, name)].price_rub
+    return ProfileQuote(thickness, name, quantity, price, quantity * price)
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def quote_slats(catalog, kind: str, length_m: float) -> SlatQuote:
+    required = length_m * 1.1
+    return SlatQuote(
+        title='WPC' if kind == 'wpc' else 'Деревянные',
+        length_m=length_m,
+        required=required,
+        waste=required - length_m,
+        cost=math.ceil(required) * catalog.slat_prices[kind],  # Округление вверх
+    )
+
+@lru_cache(maxsize=QUOTE_CACHE_SIZE)
+def quote_3d(catalog, var: str, wall_width_m: float, wall_height_m: float, deduct_area_m2: float) -> Panel3dQuote:
+    sku = catalog.panels_3d[var]
+    net_area = wall_width_m * wall_height_m - deduct_area_m2
+    panels = math.ceil(net_area / sku.area_m2)
+    total_area = panels * sku.area_m2
+    waste_area = total_area - net_area
+    return Panel3dQuote(
+        code=sku.code,
+        area_m2=sku.area_m2,
+        panels=panels,
+        total_area=total_area,
+        waste_area=waste_area,
+        waste_pct=(waste_area / total_area) * 100 if total_area > 0 else 0,
+        cost=panels * sku.price_rub,
+    )
+
+def quote_item(catalog, item: dict, wall_width_m, wall_height_m, deduct_area_m2, calc_mode=None, panel_h_m=None):
+    # Приводит позицию из chat_data к ключу кэша: только значимые поля, размеры — float,
+    # значения по умолчанию подставлены. None для неизвестной категории
+    category = item['category']
+    if category == 'walls':
+        code, thickness, length_mm = item['product_code'], item.get('thickness', 0), item['length']
+        if 'known_panels' in item:
+            return quote_wall_panels(catalog, code, thickness, length_mm, item['known_panels'])
+        return quote_wall(
+            catalog, code, thickness, length_mm, float(wall_width_m), float(wall_height_m), float(deduct_area_m2),
+            calc_mode == 'panel', float(length_mm / 1000 if panel_h_m is None else panel_h_m),
+        )
+    if category == 'profiles':
+        return quote_profile(catalog, item['thickness'], item['type'], item['quantity'])
+    if category == 'slats':
+        return quote_slats(catalog, item['type'], float(wall_width_m))
+    if category == '3d':
+        return quote_3d(catalog, item['var'], float(wall_width_m), float(wall_height_m), float(deduct_area_m2))
+    return None
+
+def _name(custom_name: str, html: bool) -> str:
+    return f"<b>«{custom_name}»</b>" if html else f"«{custom_name}»"
+
+def _meters(value: float) -> str:
+    # 4000.0 -> "4000", 3.25 -> "3.25"
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def render_quote(quote, custom_name: str = 'Стандартный', html: bool = True) -> str:
+    if isinstance(quote, WallPanelsQuote):
+        q = quote
+        text = f"""Выбранный материал: {q.title}  
+Толщина: {q.thickness} мм  
+Высота: {q.length_mm} мм  
+Название/артикул клиента: {_name(custom_name, html)}  
+
+🔸 Количество панелей: {q.panels}  
+🔸 Площадь одной панели ({q.length_mm} мм × {q.panel_width_mm} мм): {q.area_m2} м²  
+🔸 Общая площадь: {q.panels} панелей × {q.area_m2} м² = {q.total_area:.1f} м²  
+
+💰 Ориентировочная стоимость: {q.panels} панелей × {q.price_rub:,} ₽ = {q.cost:,} ₽  """
+        if q.total_weight is not None:
+            text += f"\n\nОбщий вес: {q.total_weight:.2f} кг  "
+        text += f"""\n\n____________________________________________________________  
+Итог:  
+- Необходимое количество панелей: {q.panels}  
+- Общая стоимость: {q.cost:,} ₽  """
+        return text
+    if isinstance(quote, WallQuote):
+        q = quote
+        mode_text = "(обрезка по высоте панели)" if q.panel_mode else "(стыковка панелей)"
+        text = f"""Выбранный материал: {q.title}  
+Толщина: {q.thickness} мм  
+Высота: {q.length_mm} мм {mode_text}  
+Название/артикул клиента: {_name(custom_name, html)}  
+
+🔹 Ширина зоны отделки: {q.width_m * 1000:.1f} мм (или {q.width_m:.2f} м)  
+🔹 Площадь зоны отделки: {q.width_m:.2f} м × {q.eff_h:.1f} м = {q.gross_area:.2f} м²  
+🔹 Площадь к вычету (окна/двери): {q.deduct_area_m2:.2f} м²  
+🔹 Общая площадь для покрытия: {q.gross_area:.2f} м² - {q.deduct_area_m2:.2f} м² = {q.net_area:.2f} м²  
+
+🔸 Площадь одной панели ({q.length_mm} мм × {q.panel_width_mm} мм): {q.area_m2} м²  
+🔸 Необходимое количество панелей: {q.net_area:.2f} м² ÷ {q.area_m2} м² ≈ {q.net_area / q.area_m2:.2f} (округляем до {q.panels} панелей, с учётом рядов: {q.num_rows} рядов × {q.num_cols} панелей в ряду)  
+🔸 Общая площадь закупаемых панелей: {q.panels} панелей × {q.area_m2} м² = {q.total_area:.1f} м²  
+
+🔹 Отходы:  
+- Площадь отходов: {q.total_area:.1f} м² - {q.net_area:.2f} м² = {q.waste_area:.2f} м²  
+- Процент отходов: ({q.waste_area:.2f} м² ÷ {q.total_area:.1f} м²) × 100 ≈ {q.waste_pct:.2f}%  
+
+💰 Ориентировочная стоимость: {q.panels} панелей × {q.price_rub:,} ₽ = {q.cost:,} ₽  """
+        if q.total_weight is not None:
+            text += f"\n\nОбщий вес: {q.total_weight:.2f} кг  "
+        text += f"""\n\n____________________________________________________________  
+Итог:  
+- Необходимое количество панелей: {q.panels}  
+- Общая стоимость: {q.cost:,} ₽  
+- Отходы: {q.waste_area:.2f} м² ({q.waste_pct:.2f}%)"""
+        return text
+    if isinstance(quote, ProfileQuote):
+        return f"""
+Профиль: {quote.name}, {quote.thickness} мм
+Количество: {quote.quantity} шт.
+💰 Стоимость: {quote.cost} ₽
+"""
+    if isinstance(quote, SlatQuote):
+        return f"""
+Реечные панели: {quote.title}
+Длина стены: {_meters(quote.length_m)} м.п.
+Необходимая длина: {quote.required:.2f} м.п.
+Отходы: {quote.waste:.2f} м.п. (10%)
+💰 Стоимость: {quote.cost} ₽
+"""
+    if isinstance(quote, Panel3dQuote):
+        return f"""
+3D панели: {quote.code}
+Площадь панели: {quote.area_m2} м²
+Количество: {quote.panels} шт.
+Общая площадь: {quote.total_area} м²
+Отходы: {quote.waste_area:.2f} м² ({quote.waste_pct:.2f}%)
+💰 Стоимость: {quote.cost} ₽
+"""
+    return ""
+
+_QUOTE_FUNCS = (quote_wall_panels, quote_wall, quote_profile, quote_slats, quote_3d)
+
+def quote_cache_stats() -> dict:
+    hits = misses = size = 0
+    for func in _QUOTE_FUNCS:
+        info = func.cache_info()
+        hits += info.hits
+        misses += info.misses
+        size += info.currsize
+    render = render_quote.cache_info()
+    return {"hits": hits, "misses": misses, "size": size, "render_hits": render.hits, "render_misses": render.misses}
+
+def clear_quote_cache():
+    for func in _QUOTE_FUNCS:
+        func.cache_clear()
+    render_quote.cache_clear()
@@ -0,0 +1,120 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple
+
+from dimensions import DimensionError, evaluate
+
+# ============================
+#   ПОМЕЩЕНИЕ ЦЕЛИКОМ
+# ============================
+
+# Все стены и проёмы одним сообщением:
+#   "стены: 3.2x2.7, 4.1x2.7, 3.2x2.7, 4.1x2.7; окна: 1.4x1.5 x2; дверь 0.9x2.1"
+# Разделы начинаются со слов стены/окна/двери (в любой форме), внутри раздела —
+# пары "ширина x высота" с необязательным количеством ("x2", "2 шт").
+# Текст без ключевых слов, но с парами размеров считается списком стен.
+# Числа — как в dimensions.py: запятая или точка, суффиксы мм/см/м.
+# Между парами допускаются только разделители: ввод вроде "3.2x2.7x2.5"
+# не разбирается целиком, и это не помещение (а не одна стена 3.2x2.7).
+
+_NUMBER = r"(?:\d+(?:[.,]\d+)?|[.,]\d+)\s*(?:мм|см|м|mm|cm|m)?(?![а-фц-яa-wyz])"
+_PAIR_RE = re.compile(
+    rf"({_NUMBER})\s*[xх×]\s*({_NUMBER})"
+    r"(?:\s*[xх×*]\s*(\d+)(?![\d.,])|\s*[-—(]?\s*(\d+)\s*шт\.?\)?)?",
+    re.IGNORECASE,
+)
+MAX_WALLS = 64
+MAX_OPENINGS = 64
+# Больше — почти наверняка ошибка единиц (метры вместо миллиметров или наоборот)
+MAX_WALL_WIDTH_M = 100
+MAX_WALL_HEIGHT_M = 20
+
+_SEPARATORS_RE = re.compile(r"[\s,;.+и]*")
+_SECTION_RE = re.compile(r"(стен\w*|окн\w*|окон|двер\w*)\s*:?", re.IGNORECASE)
+
+class Room(NamedTuple):
+    walls: tuple      # ((ширина_м, высота_м), ...)
+    windows: tuple    # ((ширина_м, высота_м, штук), ...)
+    doors: tuple
+
+    @property
+    def total_width(self) -> float:
+        return sum(w for w, _ in self.walls)
+
+    @property
+    def max_height(self) -> float:
+        return max(h for _, h in self.walls)
+
+    @property
+    def wall_area(self) -> float:
+        return sum(w * h for w, h in self.walls)
+
+    @property
+    def deduct_area(self) -> float:
+        return sum(w * h * n for w, h, n in self.windows + self.doors)
+
+    def height_groups(self) -> tuple:
+        # Стены одной высоты считаются одной полосой: (суммарная ширина, высота, доля проёмов)
+        widths = {}
+        for w, h in self.walls:
+            widths[h] = widths.get(h, 0) + w
+        wall_area = self.wall_area
+        return tuple(
+            (width, height, self.deduct_area * width * height / wall_area if wall_area else 0.0)
+            for height, width in sorted(widths.items(), reverse=True)
+        )
+
+    def describe(self) -> str:
+        windows = sum(n for _, _, n in self.windows)
+        doors = sum(n for _, _, n in self.doors)
+        return (
+            f"🏠 Помещение: стен {len(self.walls)}, общая длина {self.total_width:.2f} м, "
+            f"площадь стен {self.wall_area:.2f} м²\n"
+            f"Проёмы: окон {windows}, дверей {doors}, к вычету {self.deduct_area:.2f} м²"
+        )
+
+def _pairs(text: str, unit: str) -> list:
+    result = []
+    for match in _PAIR_RE.finditer(text):
+        width, height, count_x, count_pcs = match.groups()
+        result.append((evaluate(width, unit), evaluate(height, unit), int(count_x or count_pcs or 1)))
+    if not _SEPARATORS_RE.fullmatch(_PAIR_RE.sub(" ", text)):
+        raise DimensionError("unparsed text between sizes")
+    return result
+
+@lru_cache(maxsize=1024)
+def _parse_room_cached(text: str, unit: str):
+    parts = _SECTION_RE.split(text)
+    sections = {"walls": [], "windows": [], "doors": []}
+    try:
+        if len(parts) == 1:
+            sections["walls"] = _pairs(text, unit)
+        else:
+            if re.search(r"\d", parts[0]):  # текст до первого раздела без чисел — просто подпись
+                sections["walls"] += _pairs(parts[0], unit)
+            for keyword, body in zip(parts[1::2], parts[2::2]):
+                kind = "walls" if keyword.startswith("стен") else "windows" if keyword.startswith("ок") else "doors"
+                sections[kind] += _pairs(body, unit)
+    except DimensionError:
+        return None
+    openings = sections["windows"] + sections["doors"]
+    if sum(n for _, _, n in sections["walls"]) > MAX_WALLS or sum(n for _, _, n in openings) > MAX_OPENINGS:
+        return None
+    walls = tuple((w, h) for w, h, n in sections["walls"] for _ in range(n))
+    if not walls or any(not 0 < w <= MAX_WALL_WIDTH_M or not 0 < h <= MAX_WALL_HEIGHT_M for w, h in walls):
+        return None
+    if any(w <= 0 or h <= 0 or n <= 0 for w, h, n in openings):
+        return None
+    room = Room(walls, tuple(sections["windows"]), tuple(sections["doors"]))
+    if room.deduct_area >= room.wall_area:
+        return None
+    return room
+
+def looks_like_room(text: str) -> bool:
+    # Похоже на попытку описать помещение (есть пара размеров или раздел)
+    text = text.strip().lower()
+    return bool(_PAIR_RE.search(text) or _SECTION_RE.search(text))
+
+def parse_room(text: str, unit: str = "m"):
+    # Room или None, если это не описание помещения (например, просто одно число)
+    return _parse_room_cached(text.strip().lower(), unit)
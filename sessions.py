@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import sys
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ВЫТЕСНЕНИЕ СЕССИЙ
+# ============================
+
+# chat_data/user_data неактивных чатов выгружаются из памяти: сначала всё, что
+# простаивает дольше ttl, затем, если суммарный размер сессий больше budget_bytes,
+# самые давние по LRU. Перед удалением вызывается on_evict (сохранить в базу),
+# при возвращении пользователя данные подтягиваются обратно из хранилища.
+#
+# Размер сессии считается рекурсивно через sys.getsizeof и пересчитывается
+# только для сессий, тронутых с прошлого прохода.
+
+def deep_sizeof(obj, _seen=None) -> int:
+    if _seen is None:
+        _seen = set()
+    if id(obj) in _seen:
+        return 0
+    _seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, _seen) + deep_sizeof(v, _seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(item, _seen) for item in obj)
+    return size
+
+class SessionEvictor:
+    def __init__(self, stores, ttl=86400, budget_bytes=64 * 1024 * 1024, on_evict=None, before_sweep=None):
+        # stores: kind -> изменяемый dict сессий (например, application._chat_data)
+        self.stores = stores
+        self.ttl = ttl
+        self.budget_bytes = budget_bytes
+        self.on_evict = on_evict
+        self.before_sweep = before_sweep
+        self._lru = OrderedDict()  # (kind, id) -> время последнего обращения
+        self._sizes = {}           # (kind, id) -> байт
+        self._dirty = set()
+        self._task = None
+        self.counters = {"sweeps": 0, "evicted_ttl": 0, "evicted_budget": 0, "evicted_bytes": 0}
+
+    def touch(self, kind: str, key: int):
+        session = (kind, key)
+        self._lru[session] = time.monotonic()
+        self._lru.move_to_end(session)
+        self._dirty.add(session)
+
+    def track_existing(self):
+        # Сессии, поднятые из хранилища при старте, тоже участвуют в LRU
+        for kind, store in self.stores.items():
+            for key in list(store):
+                self.touch(kind, key)
+
+    def _account(self):
+        for session in self._dirty:
+            kind, key = session
+            data = self.stores[kind].get(key)
+            if data is None:
+                self._sizes.pop(session, None)
+            else:
+                self._sizes[session] = deep_sizeof(data)
+        self._dirty.clear()
+
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def stats(self) -> dict:
+        largest = max(self._sizes.items(), key=lambda kv: kv[1], default=(None, 0))
+        return {
+            "sessions": len(self._lru),
+            "bytes": self.total_bytes(),
+            "budget_bytes": self.budget_bytes,
+            "largest": {"session": f"{largest[0][0]}:{largest[0][1]}", "bytes": largest[1]} if largest[0] else None,
+            **self.counters,
+        }
+
+    def session_bytes(self, kind: str, key: int) -> int:
+        return self._sizes.get((kind, key), 0)
+
+    def _select(self) -> list:
+        now = time.monotonic()
+        victims = []
+        for session, last_seen in self._lru.items():
+            if now - last_seen < self.ttl:
+                break
+            victims.append((session, "ttl"))
+        total = self.total_bytes() - sum(self._sizes.get(s, 0) for s, _ in victims)
+        if total > self.budget_bytes:
+            for session in list(self._lru)[len(victims):]:
+                if total <= self.budget_bytes:
+                    break
+                victims.append((session, "budget"))
+                total -= self._sizes.get(session, 0)
+        return victims
+
+    async def sweep(self):
+        self._account()
+        victims = self._select()
+        self.counters["sweeps"] += 1
+        if not victims:
+            return
+        marks = {session: self._lru.get(session) for session, _ in victims}
+        if self.before_sweep is not None:
+            # Например, дописать в хранилище всё, что помечено изменённым
+            await self.before_sweep()
+        for session, reason in victims:
+            if self._lru.get(session) != marks[session]:
+                continue  # пока ждали, пользователь вернулся
+            kind, key = session
+            data = self.stores[kind].pop(key, None)
+            if data is not None and self.on_evict is not None:
+                self.on_evict(kind, key, data)
+            self.counters["evicted_" + reason] += 1
+            self.counters["evicted_bytes"] += self._sizes.pop(session, 0)
+            del self._lru[session]
+        logger.info(f"Sessions evicted: {len(victims)}, in memory: {len(self._lru)}, bytes: {self.total_bytes()}")
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+    def start(self, interval=300):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval), name="session-evictor")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
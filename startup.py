@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import time
+
+IMPORT_STARTED = time.perf_counter()
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ХРОНОМЕТРАЖ СТАРТА
+# ============================
+
+# Холодный старт на Render виден клиентам, поэтому время старта раскладывается
+# по этапам. Последовательные этапы (import, initialize, start) закрываются
+# phase(): каждый длится от предыдущей отметки. Фоновые работы (регистрация
+# webhook, прогрев кэшей) идут параллельно с обработкой первых апдейтов и
+# меряются отдельно. Отсчёт — от импорта этого модуля (первый импорт main.py).
+
+class StartupTimeline:
+    def __init__(self, started: float = IMPORT_STARTED):
+        self.started = started
+        self.phases = {}       # этап -> мс
+        self.background = {}   # фоновая работа -> {"start_ms", "duration_ms"} (+ "error")
+        self.ready_ms = None
+        self.first_update = None
+        self._last = started
+        self._tasks = set()
+
+    def _offset(self, now=None) -> float:
+        return ((now or time.perf_counter()) - self.started) * 1000
+
+    def phase(self, name: str):
+        now = time.perf_counter()
+        self.phases[name] = (now - self._last) * 1000
+        self._last = now
+
+    def ready(self):
+        self.phase("start")
+        self.ready_ms = self._offset()
+        logger.info(f"Startup: {self.render()}")
+
+    async def _timed(self, name: str, coro):
+        started = time.perf_counter()
+        entry = self.background[name] = {"start_ms": round(self._offset(started), 1)}
+        try:
+            await coro
+        except Exception as e:
+            entry["error"] = str(e)
+            logger.error(f"Startup task {name} failed: {e}")
+        finally:
+            entry["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            logger.info(f"Startup task {name}: {entry['duration_ms']:.0f} ms")
+
+    def run_in_background(self, name: str, coro):
+        task = asyncio.create_task(self._timed(name, coro), name=f"startup-{name}")
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def stop(self):
+        # Фоновые работы, не закончившиеся к остановке (например, повторы регистрации webhook)
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def update_processed(self, started: float):
+        # Первый апдейт после старта: когда пришёл и сколько обрабатывался
+        if self.first_update is not None:
+            return
+        now = time.perf_counter()
+        self.first_update = {
+            "received_ms": round(self._offset(started), 1),
+            "after_ready_ms": round(self._offset(started) - self.ready_ms, 1) if self.ready_ms is not None else None,
+            "processing_ms": round((now - started) * 1000, 1),
+        }
+        logger.info(f"First update after startup: {self.first_update}")
+
+    def report(self) -> dict:
+        return {
+            "phases_ms": {name: round(ms, 1) for name, ms in self.phases.items()},
+            "ready_ms": round(self.ready_ms, 1) if self.ready_ms is not None else None,
+            "background": self.background,
+            "first_update": self.first_update,
+        }
+
+    def render(self) -> str:
+        parts = [f"{name} {ms:.0f} ms" for name, ms in self.phases.items()]
+        return ", ".join(parts) + f"; ready at {self.ready_ms:.0f} ms"
@@ -0,0 +1,213 @@
+import json
+import logging
+import os
+import struct
+from datetime import datetime, timezone
+
+from tracing import span
+from userset import UserIdSet
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ХРАНИЛИЩЕ СТАТИСТИКИ
+# ============================
+
+# Счётчики и множества пользователей (UserIdSet) живут в памяти. Каждое событие дописывается
+# одной строкой в журнал (append-only), а раз в compact_every событий (и при
+# остановке) состояние целиком сбрасывается в снимок через атомарную замену файла,
+# после чего журнал обнуляется. При старте: снимок + проигрывание журнала.
+#
+# Формат журнала: "<seq> U <chat_id> <дата>" — пользователь, "<seq> C <дата>" — расчёт,
+# "<seq> R <chat_id> <дата>" — пользователь удалён (заблокировал бота).
+# Снимок хранит seq последнего учтённого события, поэтому если процесс упадёт
+# между записью снимка и очисткой журнала, события не посчитаются дважды.
+#
+# Снимок: JSON со счётчиками + два бинарных файла UserIdSet (все / сегодня).
+# Старый снимок со списками "users"/"users_today" в JSON читается и при первом
+# же сохранении переписывается в бинарный формат.
+
+def _today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+class StatsStore:
+    def __init__(self, snapshot_file, log_file, users_file, users_today_file, compact_every=1000):
+        self.snapshot_file = snapshot_file
+        self.log_file = log_file
+        self.users_file = users_file
+        self.users_today_file = users_today_file
+        self.compact_every = compact_every
+        self.users = UserIdSet()
+        self.users_today = UserIdSet()
+        self.calc_count = 0
+        self.calc_today = 0
+        self.today = _today()
+        self.seq = 0
+        self._log = None
+        self._log_entries = 0
+
+    def _roll_day(self, day: str):
+        if day != self.today:
+            self.users_today = UserIdSet()
+            self.calc_today = 0
+            self.today = day
+
+    def _apply(self, line: str) -> bool:
+        parts = line.split()
+        if len(parts) < 3 or int(parts[0]) <= self.seq:
+            return False
+        if parts[1] == "U" and len(parts) == 4:
+            self._roll_day(parts[3])
+            chat_id = int(parts[2])
+            self.users.add(chat_id)
+            self.users_today.add(chat_id)
+        elif parts[1] == "R" and len(parts) == 4:
+            self._roll_day(parts[3])
+            chat_id = int(parts[2])
+            self.users.discard(chat_id)
+            self.users_today.discard(chat_id)
+        elif parts[1] == "C":
+            self._roll_day(parts[2])
+            self.calc_count += 1
+            self.calc_today += 1
+        else:
+            return False
+        self.seq = int(parts[0])
+        return True
+
+    def load(self):
+        migrated = False
+        if os.path.exists(self.snapshot_file):
+            try:
+                with open(self.snapshot_file, 'r') as f:
+                    loaded = json.load(f)
+                if 'users' in loaded:
+                    # Миграция со старого формата: списки id прямо в JSON
+                    self.users = UserIdSet(loaded.get('users', []))
+                    self.users_today = UserIdSet(loaded.get('users_today', []))
+                    migrated = True
+                else:
+                    self.users = self._load_ids(self.users_file)
+                    self.users_today = self._load_ids(self.users_today_file)
+                self.calc_count = loaded.get('calc_count', 0)
+                self.calc_today = loaded.get('calc_today', 0)
+                self.today = loaded.get('today', self.today)
+                self.seq = loaded.get('seq', 0)
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Corrupted stats snapshot, starting fresh: {e}")
+        if os.path.exists(self.log_file):
+            try:
+                valid = 0  # длина журнала до последней целой строки
+                with open(self.log_file, 'r') as f:
+                    for line in f:
+                        if not line.endswith("\n"):
+                            # Недописанная строка после падения — пропускаем
+                            break
+                        valid += len(line)
+                        try:
+                            if self._apply(line):
+                                self._log_entries += 1
+                        except ValueError:
+                            continue
+                if valid < os.path.getsize(self.log_file):
+                    # Обрезаем хвост, иначе следующая запись склеится с ним в одну строку
+                    logger.warning(f"Truncating torn stats log tail at {valid} bytes")
+                    with open(self.log_file, 'r+') as f:
+                        f.truncate(valid)
+            except OSError as e:
+                logger.warning(f"Could not replay stats log: {e}")
+        self._roll_day(_today())
+        if migrated:
+            logger.info("Migrating stats user lists from JSON to binary user sets")
+            self.compact()
+        logger.info(f"Stats loaded: users={len(self.users)}, calcs={self.calc_count}, log entries={self._log_entries}")
+
+    def _load_ids(self, path: str) -> UserIdSet:
+        if not os.path.exists(path):
+            return UserIdSet()
+        try:
+            return UserIdSet.load(path)
+        except (OSError, ValueError, struct.error) as e:
+            logger.warning(f"Corrupted user set {path}, starting empty: {e}")
+            return UserIdSet()
+
+    def _append(self, line: str):
+        with span("stats_io"):
+            self._append_line(line)
+
+    def _append_line(self, line: str):
+        self.seq += 1
+        try:
+            if self._log is None:
+                self._log = open(self.log_file, 'a')
+            self._log.write(f"{self.seq} {line}\n")
+            self._log.flush()
+            self._log_entries += 1
+        except OSError as e:
+            logger.error(f"Failed to append stats log: {e}")
+            return
+        if self._log_entries >= self.compact_every:
+            self.compact()
+
+    def add_user(self, chat_id: int):
+        day = _today()
+        self._roll_day(day)
+        if chat_id in self.users_today:
+            return  # уже учтён сегодня — в журнал писать нечего
+        self.users.add(chat_id)
+        self.users_today.add(chat_id)
+        self._append(f"U {chat_id} {day}")
+
+    def remove_users(self, chat_ids):
+        day = _today()
+        self._roll_day(day)
+        chat_ids = [chat_id for chat_id in chat_ids if chat_id in self.users]
+        if not chat_ids:
+            return
+        self.users.difference_update(chat_ids)
+        self.users_today.difference_update(chat_ids)
+        for chat_id in chat_ids:
+            self._append(f"R {chat_id} {day}")
+
+    def add_calc(self):
+        day = _today()
+        self._roll_day(day)
+        self.calc_count += 1
+        self.calc_today += 1
+        self._append(f"C {day}")
+
+    def summary(self) -> dict:
+        self._roll_day(_today())
+        return {
+            "users_today": len(self.users_today),
+            "calc_today": self.calc_today,
+            "users": len(self.users),
+            "calc_count": self.calc_count,
+        }
+
+    def compact(self):
+        serializable = {
+            "calc_count": self.calc_count,
+            "today": self.today,
+            "calc_today": self.calc_today,
+            "seq": self.seq,
+        }
+        tmp = self.snapshot_file + ".tmp"
+        try:
+            # Сначала множества, потом JSON с seq: после падения между шагами
+            # журнал просто доиграется поверх (добавление id идемпотентно)
+            self.users.save(self.users_file)
+            self.users_today.save(self.users_today_file)
+            with open(tmp, 'w') as f:
+                json.dump(serializable, f)
+            os.replace(tmp, self.snapshot_file)
+            if self._log is not None:
+                self._log.close()
+                self._log = None
+            open(self.log_file, 'w').close()
+            self._log_entries = 0
+        except OSError as e:
+            logger.error(f"Failed to compact stats: {e}")
+
+    def close(self):
+        self.compact()
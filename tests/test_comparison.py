@@ -0,0 +1,115 @@
+import unittest
+
+import comparison
+from catalog import build_catalog_index
+from comparison import _compare_python, compare_room, render_comparison
+from quotes import quote_wall
+
+def _catalog():
+    wall_products = {
+        "Панель": {
+            8: {
+                "width_mm": 1220,
+                "weight_per_m2": 8.0,
+                "panels": {length: {"area_m2": round(length * 1.22 / 1000, 3), "price_rub": 9000 + length} for length in (2440, 2800, 3200)},
+            },
+            10: {
+                "width_mm": 1220,
+                "weight_per_m2": 9.5,
+                "panels": {length: {"area_m2": round(length * 1.22 / 1000, 3), "price_rub": 11000 + length} for length in (2800, 3000)},
+            },
+        },
+        "Лёгкая": {
+            5: {
+                "width_mm": 1000,
+                "panels": {2700: {"area_m2": 2.7, "price_rub": 6100}, 3000: {"area_m2": 3.0, "price_rub": 6700}},
+            },
+        },
+        "Узкая": {
+            6: {
+                "width_mm": 600,
+                "weight_per_m2": 7.2,
+                "panels": {2500: {"area_m2": 1.5, "price_rub": 3900}},
+            },
+        },
+    }
+    return build_catalog_index(wall_products, {"p": "Панель", "l": "Лёгкая", "n": "Узкая"}, {}, {}, {})
+
+CATALOG = _catalog()
+ALL = len(CATALOG.walls)
+ROOMS = (
+    ((4.0, 2.7, 1.5),),
+    ((3.2, 3.5, 0.0),),
+    ((12.5, 2.7, 3.2), (2.1, 3.4, 0.0)),
+)
+
+def _numpy_available() -> bool:
+    return comparison._numpy() is not None
+
+class ComparePythonTest(unittest.TestCase):
+    def test_matches_quote_wall_for_every_sku(self):
+        width, height, deduct = 4.0, 2.7, 1.5
+        total, by_cost, _, _ = _compare_python(CATALOG, ((width, height, deduct),), ALL)
+        self.assertEqual(total, ALL)
+        self.assertEqual(len(by_cost), ALL)
+        for row in by_cost:
+            sku = CATALOG.wall(row.code, row.thickness, row.length_mm)
+            q = quote_wall(CATALOG, sku.code, sku.thickness, sku.length_mm, width, height, deduct, False, sku.length_mm / 1000)
+            self.assertEqual(row.title, q.title)
+            self.assertEqual(row.panels, q.panels)
+            self.assertEqual(row.cost, q.cost)
+            self.assertAlmostEqual(row.waste_pct, q.waste_pct)
+            self.assertEqual(row.weight_kg, q.total_weight)
+
+    def test_room_sums_groups_per_sku(self):
+        groups = ROOMS[2]
+        _, by_cost, _, _ = _compare_python(CATALOG, groups, ALL)
+        for row in by_cost:
+            sku = CATALOG.wall(row.code, row.thickness, row.length_mm)
+            quotes = [quote_wall(CATALOG, sku.code, sku.thickness, sku.length_mm, w, h, d, False, sku.length_mm / 1000) for w, h, d in groups]
+            panels = sum(q.panels for q in quotes)
+            total_area = panels * sku.area_m2
+            self.assertEqual(row.panels, panels)
+            self.assertEqual(row.cost, sum(q.cost for q in quotes))
+            self.assertAlmostEqual(row.waste_pct, (total_area - sum(q.net_area for q in quotes)) / total_area * 100)
+
+    def test_rankings(self):
+        _, by_cost, by_waste, by_weight = _compare_python(CATALOG, ROOMS[0], 3)
+        self.assertEqual(len(by_cost), 3)
+        self.assertEqual([r.cost for r in by_cost], sorted(r.cost for r in by_cost))
+        self.assertEqual([r.waste_pct for r in by_waste], sorted(r.waste_pct for r in by_waste))
+        # SKU без веса в рейтинг по весу не попадают
+        self.assertTrue(all(r.weight_kg is not None for r in by_weight))
+        self.assertNotIn("Лёгкая", [r.title for r in by_weight])
+
+    def test_render(self):
+        text = render_comparison(compare_room(CATALOG, ROOMS[2], 2))
+        self.assertIn("Стены высотой 2.70 м: общая длина 12.50 м, к вычету 3.20 м²", text)
+        self.assertIn(f"Вариантов: {ALL} ", text)
+        self.assertIn("🪶 Легче всего:", text)
+
+@unittest.skipUnless(_numpy_available(), "numpy is not installed")
+class CompareNumpyTest(unittest.TestCase):
+    def assertSameRows(self, expected, actual):
+        self.assertEqual(len(actual), len(expected))
+        for e, a in zip(expected, actual):
+            self.assertEqual((a.code, a.title, a.thickness, a.length_mm, a.panels, a.cost),
+                             (e.code, e.title, e.thickness, e.length_mm, e.panels, e.cost))
+            self.assertAlmostEqual(a.waste_pct, e.waste_pct)
+            if e.weight_kg is None:
+                self.assertIsNone(a.weight_kg)
+            else:
+                self.assertAlmostEqual(a.weight_kg, e.weight_kg)
+
+    def test_matches_python(self):
+        for groups in ROOMS:
+            for top in (1, 3, ALL):
+                with self.subTest(groups=groups, top=top):
+                    expected = _compare_python(CATALOG, groups, top)
+                    actual = comparison._compare_numpy(CATALOG, groups, top)
+                    self.assertEqual(actual[0], expected[0])
+                    for e, a in zip(expected[1:], actual[1:]):
+                        self.assertSameRows(e, a)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+import time
+import unittest
+from collections import Counter
+
+from catalog import build_catalog_index
+from cutting import column_options, optimize_cuts, plan_walls, render_cut_plan
+
+LENGTHS = (2440, 2600, 2800, 3000, 3200)
+
+def _catalog():
+    wall_products = {
+        "Панель": {
+            8: {
+                "width_mm": 1220,
+                "weight_per_m2": 8.0,
+                "panels": {length: {"area_m2": round(length * 1.22 / 1000, 3), "price_rub": 9000 + length} for length in LENGTHS},
+            },
+        },
+    }
+    return build_catalog_index(wall_products, {"p": "Панель"}, {}, {}, {})
+
+def _cut_pieces(plan) -> Counter:
+    pieces = Counter()
+    for cut in plan.cuts:
+        for piece in cut.pieces:
+            pieces[piece] += cut.count
+    return pieces
+
+class ColumnOptionsTest(unittest.TestCase):
+    def test_short_wall_is_one_piece(self):
+        self.assertEqual(column_options(2700, LENGTHS), [(2700,)])
+
+    def test_tall_wall_is_split(self):
+        options = column_options(4000, LENGTHS)
+        self.assertIn((2000, 2000), options)
+        for option in options:
+            self.assertEqual(sum(option), 4000)
+            self.assertTrue(all(300 <= piece <= 3200 for piece in option))
+
+class OptimizeCutsTest(unittest.TestCase):
+    def test_finds_cheapest_purchase(self):
+        plan = optimize_cuts([1500, 1500, 1000], [(3000, 100), (2000, 80)])
+        self.assertEqual(plan.cost, 180)
+        self.assertEqual(plan.panels, 2)
+        self.assertTrue(plan.optimal)
+        self.assertEqual(_cut_pieces(plan), Counter({1500: 2, 1000: 1}))
+
+    def test_waste_objective(self):
+        plan = optimize_cuts([1000, 1000], [(2000, 100), (1000, 10)], objective="waste")
+        self.assertEqual(plan.waste_mm, 0)
+
+    def test_kerf_is_accounted(self):
+        plan = optimize_cuts([1000, 1000, 1000], [(3000, 10)], kerf_mm=5)
+        self.assertEqual(plan.panels, 2)
+
+    def test_empty_and_too_long(self):
+        self.assertEqual(optimize_cuts([], [(3000, 10)]).panels, 0)
+        with self.assertRaises(ValueError):
+            optimize_cuts([3500], [(3000, 10)])
+
+class PlanWallsTest(unittest.TestCase):
+    def test_single_wall_uses_cheapest_fitting_length(self):
+        plan = plan_walls(_catalog(), "p", 8, [(1.22, 2.7)])
+        self.assertEqual(plan.purchase, ((2800, 1),))
+        self.assertIn("1 шт. × 2800 мм", render_cut_plan(plan))
+
+    def test_offcuts_are_shared_between_walls(self):
+        # Две полосы по 4 м: доборы 800 мм двух стен режутся из одной панели
+        plan = plan_walls(_catalog(), "p", 8, [(1.22, 4.0), (1.22, 4.0)])
+        self.assertEqual(sum(_cut_pieces(plan).elements()), 8000)
+        self.assertLessEqual(plan.panels, 3)
+
+    def test_huge_wall_is_abandoned(self):
+        # Высота в метрах вместо миллиметров: тысячи кусков на стену — раскрой не считаем
+        for walls in ([(3.2, 2700)], [(32, 270)], [(32, 2700)]):
+            started = time.perf_counter()
+            self.assertIsNone(plan_walls(_catalog(), "p", 8, walls, time_budget=0.2))
+            self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertIn("с запасом 10%", render_cut_plan(None))
+
+    def test_big_room_stays_within_budget(self):
+        started = time.perf_counter()
+        plan = plan_walls(_catalog(), "p", 8, [(6, 9.9)] * 64, time_budget=0.2)
+        self.assertLess(time.perf_counter() - started, 0.4)
+        self.assertFalse(plan.optimal)
+        self.assertEqual(sum(_cut_pieces(plan).elements()), 64 * 5 * 9900)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+
+from dimensions import DimensionError, evaluate, parse_dimension, parse_dimensions
+
+class ParseDimensionTest(unittest.TestCase):
+    def assertMeters(self, text, expected, unit="m"):
+        self.assertAlmostEqual(parse_dimension(text, unit), expected, msg=text)
+
+    def test_plain_numbers(self):
+        self.assertMeters("3.2", 3.2)
+        self.assertMeters("3,2", 3.2)
+        self.assertMeters(" 4 ", 4)
+        self.assertMeters(".5", 0.5)
+
+    def test_unit_suffixes(self):
+        self.assertMeters("320 см", 3.2)
+        self.assertMeters("3200мм", 3.2)
+        self.assertMeters("2м + 50см", 2.5)
+        self.assertMeters("3.2 m", 3.2)
+
+    def test_unit_words(self):
+        self.assertMeters("3.2 метра", 3.2)
+        self.assertMeters("3 метров", 3)
+        self.assertMeters("320 сантиметров", 3.2)
+        self.assertMeters("3200 миллиметров", 3.2)
+        self.assertMeters("2.5 meters", 2.5)
+
+    def test_adjacent_quantities_are_summed(self):
+        self.assertMeters("3 м 20 см", 3.2)
+        self.assertMeters("2 метра 50 сантиметров", 2.5)
+
+    def test_user_unit(self):
+        self.assertMeters("3200", 3.2, unit="mm")
+        self.assertMeters("3 м", 3, unit="mm")
+        self.assertMeters("320", 3.2, unit="cm")
+
+    def test_expressions(self):
+        self.assertMeters("1.2 + 3,4", 4.6)
+        self.assertMeters("(2.5-0.3)*2", 4.4)
+        self.assertMeters("-1 + 3", 2)
+
+    def test_invalid_input_gives_zero(self):
+        for text in ("9**9**9", "abc", "1/0", "3 20", "3.2 метраж", "((((((((((1))))))))))", "1+" * 40):
+            self.assertEqual(parse_dimension(text), 0.0, msg=text)
+
+    def test_evaluate_raises(self):
+        with self.assertRaises(DimensionError):
+            evaluate("2 ** 3")
+
+class ParseDimensionsTest(unittest.TestCase):
+    def test_pairs(self):
+        width, height = parse_dimensions("3,2x2,7")
+        self.assertAlmostEqual(width, 3.2)
+        self.assertAlmostEqual(height, 2.7)
+        self.assertEqual(len(parse_dimensions("320 см × 270 см")), 2)
+        self.assertEqual(parse_dimensions("3,2x?"), ())
+
+if __name__ == "__main__":
+    unittest.main()
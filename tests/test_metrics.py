@@ -0,0 +1,50 @@
+import unittest
+
+from metrics import MAX_SERIES, Metrics
+
+class MetricsTest(unittest.TestCase):
+    def test_counter_and_gauge(self):
+        m = Metrics(prefix="t_")
+        m.counter("calls_total", "Calls", ("method",))
+        m.gauge("in_flight", "In flight")
+        m.inc("calls_total", "sendMessage")
+        m.inc("calls_total", "sendMessage", value=2)
+        m.inc("in_flight")
+        m.dec("in_flight")
+        text = m.render()
+        self.assertIn("# TYPE t_calls_total counter", text)
+        self.assertIn('t_calls_total{method="sendMessage"} 3', text)
+        self.assertIn("t_in_flight 0", text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        m = Metrics()
+        m.histogram("latency_seconds", "Latency", ("route",), buckets=(0.1, 1.0))
+        for value in (0.05, 0.5, 2.0):
+            m.observe("latency_seconds", value, "main")
+        lines = m.render().splitlines()
+        self.assertIn('latency_seconds_bucket{route="main",le="0.1"} 1', lines)
+        self.assertIn('latency_seconds_bucket{route="main",le="1.0"} 2', lines)
+        self.assertIn('latency_seconds_bucket{route="main",le="+Inf"} 3', lines)
+        self.assertIn('latency_seconds_count{route="main"} 3', lines)
+        self.assertIn('latency_seconds_sum{route="main"} 2.55', lines)
+
+    def test_series_are_capped(self):
+        m = Metrics()
+        m.counter("hits_total", "Hits", ("route",))
+        for n in range(MAX_SERIES + 50):
+            m.inc("hits_total", f"r{n}")
+        text = m.render()
+        self.assertEqual(text.count("hits_total{"), MAX_SERIES + 1)
+        self.assertIn('hits_total{route="other"} 50', text)
+
+    def test_label_escaping_and_gauge_fn(self):
+        m = Metrics()
+        m.counter("errors_total", "Errors", ("kind",))
+        m.inc("errors_total", 'a"b\\c\n')
+        m.gauge_fn("queue_depth", "Depth", lambda: 7)
+        text = m.render()
+        self.assertIn('errors_total{kind="a\\"b\\\\c\\n"} 1', text)
+        self.assertIn("queue_depth 7", text)
+
+if __name__ == "__main__":
+    unittest.main()
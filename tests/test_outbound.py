@@ -0,0 +1,128 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from outbound import Outbox
+
+KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("Да", callback_data="yes")]])
+
+class _Query:
+    id = "q1"
+
+    def __init__(self, log):
+        self.log = log
+
+    async def answer(self):
+        await asyncio.sleep(0)
+        self.log.append(("autoAnswer", {}))
+
+def _run(handler, callback=False):
+    # handler(post) выполняется внутри scope; возвращает (вызовы, outbox)
+    log = []
+    outbox = Outbox()
+
+    async def send(endpoint, data, kwargs):
+        await asyncio.sleep(0)
+        log.append((endpoint, dict(data)))
+        return True
+
+    async def post(endpoint, **data):
+        return await outbox.post(endpoint, data, {}, send)
+
+    post.outbox = outbox
+
+    async def scenario():
+        update = SimpleNamespace(callback_query=_Query(log) if callback else None)
+        async with outbox.scope(update, send):
+            await handler(post)
+        await asyncio.gather(*outbox._acks)
+
+    asyncio.run(scenario())
+    return log, outbox
+
+class AutoAnswerTest(unittest.TestCase):
+    def test_explicit_answer_first_wins(self):
+        async def handler(post):
+            await post("answerCallbackQuery", callback_query_id="q1", text="Ошибка выбора.")
+
+        log, outbox = _run(handler, callback=True)
+        self.assertEqual(log, [("answerCallbackQuery", {"callback_query_id": "q1", "text": "Ошибка выбора."})])
+        self.assertEqual(outbox.counters["auto_acks"], 0)
+        self.assertEqual(outbox.counters["skipped_answers"], 0)
+
+    def test_auto_answer_goes_with_first_call(self):
+        async def handler(post):
+            await post("editMessageText", chat_id=1, message_id=5, text="Меню", reply_markup=KEYBOARD)
+            await post("answerCallbackQuery", callback_query_id="q1", text="поздно")
+
+        log, outbox = _run(handler, callback=True)
+        self.assertEqual(sorted(endpoint for endpoint, _ in log), ["autoAnswer", "editMessageText"])
+        self.assertEqual(outbox.counters["auto_acks"], 1)
+        self.assertEqual(outbox.counters["skipped_answers"], 1)
+
+    def test_auto_answer_when_handler_makes_no_calls(self):
+        async def handler(post):
+            pass
+
+        log, outbox = _run(handler, callback=True)
+        self.assertEqual(log, [("autoAnswer", {})])
+        self.assertEqual(outbox.histogram, {1: 1})
+
+    def test_no_answer_for_messages(self):
+        async def handler(post):
+            await post("sendMessage", chat_id=1, text="Привет", reply_markup=KEYBOARD)
+
+        log, outbox = _run(handler)
+        self.assertEqual([endpoint for endpoint, _ in log], ["sendMessage"])
+        self.assertEqual(outbox.counters["auto_acks"], 0)
+
+class HeldMessagesTest(unittest.TestCase):
+    def test_text_merges_with_following_keyboard_prompt(self):
+        async def handler(post):
+            self.assertIs(await post("sendMessage", chat_id=1, text="Результат\n"), True)
+            await post("sendMessage", chat_id=1, text="Добавить ещё материал?", reply_markup=KEYBOARD)
+
+        log, outbox = _run(handler)
+        self.assertEqual(len(log), 1)
+        self.assertEqual(log[0][1]["text"], "Результат\n\nДобавить ещё материал?")
+        self.assertIs(log[0][1]["reply_markup"], KEYBOARD)
+        self.assertEqual(outbox.counters["merged"], 1)
+
+    def test_plain_text_is_escaped_when_merged_with_html(self):
+        async def handler(post):
+            await post("sendMessage", chat_id=1, text="a < b")
+            await post("sendMessage", chat_id=1, text="<b>Итого</b>", parse_mode="HTML", reply_markup=KEYBOARD)
+
+        log, _ = _run(handler)
+        self.assertEqual(log[0][1]["text"], "a &lt; b\n\n<b>Итого</b>")
+        self.assertEqual(log[0][1]["parse_mode"], "HTML")
+
+    def test_other_chat_keeps_order(self):
+        async def handler(post):
+            await post("sendMessage", chat_id=1, text="первое")
+            await post("sendMessage", chat_id=2, text="второе", reply_markup=KEYBOARD)
+
+        log, _ = _run(handler)
+        self.assertEqual([data["text"] for _, data in log], ["первое", "второе"])
+
+    def test_held_message_is_flushed_at_end(self):
+        async def handler(post):
+            await post("sendMessage", chat_id=1, text="последнее")
+
+        log, outbox = _run(handler)
+        self.assertEqual(log, [("sendMessage", {"chat_id": 1, "text": "последнее"})])
+        self.assertEqual(outbox.stats()["calls_per_update"], 1.0)
+
+    def test_disabled_sends_immediately(self):
+        async def handler(post):
+            with post.outbox.disabled():
+                await post("sendMessage", chat_id=1, text="статус")
+            await post("sendMessage", chat_id=1, text="ещё")
+
+        log, _ = _run(handler)
+        self.assertEqual([data["text"] for _, data in log], ["статус", "ещё"])
+
+if __name__ == "__main__":
+    unittest.main()
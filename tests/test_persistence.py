@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from persistence import SqlitePersistence, dumps, loads
+from userset import UserIdSet
+
+class SqlitePersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.db = os.path.join(self._tmp.name, "sessions.db")
+
+    def test_write_behind_batches_updates(self):
+        async def scenario():
+            persistence = SqlitePersistence(self.db)
+            await persistence.get_chat_data()
+            await persistence.update_chat_data(1, {"phase": "a"})
+            await persistence.update_chat_data(1, {"phase": "b"})  # в буфере остаётся последнее
+            await persistence.update_chat_data(2, {"phase": "c"})
+            await persistence.update_user_data(7, {"name": "x"})
+            self.assertEqual(persistence.counters["batches"], 0)  # записи ещё не было
+            await persistence._flush_task
+            self.assertEqual(persistence.counters["batches"], 1)
+            self.assertEqual(persistence.counters["rows_written"], 3)
+            await persistence.drop_chat_data(2)
+            await persistence.flush()
+            self.assertEqual(persistence.counters["rows_deleted"], 1)
+
+            reopened = SqlitePersistence(self.db)
+            chats = await reopened.get_chat_data()
+            users = await reopened.get_user_data()
+            await reopened.flush()
+            return chats, users
+
+        chats, users = asyncio.run(scenario())
+        self.assertEqual(chats, {1: {"phase": "b"}})
+        self.assertEqual(users, {7: {"name": "x"}})
+
+    def test_flush_writes_what_is_still_pending(self):
+        async def scenario():
+            persistence = SqlitePersistence(self.db)
+            await persistence.update_chat_data(3, {"n": 1})
+            await persistence.flush()  # не дожидаясь фоновой записи
+            reopened = SqlitePersistence(self.db)
+            chats = await reopened.get_chat_data()
+            await reopened.flush()
+            return chats
+
+        self.assertEqual(asyncio.run(scenario()), {3: {"n": 1}})
+
+    def test_evicted_session_restored_from_pending_and_disk(self):
+        async def scenario():
+            persistence = SqlitePersistence(self.db)
+            await persistence.get_chat_data()
+            persistence.stage("chat", 5, {"phase": "wall", "width": 3.2})
+            # Вернулся раньше, чем буфер записан: данные берутся из буфера
+            data = {"phase": "new"}
+            await persistence.refresh_chat_data(5, data)
+            self.assertEqual(data, {"phase": "new", "width": 3.2})
+            # Не выгружена — второй refresh ничего не трогает
+            data2 = {}
+            await persistence.refresh_chat_data(5, data2)
+            self.assertEqual(data2, {})
+
+            persistence.stage("chat", 6, {"phase": "slat"})
+            await persistence.flush()
+            self.assertEqual(persistence.counters["restored"], 1)
+
+            with sqlite3.connect(self.db) as conn:
+                conn.execute("UPDATE sessions SET updated = 0 WHERE id = 6")
+            # Старше load_ttl: при старте в память не поднимается, но подтягивается по запросу
+            stale = SqlitePersistence(self.db, load_ttl=3600)
+            chats = await stale.get_chat_data()
+            restored = {}
+            # Запросы из loop и фоновая запись идут через один поток базы
+            await asyncio.gather(
+                stale.refresh_chat_data(6, restored),
+                stale.update_chat_data(8, {"phase": "x"}),
+            )
+            await stale.flush()
+            return chats, restored, stale.counters
+
+        chats, restored, counters = asyncio.run(scenario())
+        self.assertNotIn(6, chats)
+        self.assertEqual(restored, {"phase": "slat"})
+        self.assertEqual(counters["restored"], 1)
+        self.assertEqual(counters["rows_written"], 1)
+
+    def test_user_id_set_round_trip(self):
+        ids = UserIdSet(range(0, 2000, 3))
+        ids.add(-1001234567890)
+        path = os.path.join(self._tmp.name, "users.bin")
+        ids.save(path)
+        loaded = UserIdSet.load(path)  # поверх mmap
+        for data in ({"seen": UserIdSet([1, 2])}, {"seen": ids}, {"seen": loaded}):
+            blob = dumps(data)
+            restored = loads(blob)["seen"]
+            self.assertEqual(list(restored), list(data["seen"]))
+        self.assertEqual(dumps({"seen": loaded})[:1], b"\x01")  # больше 512 байт — сжато
+        restored.add(5)
+        self.assertIn(5, restored)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import asyncio
+import time
+import unittest
+
+from profiler import Profiler
+
+class _Bot:
+    def __init__(self):
+        self.documents = []
+
+    async def send_document(self, chat_id, document, filename, caption):
+        self.documents.append((filename, document.getvalue().decode(), caption))
+
+    async def send_message(self, chat_id, text):
+        self.documents.append((None, text, None))
+
+class ProfilerTest(unittest.TestCase):
+    def test_cpu_profile_is_collapsed_stacks(self):
+        bot = _Bot()
+
+        async def scenario():
+            profiler = Profiler(bot, interval=0.005)
+            self.assertTrue(profiler.start("cpu", 0.1, 1))
+            self.assertFalse(profiler.start("memory", 0.1, 1))
+            await profiler._task
+            return profiler
+
+        profiler = asyncio.run(scenario())
+        filename, body, _ = bot.documents[0]
+        self.assertTrue(filename.endswith(".collapsed"))
+        stack, count = body.splitlines()[0].rsplit(" ", 1)
+        self.assertGreater(int(count), 0)
+        self.assertIn(";", stack)
+        self.assertGreater(profiler.stats()["samples"], 0)
+
+    def test_stop_interrupts_sampling_thread(self):
+        bot = _Bot()
+
+        async def scenario():
+            profiler = Profiler(bot)
+            profiler.start("cpu", 300, 1)
+            await asyncio.sleep(0.05)
+            await profiler.stop()
+            self.assertFalse(profiler.running)
+
+        started = time.monotonic()
+        asyncio.run(scenario())  # asyncio.run ждёт потоки executor
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(bot.documents, [])
+
+    def test_memory_snapshot(self):
+        bot = _Bot()
+
+        async def scenario():
+            profiler = Profiler(bot)
+            profiler.start("memory", 0.05, 1)
+            await profiler._task
+
+        asyncio.run(scenario())
+        filename, body, caption = bot.documents[0]
+        self.assertTrue(filename.startswith("memory-"))
+        self.assertIn("Top 40 allocation sites", body)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+
+from catalog import build_catalog_index
+from quotes import clear_quote_cache, quote_item, render_quote
+
+def _catalog():
+    wall_products = {
+        "Панель": {8: {"width_mm": 1220, "weight_per_m2": 8.0, "panels": {2800: {"area_m2": 3.416, "price_rub": 12500}}}},
+        "Лёгкая": {5: {"width_mm": 1000, "panels": {3000: {"area_m2": 3.0, "price_rub": 5000}}}},
+    }
+    return build_catalog_index(
+        wall_products,
+        {"p": "Панель", "l": "Лёгкая"},
+        {8: {"Старт": 450}},
+        {"wpc": 1200, "wood": 800},
+        {"v1": {"code": "3D-01", "width_mm": 500, "height_mm": 500, "area_m2": 0.25, "price_rub": 700}},
+    )
+
+CATALOG = _catalog()
+
+def _render(item, width=4.0, height=2.7, deduct=0.0, calc_mode=None, custom_name="Гостиная", html=True):
+    return render_quote(quote_item(CATALOG, item, width, height, deduct, calc_mode), custom_name, html)
+
+# Эталонный текст: строки заканчиваются двумя пробелами (перенос в Markdown), как в сообщении бота
+WALL_BY_SIZE = (
+    "Выбранный материал: Панель  \n"
+    "Толщина: 8 мм  \n"
+    "Высота: 2800 мм (стыковка панелей)  \n"
+    "Название/артикул клиента: <b>«Гостиная»</b>  \n"
+    "\n"
+    "🔹 Ширина зоны отделки: 4000.0 мм (или 4.00 м)  \n"
+    "🔹 Площадь зоны отделки: 4.00 м × 2.7 м = 10.80 м²  \n"
+    "🔹 Площадь к вычету (окна/двери): 1.50 м²  \n"
+    "🔹 Общая площадь для покрытия: 10.80 м² - 1.50 м² = 9.30 м²  \n"
+    "\n"
+    "🔸 Площадь одной панели (2800 мм × 1220 мм): 3.416 м²  \n"
+    "🔸 Необходимое количество панелей: 9.30 м² ÷ 3.416 м² ≈ 2.72 (округляем до 4 панелей, с учётом рядов: 1 рядов × 4 панелей в ряду)  \n"
+    "🔸 Общая площадь закупаемых панелей: 4 панелей × 3.416 м² = 13.7 м²  \n"
+    "\n"
+    "🔹 Отходы:  \n"
+    "- Площадь отходов: 13.7 м² - 9.30 м² = 4.36 м²  \n"
+    "- Процент отходов: (4.36 м² ÷ 13.7 м²) × 100 ≈ 31.94%  \n"
+    "\n"
+    "💰 Ориентировочная стоимость: 4 панелей × 12,500 ₽ = 50,000 ₽  \n"
+    "\n"
+    "Общий вес: 109.31 кг  \n"
+    "\n"
+    "____________________________________________________________  \n"
+    "Итог:  \n"
+    "- Необходимое количество панелей: 4  \n"
+    "- Общая стоимость: 50,000 ₽  \n"
+    "- Отходы: 4.36 м² (31.94%)"
+)
+
+WALL_PANEL_MODE = (
+    "Выбранный материал: Лёгкая  \n"
+    "Толщина: 5 мм  \n"
+    "Высота: 3000 мм (обрезка по высоте панели)  \n"
+    "Название/артикул клиента: <b>«Гостиная»</b>  \n"
+    "\n"
+    "🔹 Ширина зоны отделки: 3200.0 мм (или 3.20 м)  \n"
+    "🔹 Площадь зоны отделки: 3.20 м × 3.0 м = 9.60 м²  \n"
+    "🔹 Площадь к вычету (окна/двери): 0.00 м²  \n"
+    "🔹 Общая площадь для покрытия: 9.60 м² - 0.00 м² = 9.60 м²  \n"
+    "\n"
+    "🔸 Площадь одной панели (3000 мм × 1000 мм): 3.0 м²  \n"
+    "🔸 Необходимое количество панелей: 9.60 м² ÷ 3.0 м² ≈ 3.20 (округляем до 4 панелей, с учётом рядов: 1 рядов × 4 панелей в ряду)  \n"
+    "🔸 Общая площадь закупаемых панелей: 4 панелей × 3.0 м² = 12.0 м²  \n"
+    "\n"
+    "🔹 Отходы:  \n"
+    "- Площадь отходов: 12.0 м² - 9.60 м² = 2.40 м²  \n"
+    "- Процент отходов: (2.40 м² ÷ 12.0 м²) × 100 ≈ 20.00%  \n"
+    "\n"
+    "💰 Ориентировочная стоимость: 4 панелей × 5,000 ₽ = 20,000 ₽  \n"
+    "\n"
+    "____________________________________________________________  \n"
+    "Итог:  \n"
+    "- Необходимое количество панелей: 4  \n"
+    "- Общая стоимость: 20,000 ₽  \n"
+    "- Отходы: 2.40 м² (20.00%)"
+)
+
+WALL_BY_PANELS_PLAIN = (
+    "Выбранный материал: Панель  \n"
+    "Толщина: 8 мм  \n"
+    "Высота: 2800 мм  \n"
+    "Название/артикул клиента: «Кухня»  \n"
+    "\n"
+    "🔸 Количество панелей: 5  \n"
+    "🔸 Площадь одной панели (2800 мм × 1220 мм): 3.416 м²  \n"
+    "🔸 Общая площадь: 5 панелей × 3.416 м² = 17.1 м²  \n"
+    "\n"
+    "💰 Ориентировочная стоимость: 5 панелей × 12,500 ₽ = 62,500 ₽  \n"
+    "\n"
+    "Общий вес: 136.64 кг  \n"
+    "\n"
+    "____________________________________________________________  \n"
+    "Итог:  \n"
+    "- Необходимое количество панелей: 5  \n"
+    "- Общая стоимость: 62,500 ₽  "
+)
+
+class RenderQuoteTest(unittest.TestCase):
+    def setUp(self):
+        clear_quote_cache()
+
+    def test_wall_by_size(self):
+        item = {"category": "walls", "product_code": "p", "thickness": 8, "length": 2800}
+        self.assertEqual(_render(item, 4, 2.7, 1.5), WALL_BY_SIZE)
+
+    def test_wall_panel_mode_without_weight(self):
+        item = {"category": "walls", "product_code": "l", "thickness": 5, "length": 3000}
+        self.assertEqual(_render(item, 3.2, 3.5, calc_mode="panel"), WALL_PANEL_MODE)
+
+    def test_wall_by_panel_count_plain(self):
+        item = {"category": "walls", "product_code": "p", "thickness": 8, "length": 2800, "known_panels": 5}
+        self.assertEqual(_render(item, custom_name="Кухня", html=False), WALL_BY_PANELS_PLAIN)
+
+    def test_wall_by_panel_count_without_weight(self):
+        item = {"category": "walls", "product_code": "l", "thickness": 5, "length": 3000, "known_panels": 2}
+        text = _render(item)
+        self.assertNotIn("Общий вес", text)
+        self.assertIn("🔸 Общая площадь: 2 панелей × 3.0 м² = 6.0 м²  \n", text)
+        self.assertTrue(text.endswith("- Общая стоимость: 10,000 ₽  "))
+
+    def test_profile(self):
+        item = {"category": "profiles", "thickness": 8, "type": "Старт", "quantity": 3}
+        self.assertEqual(_render(item), "\nПрофиль: Старт, 8 мм\nКоличество: 3 шт.\n💰 Стоимость: 1350 ₽\n")
+
+    def test_slats(self):
+        # Длина стены без хвостовых нулей: 4 и 4.0 дают один текст, дробная — до сотых
+        expected = (
+            "\nРеечные панели: WPC\nДлина стены: 4 м.п.\nНеобходимая длина: 4.40 м.п.\n"
+            "Отходы: 0.40 м.п. (10%)\n💰 Стоимость: 6000 ₽\n"
+        )
+        self.assertEqual(_render({"category": "slats", "type": "wpc"}, 4.0), expected)
+        self.assertEqual(_render({"category": "slats", "type": "wpc"}, 4), expected)
+        self.assertEqual(
+            _render({"category": "slats", "type": "wood"}, 22 / 3),
+            "\nРеечные панели: Деревянные\nДлина стены: 7.33 м.п.\nНеобходимая длина: 8.07 м.п.\n"
+            "Отходы: 0.73 м.п. (10%)\n💰 Стоимость: 7200 ₽\n",
+        )
+        self.assertIn("Длина стены: 3.5 м.п.", _render({"category": "slats", "type": "wood"}, 3.5))
+
+    def test_3d(self):
+        self.assertEqual(
+            _render({"category": "3d", "var": "v1"}, 2.0, 1.3),
+            "\n3D панели: 3D-01\nПлощадь панели: 0.25 м²\nКоличество: 11 шт.\nОбщая площадь: 2.75 м²\n"
+            "Отходы: 0.15 м² (5.45%)\n💰 Стоимость: 7700 ₽\n",
+        )
+
+    def test_unknown_category(self):
+        self.assertIsNone(quote_item(CATALOG, {"category": "flex"}, 1, 1, 0))
+        self.assertEqual(render_quote(None), "")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from room import looks_like_room, parse_room
+
+class ParseRoomTest(unittest.TestCase):
+    def test_sections(self):
+        room = parse_room("стены: 3.2x2.7, 4.1x2.7; окна: 1.4x1.5 x2; дверь 0.9x2.1")
+        self.assertEqual(room.walls, ((3.2, 2.7), (4.1, 2.7)))
+        self.assertEqual(room.windows, ((1.4, 1.5, 2),))
+        self.assertEqual(room.doors, ((0.9, 2.1, 1),))
+        self.assertAlmostEqual(room.deduct_area, 1.4 * 1.5 * 2 + 0.9 * 2.1)
+
+    def test_walls_without_keywords_and_counts(self):
+        room = parse_room("3x2,7 x2 и 4x2,7")
+        self.assertEqual(room.walls, ((3, 2.7), (3, 2.7), (4, 2.7)))
+        room = parse_room("3x2.7 (2 шт)")
+        self.assertEqual(len(room.walls), 2)
+
+    def test_millimetres(self):
+        room = parse_room("3200x2700", unit="mm")
+        self.assertEqual(room.walls, ((3.2, 2.7),))
+
+    def test_label_before_sections_is_ignored(self):
+        room = parse_room("Комната. Стены: 3x2.7, 4x2.7")
+        self.assertEqual(len(room.walls), 2)
+
+    def test_unparsed_text_rejects_room(self):
+        for text in ("3.2x2.7x2.5", "3.2x2.7 5", "3.2x2.7, 4.1x?", "стены: 3x2.7 окна: два"):
+            self.assertIsNone(parse_room(text), msg=text)
+
+    def test_not_a_room(self):
+        self.assertIsNone(parse_room("3,2"))
+        self.assertFalse(looks_like_room("3,2"))
+        self.assertTrue(looks_like_room("3.2x2.7x2.5"))
+
+    def test_openings_larger_than_walls(self):
+        self.assertIsNone(parse_room("стены: 1x1; окна: 2x2"))
+
+    def test_oversized_walls(self):
+        # Миллиметры, введённые как метры
+        self.assertIsNone(parse_room("стены: 3200x2700"))
+        self.assertIsNone(parse_room("3.2x2700"))
+        self.assertIsNone(parse_room("120x2.7"))
+        self.assertIsNotNone(parse_room("100x20"))
+        self.assertIsNotNone(parse_room("3200x2700", "mm"))
+
+    def test_height_groups(self):
+        room = parse_room("3x2.7, 4x2.7, 2x3")
+        self.assertEqual([(w, h) for w, h, _ in room.height_groups()], [(2, 3), (7, 2.7)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import sessions
+from sessions import SessionEvictor, deep_sizeof
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class SessionEvictorTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        patcher = mock.patch.object(sessions.time, "monotonic", self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.chats = {}
+        self.users = {}
+        self.log = []
+
+    def make(self, ttl=100, budget_bytes=10 ** 9, before_sweep=True):
+        async def flush():
+            self.log.append(("flush",))
+
+        return SessionEvictor(
+            {"chat": self.chats, "user": self.users},
+            ttl=ttl,
+            budget_bytes=budget_bytes,
+            on_evict=lambda kind, key, data: self.log.append(("evict", kind, key, data)),
+            before_sweep=flush if before_sweep else None,
+        )
+
+    def open_session(self, evictor, kind, key, data):
+        (self.chats if kind == "chat" else self.users)[key] = data
+        evictor.touch(kind, key)
+
+    def test_ttl_eviction(self):
+        evictor = self.make(ttl=100)
+        self.open_session(evictor, "chat", 1, {"phase": "a"})
+        self.clock.now += 60
+        self.open_session(evictor, "user", 2, {"name": "b"})
+        self.clock.now += 50  # chat 1 простаивает 110 с, user 2 — 50 с
+        asyncio.run(evictor.sweep())
+        self.assertEqual(self.log, [("flush",), ("evict", "chat", 1, {"phase": "a"})])
+        self.assertEqual(self.chats, {})
+        self.assertIn(2, self.users)
+        self.assertEqual(evictor.counters["evicted_ttl"], 1)
+        self.assertEqual(evictor.stats()["sessions"], 1)
+
+    def test_touch_keeps_session(self):
+        evictor = self.make(ttl=100)
+        self.open_session(evictor, "chat", 1, {"phase": "a"})
+        self.clock.now += 90
+        evictor.touch("chat", 1)
+        self.clock.now += 90
+        asyncio.run(evictor.sweep())
+        self.assertEqual(self.log, [])  # вытеснять нечего — before_sweep не вызывается
+        self.assertEqual(evictor.counters["sweeps"], 1)
+
+    def test_budget_evicts_least_recently_used(self):
+        sizes = {}
+        for key in (1, 2, 3):
+            sizes[key] = deep_sizeof({"payload": "x" * 1000 * key})
+        evictor = self.make(ttl=10 ** 6, budget_bytes=sizes[3] + sizes[1] + 10)
+        for key in (1, 2, 3):
+            self.open_session(evictor, "chat", key, {"payload": "x" * 1000 * key})
+            self.clock.now += 1
+        evictor.touch("chat", 1)  # 1 снова свежая: самая давняя теперь 2
+        asyncio.run(evictor.sweep())
+        self.assertEqual([entry[:3] for entry in self.log], [("flush",), ("evict", "chat", 2)])
+        self.assertEqual(sorted(self.chats), [1, 3])
+        self.assertEqual(evictor.counters["evicted_budget"], 1)
+        self.assertEqual(evictor.counters["evicted_bytes"], sizes[2])
+        self.assertEqual(evictor.total_bytes(), sizes[1] + sizes[3])
+
+    def test_flush_before_evict_and_returning_user_kept(self):
+        evictor = self.make(ttl=100)
+        self.open_session(evictor, "chat", 1, {"phase": "a"})
+        self.open_session(evictor, "chat", 2, {"phase": "b"})
+        self.clock.now += 200
+
+        async def flush():
+            # Пока пишется хранилище, пользователь 2 прислал апдейт
+            self.log.append(("flush", sorted(self.chats)))
+            evictor.touch("chat", 2)
+
+        evictor.before_sweep = flush
+        asyncio.run(evictor.sweep())
+        self.assertEqual(self.log, [("flush", [1, 2]), ("evict", "chat", 1, {"phase": "a"})])
+        self.assertEqual(self.chats, {2: {"phase": "b"}})
+
+    def test_without_before_sweep(self):
+        evictor = self.make(ttl=100, before_sweep=False)
+        self.open_session(evictor, "user", 5, {"k": 1})
+        self.clock.now += 101
+        asyncio.run(evictor.sweep())
+        self.assertEqual(self.log, [("evict", "user", 5, {"k": 1})])
+
+    def test_deep_sizeof_counts_nested_once(self):
+        shared = ["x" * 100]
+        self.assertGreater(deep_sizeof({"a": shared}), deep_sizeof({"a": []}) + 100)
+        self.assertLess(deep_sizeof({"a": shared, "b": shared}), deep_sizeof({"a": shared, "b": ["y" * 100]}))
+
+if __name__ == "__main__":
+    unittest.main()
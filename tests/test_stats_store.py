@@ -0,0 +1,126 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import stats_store
+from stats_store import StatsStore
+from userset import UserIdSet
+
+DAY = "2026-10-16"
+
+class StatsStoreTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        patcher = mock.patch.object(stats_store, "_today", return_value=DAY)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def path(self, name):
+        return os.path.join(self._tmp.name, name)
+
+    def make(self, compact_every=1000):
+        store = StatsStore(self.path("stats.json"), self.path("stats.log"),
+                           self.path("users.bin"), self.path("users_today.bin"), compact_every)
+        store.load()
+        return store
+
+    def read_log(self):
+        with open(self.path("stats.log")) as f:
+            return f.read()
+
+    def test_log_replay(self):
+        store = self.make()
+        store.add_user(1)
+        store.add_user(2)
+        store.add_user(1)  # уже учтён сегодня — в журнал не пишется
+        store.add_calc()
+        store.remove_users([2, 99])
+        self.assertEqual(self.read_log(), f"1 U 1 {DAY}\n2 U 2 {DAY}\n3 C {DAY}\n4 R 2 {DAY}\n")
+        # Без close: как после падения, снимка нет — всё из журнала
+        replayed = self.make()
+        self.assertEqual(replayed.summary(), {"users_today": 1, "calc_today": 1, "users": 1, "calc_count": 1})
+        self.assertEqual(replayed.seq, 4)
+        replayed.add_calc()
+        self.assertTrue(self.read_log().endswith(f"5 C {DAY}\n"))
+
+    def test_torn_last_line_skipped_and_truncated(self):
+        store = self.make()
+        store.add_user(1)
+        store.add_calc()
+        with open(self.path("stats.log"), "a") as f:
+            f.write("3 C 2026-1")  # запись оборвалась на середине
+        replayed = self.make()
+        self.assertEqual(replayed.summary()["calc_count"], 1)
+        self.assertEqual(replayed.seq, 2)
+        self.assertEqual(self.read_log(), f"1 U 1 {DAY}\n2 C {DAY}\n")
+        replayed.add_calc()
+        self.assertEqual(self.make().summary()["calc_count"], 2)
+
+    def test_malformed_line_skipped(self):
+        with open(self.path("stats.log"), "w") as f:
+            f.write(f"1 U 7 {DAY}\nx C {DAY}\n2 U\n3 C {DAY}\n")
+        store = self.make()
+        self.assertEqual(store.summary(), {"users_today": 1, "calc_today": 1, "users": 1, "calc_count": 1})
+        self.assertEqual(store.seq, 3)
+
+    def test_seq_skips_events_already_in_snapshot(self):
+        store = self.make()
+        store.add_user(1)
+        store.add_calc()
+        log = self.read_log()
+        store.close()
+        # Падение между записью снимка и очисткой журнала: журнал остался
+        with open(self.path("stats.log"), "w") as f:
+            f.write(log + f"3 C {DAY}\n")
+        replayed = self.make()
+        self.assertEqual(replayed.summary(), {"users_today": 1, "calc_today": 2, "users": 1, "calc_count": 2})
+
+    def test_compaction_every_n_events(self):
+        store = self.make(compact_every=1000)
+        for i in range(999):
+            store.add_user(i)
+        self.assertFalse(os.path.exists(self.path("stats.json")))
+        self.assertEqual(self.read_log().count("\n"), 999)
+        store.add_calc()
+        self.assertEqual(self.read_log(), "")
+        with open(self.path("stats.json")) as f:
+            self.assertEqual(json.load(f)["seq"], 1000)
+        store.add_calc()
+        store.add_user(5000)
+        with open(self.path("stats.log"), "a") as f:
+            f.write("1003 U 60")
+        replayed = self.make()
+        self.assertEqual(replayed.summary(), {"users_today": 1000, "calc_today": 2, "users": 1000, "calc_count": 2})
+        self.assertIn(5000, replayed.users)
+        self.assertEqual(replayed.seq, 1002)
+
+    def test_migration_from_json_lists(self):
+        with open(self.path("stats.json"), "w") as f:
+            json.dump({"users": [3, 1, 2], "users_today": [2], "calc_count": 10,
+                       "calc_today": 4, "today": DAY}, f)
+        with open(self.path("stats.log"), "w") as f:
+            f.write(f"1 U 4 {DAY}\n")
+        store = self.make()
+        self.assertEqual(store.summary(), {"users_today": 2, "calc_today": 4, "users": 4, "calc_count": 10})
+        # Сразу переписан в новый формат: списков в JSON больше нет
+        with open(self.path("stats.json")) as f:
+            snapshot = json.load(f)
+        self.assertNotIn("users", snapshot)
+        self.assertEqual(list(UserIdSet.load(self.path("users.bin"))), [1, 2, 3, 4])
+        self.assertEqual(self.read_log(), "")
+        self.assertEqual(self.make().summary(), store.summary())
+
+    def test_day_rollover(self):
+        store = self.make()
+        store.add_user(1)
+        store.add_calc()
+        store.close()
+        with mock.patch.object(stats_store, "_today", return_value="2026-10-17"):
+            store = self.make()
+            self.assertEqual(store.summary(), {"users_today": 0, "calc_today": 0, "users": 1, "calc_count": 1})
+
+if __name__ == "__main__":
+    unittest.main()
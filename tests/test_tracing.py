@@ -0,0 +1,89 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+
+from tracing import Tracer, render_slowest
+
+class TracerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "traces.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _spans(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_span_outside_trace_is_noop(self):
+        tracer = Tracer()
+        with tracer.span("stats_io") as span:
+            self.assertIsNone(span)
+        self.assertEqual(tracer.stats()["traces"], 0)
+
+    def test_slow_trace_is_exported_with_parents(self):
+        tracer = Tracer()
+        tracer.configure(self.path, sample_rate=0.0, slow_ms=0)
+        with tracer.span("webhook", root=True):
+            with tracer.span("dispatch", root=True, route="main"):
+                with tracer.span("bot_api", method="sendMessage"):
+                    pass
+        spans = self._spans()
+        self.assertEqual([s["name"] for s in spans], ["webhook", "dispatch", "bot_api"])
+        self.assertEqual(len({s["traceId"] for s in spans}), 1)
+        self.assertEqual(spans[0]["parentSpanId"], "")
+        self.assertEqual(spans[1]["parentSpanId"], spans[0]["spanId"])
+        self.assertEqual(spans[2]["parentSpanId"], spans[1]["spanId"])
+        self.assertEqual(spans[2]["attributes"], {"method": "sendMessage"})
+        self.assertLessEqual(spans[0]["startTimeUnixNano"], spans[2]["startTimeUnixNano"])
+        self.assertEqual(tracer.stats(), {"traces": 1, "exported": 1, "kept": 1})
+
+    def test_fast_trace_is_kept_but_not_exported(self):
+        tracer = Tracer()
+        tracer.configure(self.path, sample_rate=0.0, slow_ms=10_000)
+        with tracer.span("dispatch", root=True):
+            pass
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(len(tracer.slowest(5)), 1)
+
+    def test_keeps_only_slowest(self):
+        tracer = Tracer()
+        tracer.configure(None, keep=2)
+        for delay in (0.0, 0.02, 0.01):
+            with tracer.span("dispatch", root=True, delay=delay):
+                time.sleep(delay)
+        self.assertEqual([t.root.attrs["delay"] for t in tracer.slowest(5)], [0.02, 0.01])
+
+    def test_error_is_recorded(self):
+        tracer = Tracer()
+        tracer.configure(self.path, slow_ms=0)
+        with self.assertRaises(KeyError):
+            with tracer.span("dispatch", root=True):
+                raise KeyError("x")
+        self.assertEqual(self._spans()[0]["attributes"], {"error": "KeyError"})
+
+    def test_file_is_rotated(self):
+        tracer = Tracer()
+        tracer.configure(self.path, slow_ms=0, max_bytes=10)
+        for _ in range(2):
+            with tracer.span("dispatch", root=True):
+                pass
+        self.assertTrue(os.path.exists(self.path + ".1"))
+        self.assertEqual(len(self._spans()), 1)
+
+    def test_render_slowest_uses_dispatch_route(self):
+        tracer = Tracer()
+        with tracer.span("webhook", root=True):
+            with tracer.span("dispatch", root=True, handler="callback", route="calc_cat", update_id=7):
+                with tracer.span("calculate_item"):
+                    pass
+        text = render_slowest(tracer.slowest(1))
+        self.assertIn("handler=callback route=calc_cat update_id=7", text)
+        self.assertIn("dispatch:calc_cat", text)
+        self.assertEqual(render_slowest([]), "Трассировок пока нет.")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from update_pipeline import ChatScheduler, UpdateDeduplicator
+
+class UpdateDeduplicatorTest(unittest.TestCase):
+    def test_duplicate_is_dropped(self):
+        dedup = UpdateDeduplicator(size=64)
+        self.assertTrue(dedup.check_and_mark(100))
+        self.assertFalse(dedup.check_and_mark(100))
+        self.assertEqual(dedup.stats()["duplicates"], 1)
+
+    def test_out_of_order_inside_window(self):
+        dedup = UpdateDeduplicator(size=64)
+        self.assertTrue(dedup.check_and_mark(100))
+        self.assertTrue(dedup.check_and_mark(90))
+        self.assertFalse(dedup.check_and_mark(90))
+
+    def test_window_slides_forward(self):
+        dedup = UpdateDeduplicator(size=64)
+        self.assertTrue(dedup.check_and_mark(100))
+        # 164 занимает ту же позицию, что и 100: бит должен быть снят при сдвиге
+        self.assertTrue(dedup.check_and_mark(164))
+        self.assertTrue(dedup.check_and_mark(150))
+
+    def test_new_sequence_below_window_resets(self):
+        dedup = UpdateDeduplicator(size=64)
+        self.assertTrue(dedup.check_and_mark(900_000))
+        self.assertTrue(dedup.check_and_mark(1_000))
+        self.assertEqual(dedup.stats()["high"], 1_000)
+        self.assertEqual(dedup.stats()["resets"], 1)
+        self.assertTrue(dedup.check_and_mark(1_001))
+        self.assertFalse(dedup.check_and_mark(1_000))
+
+    def test_forget_allows_retry(self):
+        dedup = UpdateDeduplicator(size=64)
+        self.assertTrue(dedup.check_and_mark(100))
+        dedup.forget(100)
+        self.assertTrue(dedup.check_and_mark(100))
+
+    def test_window_must_be_positive_multiple_of_8(self):
+        for size in (0, -8, 1000 + 4):
+            with self.assertRaises(ValueError):
+                UpdateDeduplicator(size=size)
+        UpdateDeduplicator(size=1000)
+
+    def test_state_survives_restart(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "dedup.bin")
+            dedup = UpdateDeduplicator(size=64, state_file=path)
+            dedup.check_and_mark(100)
+            dedup.save()
+            restored = UpdateDeduplicator(size=64, state_file=path)
+            restored.load()
+            self.assertFalse(restored.check_and_mark(100))
+            self.assertTrue(restored.check_and_mark(101))
+
+def _tap(chat_id, message_id, data, update_id=1):
+    message = SimpleNamespace(chat_id=chat_id, message_id=message_id)
+    return SimpleNamespace(
+        update_id=update_id,
+        callback_query=SimpleNamespace(message=message, data=data),
+        effective_chat=SimpleNamespace(id=chat_id),
+    )
+
+class ChatSchedulerTest(unittest.TestCase):
+    def test_repeated_tap_is_debounced(self):
+        processed = []
+
+        async def process(update):
+            processed.append(update.update_id)
+
+        async def scenario():
+            scheduler = ChatScheduler(process, debounce=60)
+            await scheduler.run(_tap(1, 10, "main|calc", 1))
+            await scheduler.run(_tap(1, 10, "main|calc", 2))
+            await scheduler.run(_tap(1, 10, "main|info", 3))
+            return scheduler
+
+        scheduler = asyncio.run(scenario())
+        self.assertEqual(processed, [1, 3])
+        self.assertEqual(scheduler.stats()["duplicates"], 1)
+
+    def test_same_chat_runs_sequentially(self):
+        events = []
+
+        async def process(update):
+            events.append(("start", update.update_id))
+            await asyncio.sleep(0.01)
+            events.append(("end", update.update_id))
+
+        async def scenario():
+            scheduler = ChatScheduler(process, debounce=0)
+            await asyncio.gather(scheduler.run(_tap(1, 10, "a", 1)), scheduler.run(_tap(1, 11, "b", 2)))
+
+        asyncio.run(scenario())
+        self.assertEqual(events, [("start", 1), ("end", 1), ("start", 2), ("end", 2)])
+
+if __name__ == "__main__":
+    unittest.main()
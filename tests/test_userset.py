@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from userset import UserIdSet
+
+class UserIdSetTest(unittest.TestCase):
+    def test_add_and_contains(self):
+        ids = UserIdSet([5, 3], merge_at=2)
+        self.assertTrue(ids.add(7))
+        self.assertFalse(ids.add(3))
+        self.assertTrue(ids.add(-100))  # слияние буфера
+        self.assertEqual(len(ids), 4)
+        self.assertIn(-100, ids)
+        self.assertNotIn(4, ids)
+        self.assertEqual(list(ids), [-100, 3, 5, 7])
+
+    def test_discard_and_difference_update(self):
+        ids = UserIdSet([1, 2, 3])
+        ids.add(10)
+        ids.discard(10)
+        ids.discard(2)
+        ids.discard(42)
+        self.assertEqual(list(ids), [1, 3])
+        ids.update([4, 5, 6])
+        ids.difference_update([1, 5, 99])
+        self.assertEqual(list(ids), [3, 4, 6])
+
+    def test_union(self):
+        a = UserIdSet([1, 3, 5])
+        b = UserIdSet([2, 3])
+        b.add(6)
+        self.assertEqual(list(a.union(b)), [1, 2, 3, 5, 6])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "users.bin")
+            ids = UserIdSet([203473623, -1001234567890, 55])
+            ids.add(77)
+            ids.save(path)
+            loaded = UserIdSet.load(path)
+            self.assertEqual(len(loaded), 4)
+            self.assertIn(-1001234567890, loaded)
+            # Изменения после load: массив копируется из mmap
+            loaded.add(1)
+            loaded.discard(55)
+            self.assertEqual(list(loaded), [-1001234567890, 1, 77, 203473623])
+
+    def test_empty_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "users.bin")
+            UserIdSet().save(path)
+            self.assertEqual(len(UserIdSet.load(path)), 0)
+
+    def test_broken_files_are_rejected(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "users.bin")
+            UserIdSet([1, 2]).save(path)
+            with open(path, "r+b") as f:
+                f.truncate(os.path.getsize(path) - 4)
+            with self.assertRaises(ValueError):
+                UserIdSet.load(path)
+            with open(path, "wb") as f:
+                f.write(b"JUNK" + bytes(12))
+            with self.assertRaises(ValueError):
+                UserIdSet.load(path)
+
+if __name__ == "__main__":
+    unittest.main()
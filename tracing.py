@@ -0,0 +1,170 @@
+import contextlib
+import contextvars
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ТРАССИРОВКА АПДЕЙТОВ
+# ============================
+
+# Один trace на апдейт: корневой span (webhook или dispatch) и вложенные —
+# разбор JSON, обработчик, calculate_item, запись статистики, каждый запрос
+# к Bot API. Текущий span хранится в contextvar, поэтому span() можно звать
+# из любого модуля без передачи контекста; вне trace он ничего не делает.
+#
+# Сэмплирование по завершении trace: в файл (JSONL, по строке на span, поля
+# как в OTLP) пишутся все trace дольше slow_ms и доля sample_rate остальных.
+# Независимо от этого в памяти держатся keep самых медленных — для /traces.
+# Span, закрывшийся после конца своего trace (фоновая задача), отбрасывается.
+
+_rng = random.Random()  # свой генератор: id и сэмплирование не сдвигают random бота
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "end", "attrs")
+
+    def __init__(self, trace, parent_id, name, attrs):
+        self.trace = trace
+        self.span_id = f"{_rng.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.perf_counter()
+        self.end = None
+        self.attrs = attrs
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+class Trace:
+    __slots__ = ("trace_id", "spans", "started", "started_ns", "finished")
+
+    def __init__(self):
+        self.trace_id = f"{_rng.getrandbits(128):032x}"
+        self.spans = []
+        self.started = time.perf_counter()
+        self.started_ns = time.time_ns()
+        self.finished = False
+
+    @property
+    def root(self) -> Span:
+        return self.spans[0]
+
+_current = contextvars.ContextVar("trace_span", default=None)
+
+class Tracer:
+    def __init__(self):
+        self.path = None
+        self.sample_rate = 0.0
+        self.slow_ms = 1000.0
+        self.keep = 50
+        self.max_bytes = 20 * 1024 * 1024
+        self._slowest = []  # куча (длительность, №, Trace)
+        self._seq = itertools.count()
+        self.counters = {"traces": 0, "exported": 0}
+
+    def configure(self, path=None, sample_rate=0.0, slow_ms=1000.0, keep=50, max_bytes=20 * 1024 * 1024):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.keep = keep
+        self.max_bytes = max_bytes
+
+    @contextlib.contextmanager
+    def span(self, name: str, root: bool = False, **attrs):
+        # root=True: начать новый trace, если сейчас trace нет
+        parent = _current.get()
+        if parent is None or parent.trace.finished:
+            if not root:
+                yield None
+                return
+            trace, parent_id = Trace(), None
+        else:
+            trace, parent_id = parent.trace, parent.span_id
+        span = Span(trace, parent_id, name, attrs)
+        trace.spans.append(span)
+        token = _current.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            span.end = time.perf_counter()
+            _current.reset(token)
+            if parent_id is None:
+                self._finish(trace)
+
+    def annotate(self, **attrs):
+        # Добавить атрибуты текущему span (например, маршрут, известный позже)
+        span = _current.get()
+        if span is not None:
+            span.attrs.update(attrs)
+
+    def _finish(self, trace: Trace):
+        trace.finished = True
+        self.counters["traces"] += 1
+        duration = trace.root.duration_ms
+        entry = (duration, next(self._seq), trace)
+        if len(self._slowest) < self.keep:
+            heapq.heappush(self._slowest, entry)
+        elif duration > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+        if self.path and (duration >= self.slow_ms or _rng.random() < self.sample_rate):
+            self._export(trace)
+
+    def _export(self, trace: Trace):
+        lines = []
+        for span in trace.spans:
+            if span.end is None:
+                continue
+            lines.append(json.dumps({
+                "traceId": trace.trace_id,
+                "spanId": span.span_id,
+                "parentSpanId": span.parent_id or "",
+                "name": span.name,
+                "startTimeUnixNano": trace.started_ns + int((span.start - trace.started) * 1e9),
+                "endTimeUnixNano": trace.started_ns + int((span.end - trace.started) * 1e9),
+                "attributes": span.attrs,
+            }, ensure_ascii=False, default=str))
+        try:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a") as f:
+                f.write("\n".join(lines) + "\n")
+            self.counters["exported"] += 1
+        except OSError as e:
+            logger.error(f"Failed to export trace: {e}")
+
+    def slowest(self, n: int) -> list:
+        return [trace for _, _, trace in heapq.nlargest(n, self._slowest)]
+
+    def stats(self) -> dict:
+        return {**self.counters, "kept": len(self._slowest)}
+
+tracer = Tracer()
+span = tracer.span
+
+def _span_label(s: Span) -> str:
+    detail = s.attrs.get("method") or s.attrs.get("route")
+    return f"{s.name}:{detail}" if detail else s.name
+
+def render_slowest(traces, top_spans: int = 4) -> str:
+    if not traces:
+        return "Трассировок пока нет."
+    lines = [f"🐢 Самые медленные апдейты ({len(traces)}):"]
+    for n, trace in enumerate(traces, 1):
+        root = trace.root
+        children = sorted((s for s in trace.spans[1:] if s.end is not None), key=lambda s: s.duration_ms, reverse=True)
+        attrs = next((s.attrs for s in trace.spans if "route" in s.attrs), root.attrs)
+        where = " ".join(f"{k}={v}" for k, v in attrs.items() if k in ("handler", "route", "update_id"))
+        lines.append(f"{n}. {root.duration_ms:.0f} мс — {where} [{trace.trace_id[:8]}]")
+        for s in children[:top_spans]:
+            lines.append(f"   • {_span_label(s)} {s.duration_ms:.0f} мс")
+    return "\n".join(lines)
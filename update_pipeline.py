@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import os
+import struct
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# ============================
+#   ОЧЕРЕДЬ АПДЕЙТОВ
+# ============================
+
+# Webhook кладёт апдейт в ограниченную очередь и сразу отвечает Telegram 200,
+# а пул воркеров обрабатывает очередь в фоне. Если очередь заполнена —
+# submit() возвращает False, и webhook отвечает 503 (Telegram повторит позже).
+
+class UpdateQueue:
+    def __init__(self, process, maxsize=1000, workers=8, drain_timeout=10.0):
+        self.process = process
+        self.maxsize = maxsize
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self._queue = None
+        self._tasks = []
+        self.counters = {
+            "enqueued": 0,
+            "processed": 0,
+            "errors": 0,
+            "overflow": 0,  # отклонено из-за переполнения (503)
+            "dropped": 0,   # не обработано при остановке
+        }
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> dict:
+        return {"depth": self.depth(), "maxsize": self.maxsize, "workers": len(self._tasks), **self.counters}
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(i), name=f"update-worker-{i}") for i in range(self.workers)]
+        logger.info(f"Update queue started: maxsize={self.maxsize}, workers={self.workers}")
+
+    async def stop(self):
+        if self._queue is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue not drained in {self.drain_timeout}s")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.counters["dropped"] += self._queue.qsize()
+        self._tasks = []
+        logger.info(f"Update queue stopped: {self.stats()}")
+
+    def submit(self, update) -> bool:
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            self.counters["overflow"] += 1
+            return False
+        self.counters["enqueued"] += 1
+        return True
+
+    async def _worker(self, n: int):
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.process(update)
+                self.counters["processed"] += 1
+            except asyncio.CancelledError:
+                self.counters["dropped"] += 1
+                raise
+            except Exception as e:
+                self.counters["errors"] += 1
+                logger.error(f"Worker {n} failed to process update: {e}")
+            finally:
+                self._queue.task_done()
+
+# ============================
+#   ПЛАНИРОВЩИК ПО ЧАТАМ
+# ============================
+
+# Апдейты одного чата выполняются строго по очереди (chat_data мутируется
+# обработчиками), апдейты разных чатов — параллельно. Повторное нажатие той же
+# кнопки на том же сообщении в течение debounce секунд отбрасывается.
+
+class ChatScheduler:
+    def __init__(self, process, debounce=1.5, on_duplicate=None, max_taps=10000):
+        self.process = process
+        self.debounce = debounce
+        self.on_duplicate = on_duplicate
+        self.max_taps = max_taps
+        self._lanes = {}  # chat_id -> [asyncio.Lock, число ожидающих]
+        self._taps = OrderedDict()  # (chat_id, message_id, data) -> время нажатия
+        self.counters = {"scheduled": 0, "duplicates": 0}
+
+    def stats(self) -> dict:
+        return {"lanes": len(self._lanes), **self.counters}
+
+    def _is_duplicate_tap(self, update) -> bool:
+        query = getattr(update, "callback_query", None)
+        if query is None or query.message is None:
+            return False
+        key = (query.message.chat_id, query.message.message_id, query.data)
+        now = time.monotonic()
+        # Чистим устаревшие нажатия (OrderedDict упорядочен по времени)
+        while self._taps:
+            ts = next(iter(self._taps.values()))
+            if now - ts <= self.debounce and len(self._taps) < self.max_taps:
+                break
+            self._taps.popitem(last=False)
+        if key in self._taps:
+            return True
+        self._taps[key] = now
+        return False
+
+    async def run(self, update):
+        if self._is_duplicate_tap(update):
+            self.counters["duplicates"] += 1
+            logger.info(f"Duplicate button tap dropped: update {update.update_id}")
+            if self.on_duplicate is not None:
+                await self.on_duplicate(update)
+            return
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            await self.process(update)
+            return
+        lane = self._lanes.setdefault(chat.id, [asyncio.Lock(), 0])
+        lane[1] += 1
+        self.counters["scheduled"] += 1
+        try:
+            async with lane[0]:
+                await self.process(update)
+        finally:
+            lane[1] -= 1
+            if lane[1] == 0:
+                del self._lanes[chat.id]
+
+# ============================
+#   ДЕДУПЛИКАЦИЯ update_id
+# ============================
+
+# Telegram повторяет апдейт, если webhook ответил ошибкой. update_id растут
+# монотонно, поэтому хватает скользящего окна из size бит вокруг максимального
+# увиденного id: проверка и отметка — O(1), память — size/8 байт.
+# id ниже окна — не повтор: после недели без апдейтов Telegram начинает новую
+# (случайную) последовательность, и она может оказаться меньше старой.
+# В этом случае окно сбрасывается и отсчёт идёт от нового id.
+
+class UpdateDeduplicator:
+    _HEADER = struct.Struct("<qI")
+
+    def __init__(self, size=65536, state_file=None):
+        if size <= 0 or size % 8:
+            raise ValueError(f"Dedup window must be a positive multiple of 8, got {size}")
+        self.size = size
+        self.state_file = state_file
+        self._bits = bytearray(size // 8)
+        self._high = None
+        self.counters = {"seen": 0, "duplicates": 0, "resets": 0}
+
+    def stats(self) -> dict:
+        return {"window": self.size, "high": self._high, **self.counters}
+
+    def _clear(self, start: int, stop: int):
+        # Освобождаем биты для id в (start, stop]
+        if stop - start >= self.size:
+            self._bits[:] = bytes(len(self._bits))
+            return
+        for uid in range(start + 1, stop + 1):
+            pos = uid % self.size
+            self._bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+
+    def check_and_mark(self, update_id: int) -> bool:
+        # True — апдейт новый, False — повтор
+        if self._high is None:
+            self._high = update_id
+        elif update_id > self._high:
+            self._clear(self._high, update_id)
+            self._high = update_id
+        elif update_id <= self._high - self.size:
+            logger.warning(f"update_id {update_id} is below the dedup window (high {self._high}), starting a new sequence")
+            self._bits[:] = bytes(len(self._bits))
+            self._high = update_id
+            self.counters["resets"] += 1
+        pos = update_id % self.size
+        mask = 1 << (pos & 7)
+        if self._bits[pos >> 3] & mask:
+            self.counters["duplicates"] += 1
+            return False
+        self._bits[pos >> 3] |= mask
+        self.counters["seen"] += 1
+        return True
+
+    def forget(self, update_id: int):
+        # Снять отметку, если апдейт так и не был принят (например, очередь полна)
+        if self._high is not None and self._high - self.size < update_id <= self._high:
+            pos = update_id % self.size
+            self._bits[pos >> 3] &= ~(1 << (pos & 7)) & 0xFF
+            self.counters["seen"] -= 1
+
+    def load(self):
+        if not self.state_file or not os.path.exists(self.state_file):
+            return
+        try:
+            with open(self.state_file, "rb") as f:
+                raw = f.read()
+            high, size = self._HEADER.unpack_from(raw)
+            bits = raw[self._HEADER.size:]
+            if size != self.size or len(bits) != len(self._bits):
+                logger.warning(f"Dedup state window {size} != {self.size}, ignoring")
+                return
+            self._high = high
+            self._bits[:] = bits
+            logger.info(f"Dedup state loaded: high update_id={high}")
+        except (OSError, struct.error) as e:
+            logger.warning(f"Could not load dedup state: {e}")
+
+    def save(self):
+        if not self.state_file or self._high is None:
+            return
+        tmp = self.state_file + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(self._HEADER.pack(self._high, self.size))
+                f.write(self._bits)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save dedup state: {e}")
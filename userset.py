@@ -0,0 +1,142 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+# ============================
+#   КОМПАКТНОЕ МНОЖЕСТВО ID
+# ============================
+
+# Отсортированный массив int64 (8 байт на id вместо ~60 у set[int]) плюс
+# небольшой буфер свежих добавлений, который вливается в массив пачками.
+# Проверка членства — бинарный поиск, мощность — O(1).
+#
+# Файл: заголовок "EUID" + версия + количество, затем отсортированные int64 (little-endian).
+# load() отображает файл через mmap и ищет прямо по нему, без копирования;
+# копия в память делается только при первом слиянии буфера.
+
+_MAGIC = b"EUID"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQ")
+
+class UserIdSet:
+    __slots__ = ("_ids", "_pending", "_mmap", "merge_at")
+
+    def __init__(self, ids=(), merge_at=4096):
+        self._ids = array('q', sorted(set(ids)))
+        self._pending = set()
+        self._mmap = None
+        self.merge_at = merge_at
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._pending)
+
+    def _in_sorted(self, chat_id: int) -> bool:
+        ids = self._ids
+        i = bisect_left(ids, chat_id)
+        return i < len(ids) and ids[i] == chat_id
+
+    def __contains__(self, chat_id) -> bool:
+        return chat_id in self._pending or self._in_sorted(chat_id)
+
+    def __iter__(self):
+        self._merge()
+        return iter(self._ids)
+
+    def add(self, chat_id: int) -> bool:
+        if chat_id in self:
+            return False
+        self._pending.add(chat_id)
+        if len(self._pending) >= self.merge_at:
+            self._merge()
+        return True
+
+    def discard(self, chat_id: int):
+        if chat_id in self._pending:
+            self._pending.discard(chat_id)
+        elif self._in_sorted(chat_id):
+            ids = array('q', self._ids)
+            del ids[bisect_left(ids, chat_id)]
+            self._replace(ids)
+
+    def difference_update(self, chat_ids):
+        # Удалить много id за одну перестройку массива
+        remove = set(chat_ids)
+        self._pending -= remove
+        if any(self._in_sorted(chat_id) for chat_id in remove):
+            self._replace(array('q', (chat_id for chat_id in self._ids if chat_id not in remove)))
+
+    def update(self, chat_ids):
+        for chat_id in chat_ids:
+            self.add(chat_id)
+
+    def union(self, other: "UserIdSet") -> "UserIdSet":
+        self._merge()
+        other._merge()
+        result = UserIdSet(merge_at=self.merge_at)
+        out = array('q')
+        last = None
+        for chat_id in merge(self._ids, other._ids):
+            if chat_id != last:
+                out.append(chat_id)
+                last = chat_id
+        result._ids = out
+        return result
+
+    def __reduce__(self):
+        # memoryview поверх mmap не сериализуется — pickle получает копию массива
+        return (type(self), (array('q', self), self.merge_at))
+
+    def _merge(self):
+        if not self._pending:
+            return
+        ids = array('q', merge(self._ids, sorted(self._pending)))
+        self._pending.clear()
+        self._replace(ids)
+
+    def _replace(self, ids: array):
+        old, self._ids = self._ids, ids
+        if isinstance(old, memoryview):
+            old.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+    def save(self, path: str):
+        self._merge()
+        ids = self._ids if isinstance(self._ids, array) else array('q', self._ids)
+        if sys.byteorder != "little":
+            ids = array('q', ids)
+            ids.byteswap()
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, len(ids)))
+            ids.tofile(f)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, merge_at=4096) -> "UserIdSet":
+        result = cls(merge_at=merge_at)
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+            magic, version, count = _HEADER.unpack(header)
+            if magic != _MAGIC or version != _VERSION:
+                raise ValueError(f"Unknown user set format in {path}")
+            if count == 0:
+                return result
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(mm) != _HEADER.size + count * 8:
+            mm.close()
+            raise ValueError(f"Truncated user set file {path}")
+        if sys.byteorder == "little":
+            result._ids = memoryview(mm)[_HEADER.size:].cast('q')
+            result._mmap = mm
+        else:
+            ids = array('q', mm[_HEADER.size:])
+            ids.byteswap()
+            mm.close()
+            result._ids = ids
+        return result